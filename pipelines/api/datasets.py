@@ -2,12 +2,14 @@
 from flask import make_response, request
 from flask_smorest import Blueprint
 
+from pipelines.api.utils import cache_run_artifacts
 from pipelines.controllers.datasets import get_dataset_name, get_dataset_pagination
 
 bp = Blueprint("datasets", __name__)
 
 
 @bp.route("", methods=["GET"])
+@cache_run_artifacts
 def handle_list_datasets_by_run_id(project_id,
                                    experiment_id,
                                    run_id,
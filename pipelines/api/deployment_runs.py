@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request
 
-from pipelines.controllers.deployments import get_deployment_by_id, \
-    get_deployment_log, delete_deployment, retry_run_deployment
+from pipelines.controllers.deployments import get_deployment_by_id, get_deployment_log, \
+    delete_deployment, list_deployment_runs, retry_run_deployment, stream_deployment_log
 from pipelines.controllers.deployment_runs import create_deployment_run
+from pipelines.controllers.utils import MAX_RUNS_PAGE_SIZE
 
 bp = Blueprint("deployment_runs", __name__)
 
@@ -11,6 +12,14 @@ bp = Blueprint("deployment_runs", __name__)
 @bp.route('', methods=['GET'])
 def handle_get_deployment(project_id, deployment_id):
     """Handles GET requests to /."""
+    if 'pageSize' in request.args or 'pageToken' in request.args:
+        runs = list_deployment_runs(deployment_id,
+                                    page_size=request.args.get('pageSize', MAX_RUNS_PAGE_SIZE, type=int),
+                                    page_token=request.args.get('pageToken'),
+                                    status=request.args.get('status'),
+                                    created_after=request.args.get('createdAfter'),
+                                    created_before=request.args.get('createdBefore'))
+        return jsonify(runs)
     return jsonify(get_deployment_by_id(deployment_id))
 
 
@@ -34,6 +43,11 @@ def handle_delete_deployment(project_id, deployment_id):
 @bp.route("<run_id>/logs", methods=["GET"])
 def handle_get_deployment_log(project_id, deployment_id, run_id):
     """Handles GET requests to "/<run_id>/logs."""
+    if request.args.get('follow') == 'true':
+        events = stream_deployment_log(deployment_id,
+                                       since_seconds=request.args.get('sinceSeconds', type=int))
+        return Response(events, mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
     log = get_deployment_log(deployment_id)
     return jsonify(log)
 
@@ -1,8 +1,13 @@
 # -*- coding: utf-8 -*-
-from flask import Blueprint, jsonify
+from flask import Blueprint, Response, jsonify, request
 
-from pipelines.controllers.experiment_runs import create_experiment_run, get_experiment_run, \
-    get_experiment_run_history, terminate_experiment_run, retry_experiment_run
+from pipelines.api.utils import serialize
+from pipelines.controllers.experiment_runs import RUN_STATUS_TTL, \
+    encode_run_history, get_experiment_run, get_experiment_run_history, get_run_status, \
+    terminate_experiment_run, stream_operator_log
+from pipelines.controllers.submissions import create_submission, get_submission, retry_now, run_now
+from pipelines.controllers.utils import MAX_RUNS_PAGE_SIZE
+from pipelines.controllers.workflows import stream_run_status
 from pipelines.jupyter import get_operator_logs
 
 bp = Blueprint("experiment_runs", __name__)
@@ -11,16 +16,63 @@ bp = Blueprint("experiment_runs", __name__)
 @bp.route('', methods=['GET'])
 def handle_get_experiment_run_history(project_id, experiment_id):
     """Handles GET requests to /."""
-    return jsonify(get_experiment_run_history(experiment_id))
+    paginated = 'pageSize' in request.args or 'pageToken' in request.args
+    history = get_experiment_run_history(experiment_id,
+                                         page_size=request.args.get('pageSize', MAX_RUNS_PAGE_SIZE, type=int),
+                                         page_token=request.args.get('pageToken'),
+                                         status=request.args.get('status'),
+                                         created_after=request.args.get('createdAfter'),
+                                         created_before=request.args.get('createdBefore'))
+    if request.args.get('encoding') == 'dictionary':
+        response = encode_run_history(history['runs'])
+        response['nextPageToken'] = history['nextPageToken']
+        return serialize(response)
+    if paginated:
+        return serialize(history)
+    # the first page, as a list, for clients that don't paginate
+    return serialize(history['runs'])
 
 
 @bp.route('', methods=['POST'])
 def handle_post_experiment_run(project_id, experiment_id):
     """Handles POST requests to /."""
-    run_id = create_experiment_run(project_id, experiment_id)
+    use_cache = request.args.get('useCache') == 'true'
+    kwargs = request.get_json(force=True, silent=True) or {}
+    if request.args.get('async') == 'true':
+        submission = create_submission(project_id, experiment_id, use_cache,
+                                       volume=kwargs.get('volume'),
+                                       priority=request.args.get('priority', 0, type=int))
+        return jsonify({"message": "Pipeline submitted.", "submissionId": submission["uuid"]}), 202
+    run_id = run_now(project_id, experiment_id, use_cache,
+                     volume=kwargs.get('volume'))
     return jsonify({"message": "Pipeline running.", "runId": run_id})
 
 
+@bp.route("<run_id>/operators/<operator_id>/runs", methods=["POST"])
+def handle_post_experiment_run_from_operator(project_id, experiment_id, run_id, operator_id):
+    """Handles POST requests to /<run_id>/operators/<operator_id>/runs."""
+    use_cache = request.args.get('useCache') == 'true'
+    kwargs = request.get_json(force=True, silent=True) or {}
+    if request.args.get('async') == 'true':
+        submission = create_submission(project_id, experiment_id, use_cache,
+                                       operator_id=operator_id,
+                                       previous_run_id=run_id,
+                                       volume=kwargs.get('volume'),
+                                       priority=request.args.get('priority', 0, type=int))
+        return jsonify({"message": "Pipeline submitted.", "submissionId": submission["uuid"]}), 202
+    new_run_id = run_now(project_id, experiment_id, use_cache,
+                         operator_id=operator_id,
+                         previous_run_id=run_id,
+                         volume=kwargs.get('volume'))
+    return jsonify({"message": "Pipeline running.", "runId": new_run_id})
+
+
+@bp.route("submissions/<submission_id>", methods=["GET"])
+def handle_get_submission(project_id, experiment_id, submission_id):
+    """Handles GET requests to /submissions/<submission_id>."""
+    return jsonify(get_submission(project_id, experiment_id, submission_id))
+
+
 @bp.route("", methods=["DELETE"])
 def handle_delete_experiment_run(project_id, experiment_id):
     """Handles DELETE requests to /."""
@@ -33,14 +85,31 @@ def handle_get_experiment_run(project_id, experiment_id, run_id):
     return jsonify(get_experiment_run(experiment_id))
 
 
+@bp.route('<run_id>/status', methods=['GET'])
+def handle_get_experiment_run_status(project_id, experiment_id, run_id):
+    """Handles GET requests to /<run_id>/status."""
+    if request.args.get('follow') == 'true':
+        events = stream_run_status(experiment_id, run_id)
+        return Response(events, mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response = jsonify(get_run_status(experiment_id, run_id))
+    response.headers['Cache-Control'] = f'private, max-age={int(RUN_STATUS_TTL)}'
+    return response
+
+
 @bp.route("<run_id>/retry", methods=["PUT"])
 def handle_put_experiment_run_retry(project_id, experiment_id, run_id):
     """Handles PUT requests to /<run_id>/retry."""
-    return jsonify(retry_experiment_run(experiment_id))
+    return jsonify(retry_now(project_id, experiment_id))
 
 
 @bp.route("<run_id>/operators/<operator_id>/logs", methods=["GET"])
 def handle_get_experiment_run_notebook_log(project_id, experiment_id, run_id, operator_id):
     """Handles GET requests to /<run_id>/operators/<operator_id>/logs"""
-    logs = get_operator_logs(experiment_id, operator_id)
+    if request.args.get('follow') == 'true':
+        events = stream_operator_log(experiment_id, run_id, operator_id,
+                                     since_seconds=request.args.get('sinceSeconds', type=int))
+        return Response(events, mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    logs = get_operator_logs(experiment_id, operator_id, run_id)
     return jsonify(logs)
@@ -1,15 +1,54 @@
 # -*- coding: utf-8 -*-
-from flask import Blueprint, jsonify
+from flask import Blueprint, Response, jsonify, request
 
-from pipelines.controllers.figures import list_figures
+from pipelines.api.utils import cache_run_artifacts
+from pipelines.controllers.figures import get_figure, list_figures, list_figures_metadata
+from pipelines.object_storage import get_object
 
 bp = Blueprint("figures", __name__)
 
 
 @bp.route("", methods=["GET"])
+@cache_run_artifacts
 def handle_list_figures_by_run_id(project_id, experiment_id, run_id, operator_id):
     """Handles GET requests to /."""
+    if request.args.get("thumbnails") == "true":
+        figures = list_figures_metadata(experiment_id=experiment_id,
+                                        operator_id=operator_id,
+                                        run_id=run_id)
+        for figure in figures:
+            figure["url"] = f"{request.base_url}/{figure['figureId']}"
+            figure["thumbnailUrl"] = f"{figure['url']}/thumbnail" if figure.pop("thumbnail") else figure["url"]
+        return jsonify(figures)
+
     figures = list_figures(experiment_id=experiment_id,
                            operator_id=operator_id,
                            run_id=run_id)
     return jsonify(figures)
+
+
+@bp.route("<figure_id>", methods=["GET"])
+@cache_run_artifacts
+def handle_get_figure(project_id, experiment_id, run_id, operator_id, figure_id):
+    """Handles GET requests to /<figure_id>."""
+    figure = get_figure(experiment_id, operator_id, run_id, figure_id)
+    return send_figure(*figure)
+
+
+@bp.route("<figure_id>/thumbnail", methods=["GET"])
+@cache_run_artifacts
+def handle_get_figure_thumbnail(project_id, experiment_id, run_id, operator_id, figure_id):
+    """Handles GET requests to /<figure_id>/thumbnail."""
+    figure = get_figure(experiment_id, operator_id, run_id, figure_id, thumbnail=True)
+    return send_figure(*figure)
+
+
+def send_figure(object_name, mime_type, etag):
+    """Sends a stored figure. It is not downloaded when the client has it (304)."""
+    etag = etag.strip('"')
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(get_object(object_name), mimetype=mime_type)
+    response.set_etag(etag)
+    return response
@@ -1,12 +1,14 @@
 # -*- coding: utf-8 -*-
 """WSGI server."""
 import argparse
+import gzip
 import sys
+from os import getenv
 
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 from werkzeug.exceptions import BadRequest, NotFound, MethodNotAllowed, \
-    Forbidden, InternalServerError
+    Forbidden, InternalServerError, TooManyRequests
 
 from pipelines.api.datasets import bp as datasets_blueprint
 from pipelines.api.deployment_runs import bp as deployment_runs_blueprint
@@ -14,8 +16,26 @@ from pipelines.api.experiment_runs import bp as experiment_runs_blueprint
 from pipelines.api.figures import bp as figures_blueprint
 from pipelines.api.metrics import bp as metrics_blueprint
 from pipelines.api.project_deployments import bp as project_deployments_blueprint
+from pipelines.api.results import bp as results_blueprint
+from pipelines.api.task_resources import bp as task_resources_blueprint
+from pipelines.cache import get_stats
 from pipelines.controllers.logger import create_seldon_logger
-from pipelines.database import db_session, init_db
+from pipelines.controllers.resource_usage import RESOURCE_RIGHT_SIZING, start_sampler
+from pipelines.database import db_session, engine, init_db
+from pipelines.jupyter import SESSION
+from pipelines.object_storage import reset_client
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, responses are compressed with gzip
+    brotli = None
+
+# smaller responses aren't worth compressing
+COMPRESSION_MIN_SIZE = int(getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(getenv("BROTLI_QUALITY", "5"))
+COMPRESSIBLE_MIMETYPES = ["application/json", "application/msgpack", "application/x-msgpack",
+                          "application/csv", "text/csv", "text/html", "text/plain"]
 
 PROJECT_ID_URL = "/projects/<project_id>"
 EXPERIMENT_ID_URL = f"{PROJECT_ID_URL}/experiments/<experiment_id>"
@@ -34,6 +54,10 @@ app.register_blueprint(figures_blueprint,
                        url_prefix=f"{EXPERIMENT_ID_URL}/runs/<run_id>/operators/<operator_id>/figures")
 app.register_blueprint(metrics_blueprint,
                        url_prefix=f"{EXPERIMENT_ID_URL}/runs/<run_id>/operators/<operator_id>/metrics")
+app.register_blueprint(results_blueprint,
+                       url_prefix=f"{EXPERIMENT_ID_URL}/results")
+app.register_blueprint(task_resources_blueprint,
+                       url_prefix="/tasks/<task_id>/resources")
 
 
 @app.teardown_appcontext
@@ -41,12 +65,50 @@ def shutdown_session(exception=None):
     db_session.remove()
 
 
+@app.after_request
+def compress_response(response):
+    """Compresses responses with brotli or gzip, as the client accepts (Accept-Encoding).
+
+    Streams (eg. logs), files sent as they are read and images are not compressed.
+    The ETag of a compressed response is made weak, as the bytes differ from
+    the other encodings of the same content.
+    """
+    if response.direct_passthrough or response.is_streamed or response.status_code != 200 \
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES or "Content-Encoding" in response.headers:
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESSION_MIN_SIZE:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    if brotli and request.accept_encodings["br"]:
+        response.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+        response.headers["Content-Encoding"] = "br"
+    elif request.accept_encodings["gzip"]:
+        response.set_data(gzip.compress(data, compresslevel=GZIP_LEVEL))
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        return response
+
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
 @app.route('/', methods=['GET'])
 def index():
     """Handles GET requests to /."""
     return jsonify(message='PlatIAgro Pipelines v0.2.0')
 
 
+@app.route('/cache', methods=['GET'])
+def handle_get_cache_stats():
+    """Handles GET requests to /cache."""
+    return jsonify(get_stats())
+
+
 @app.route('/seldon/logger/<training_id>', methods=['POST'])
 def handle_create_seldon_logger(training_id):
     kwargs = request.get_data(parse_form_data=True)
@@ -57,12 +119,53 @@ def handle_create_seldon_logger(training_id):
 @app.errorhandler(NotFound)
 @app.errorhandler(MethodNotAllowed)
 @app.errorhandler(Forbidden)
+@app.errorhandler(TooManyRequests)
 @app.errorhandler(InternalServerError)
 def handle_errors(err):
     """Handles exceptions raised by the API."""
     return jsonify({"message": err.description}), err.code
 
 
+def post_fork(server, worker):
+    """Drops the connections a gunicorn worker inherits from the master process."""
+    engine.dispose()
+    reset_client()
+    SESSION.close()
+
+
+def when_ready(server):
+    """Starts the background threads that must run once, in the gunicorn master process."""
+    if RESOURCE_RIGHT_SIZING:
+        start_sampler()
+
+
+def run_gunicorn(args):
+    """Serves the API with gunicorn."""
+    from gunicorn.app.base import BaseApplication
+
+    class Application(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": f"0.0.0.0:{args.port}",
+                "workers": args.workers,
+                "threads": args.threads,
+                "worker_class": args.worker_class,
+                "keepalive": args.keep_alive,
+                "timeout": args.timeout,
+                "graceful_timeout": args.graceful_timeout,
+                "preload_app": True,
+                "post_fork": post_fork,
+                "when_ready": when_ready,
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    Application().run()
+
+
 def parse_args(args):
     """Takes argv and parses API options."""
     parser = argparse.ArgumentParser(
@@ -78,6 +181,30 @@ def parse_args(args):
     parser.add_argument(
         "--init-db", action="count", help="Create database and tables before the HTTP server starts"
     )
+    parser.add_argument(
+        "--server", choices=["flask", "gunicorn"], default="flask",
+        help="HTTP server. Use gunicorn in production (default: flask)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="Number of gunicorn worker processes (default: 4)"
+    )
+    parser.add_argument(
+        "--threads", type=int, default=4, help="Number of threads per gthread worker (default: 4)"
+    )
+    parser.add_argument(
+        "--worker-class", choices=["sync", "gthread", "gevent"], default="gthread",
+        help="Type of gunicorn workers. gevent requires the gevent package (default: gthread)"
+    )
+    parser.add_argument(
+        "--keep-alive", type=int, default=5, help="Seconds to wait for requests on a keep-alive connection (default: 5)"
+    )
+    parser.add_argument(
+        "--timeout", type=int, default=120, help="Seconds before a silent worker is restarted (default: 120)"
+    )
+    parser.add_argument(
+        "--graceful-timeout", type=int, default=30,
+        help="Seconds for workers to finish their requests on shutdown (default: 30)"
+    )
 
     return parser.parse_args(args)
 
@@ -93,4 +220,9 @@ if __name__ == "__main__":
     if args.init_db:
         init_db()
 
-    app.run(host="0.0.0.0", port=args.port, debug=args.debug)
+    if args.server == "gunicorn":
+        run_gunicorn(args)
+    else:
+        if RESOURCE_RIGHT_SIZING:
+            start_sampler()
+        app.run(host="0.0.0.0", port=args.port, debug=args.debug)
@@ -1,12 +1,14 @@
 # -*- coding: utf-8 -*-
 from flask import Blueprint, jsonify
 
+from pipelines.api.utils import cache_run_artifacts
 from pipelines.controllers.metrics import list_metrics
 
 bp = Blueprint("metrics", __name__)
 
 
 @bp.route("", methods=["GET"])
+@cache_run_artifacts
 def handle_list_metrics_by_run_id(project_id, experiment_id, run_id, operator_id):
     """Handles GET requests to /."""
     metrics = list_metrics(experiment_id=experiment_id,
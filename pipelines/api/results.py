@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+from flask import Blueprint, jsonify, request
+
+from pipelines.controllers.results import list_results
+
+bp = Blueprint("results", __name__)
+
+
+@bp.route("", methods=["POST"])
+def handle_list_results(project_id, experiment_id):
+    """Handles POST requests to /."""
+    kwargs = request.get_json(force=True)
+    results = list_results(experiment_id=experiment_id,
+                           operators=kwargs.get("operators"),
+                           kinds=kwargs.get("kinds"))
+    return jsonify(results)
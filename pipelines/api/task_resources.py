@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from flask import Blueprint, jsonify, request
+
+from pipelines.controllers.task_resources import delete_task_resources_profile, \
+    get_task_resources_profile, update_task_resources_profile
+
+bp = Blueprint("task_resources", __name__)
+
+
+@bp.route("", methods=["GET"])
+def handle_get_task_resources(task_id):
+    """Handles GET requests to /."""
+    return jsonify(get_task_resources_profile(task_id))
+
+
+@bp.route("", methods=["PUT"])
+def handle_put_task_resources(task_id):
+    """Handles PUT requests to /."""
+    resources = request.get_json(force=True)
+    return jsonify(update_task_resources_profile(task_id, resources))
+
+
+@bp.route("", methods=["DELETE"])
+def handle_delete_task_resources(task_id):
+    """Handles DELETE requests to /."""
+    return jsonify(delete_task_resources_profile(task_id))
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import hashlib
+from datetime import date, datetime
+from functools import wraps
+from os import getenv
+
+import msgpack
+from flask import Response, jsonify, make_response, request
+from werkzeug.http import http_date
+
+from pipelines.controllers.utils import is_run_immutable
+
+# the outputs of immutable runs don't change, browsers may keep them for a year
+RUN_ARTIFACTS_MAX_AGE = int(getenv("RUN_ARTIFACTS_MAX_AGE", "31536000"))
+
+MSGPACK_MIMETYPES = ["application/msgpack", "application/x-msgpack"]
+
+
+def serialize(data):
+    """Serializes a response as JSON, or as MessagePack if the client prefers it (Accept header).
+
+    Args:
+        data: the response body.
+
+    Returns:
+        flask.Response
+    """
+    mimetype = request.accept_mimetypes.best_match(["application/json"] + MSGPACK_MIMETYPES,
+                                                   default="application/json")
+    if mimetype in MSGPACK_MIMETYPES:
+        response = Response(msgpack.packb(data, default=encode_msgpack, use_bin_type=True),
+                            mimetype=mimetype)
+    else:
+        response = jsonify(data)
+    response.vary.add("Accept")
+    return response
+
+
+def encode_msgpack(obj):
+    """Encodes the types MessagePack does not support, as jsonify does."""
+    if isinstance(obj, datetime):
+        return http_date(obj.utctimetuple())
+    if isinstance(obj, date):
+        return http_date(obj.timetuple())
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+def run_artifact_etag(run_id):
+    """ETag of a response about the outputs of an immutable run.
+
+    Depends only on the run id, the URL (path and query string) and the
+    requested media type, so it is known before reading the outputs.
+
+    Args:
+        run_id (str): the run id.
+
+    Returns:
+        str
+    """
+    key = f"{run_id}:{request.full_path}:{request.headers.get('Accept', '')}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def cache_run_artifacts(view):
+    """Adds HTTP caching to views of the outputs (metrics, figures, datasets) of a run.
+
+    Responses of immutable runs (succeeded or skipped) get an ETag computed
+    from the run id and a long-lived Cache-Control. A matching If-None-Match
+    is answered with 304 Not Modified before the view reads anything from
+    the object storage.
+
+    Responses of other runs (or "latest") must be revalidated, as running
+    runs write new outputs and failed runs may be retried. Their ETag
+    is the one set by the view (eg. the object storage ETag), or a hash of
+    the response body.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        run_id = kwargs["run_id"]
+        if is_run_immutable(run_id):
+            etag = run_artifact_etag(run_id)
+            # compressed responses carry the weak form of the ETag
+            if request.if_none_match.contains_weak(etag):
+                response = make_response("", 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = f"public, max-age={RUN_ARTIFACTS_MAX_AGE}, immutable"
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and response.get_etag() == (None, None):
+                response.add_etag()
+            response.headers["Cache-Control"] = "no-cache"
+            response.make_conditional(request)
+
+        response.vary.add("Accept")
+        return response
+    return wrapper
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""Cache of the responses about runs that don't change anymore."""
+import json
+import logging
+import sqlite3
+import time
+from collections import Counter, OrderedDict
+from os import getenv, getpid
+from threading import Lock, local
+
+# bytes of serialized responses kept by each process
+RESPONSE_CACHE_MAX_BYTES = int(getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# SQLite file shared by the processes of a host (eg. gunicorn workers). Empty disables it
+RESPONSE_CACHE_DATABASE = getenv("RESPONSE_CACHE_DATABASE", "")
+RESPONSE_CACHE_DATABASE_MAX_ENTRIES = int(getenv("RESPONSE_CACHE_DATABASE_MAX_ENTRIES", "10000"))
+
+MEMORY_CACHE = OrderedDict()
+MEMORY_CACHE_LOCK = Lock()
+MEMORY_CACHE_BYTES = 0
+
+STATS = Counter()
+STATS_LOCK = Lock()
+
+CONNECTIONS = local()
+
+
+def cached(run_id, key, func):
+    """Returns the cached response, or calls func and caches its result.
+
+    Must only be used for runs whose outputs don't change anymore. Values are
+    stored as JSON, so each hit returns a new copy that callers may change.
+
+    Args:
+        run_id (str): the run id.
+        key (str): what is cached about the run (eg. "metrics:<operator_id>").
+        func (callable): computes the response. Must return a JSON serializable value.
+
+    Returns:
+        The response.
+    """
+    cache_key = f"{run_id}:{key}"
+
+    value = get_from_memory(cache_key)
+    if value is not None:
+        count("hits")
+        return json.loads(value)
+
+    value = get_from_database(cache_key)
+    if value is not None:
+        count("databaseHits")
+        put_in_memory(cache_key, value)
+        return json.loads(value)
+
+    count("misses")
+    response = func()
+    value = json.dumps(response)
+    put_in_memory(cache_key, value)
+    put_in_database(cache_key, value)
+    return response
+
+
+def get_stats():
+    """Hit and miss counters of this process.
+
+    Returns:
+        dict
+    """
+    with STATS_LOCK:
+        stats = {"hits": STATS["hits"], "databaseHits": STATS["databaseHits"], "misses": STATS["misses"]}
+    with MEMORY_CACHE_LOCK:
+        stats["entries"] = len(MEMORY_CACHE)
+        stats["bytes"] = MEMORY_CACHE_BYTES
+    return stats
+
+
+def count(name):
+    with STATS_LOCK:
+        STATS[name] += 1
+
+
+def get_from_memory(cache_key):
+    with MEMORY_CACHE_LOCK:
+        value = MEMORY_CACHE.get(cache_key)
+        if value is not None:
+            MEMORY_CACHE.move_to_end(cache_key)
+        return value
+
+
+def put_in_memory(cache_key, value):
+    """Stores a value and evicts the least recently used ones over RESPONSE_CACHE_MAX_BYTES."""
+    global MEMORY_CACHE_BYTES
+    if len(value) > RESPONSE_CACHE_MAX_BYTES:
+        return
+
+    with MEMORY_CACHE_LOCK:
+        previous = MEMORY_CACHE.pop(cache_key, None)
+        if previous is not None:
+            MEMORY_CACHE_BYTES -= len(previous)
+        MEMORY_CACHE[cache_key] = value
+        MEMORY_CACHE_BYTES += len(value)
+        while MEMORY_CACHE_BYTES > RESPONSE_CACHE_MAX_BYTES:
+            _, evicted = MEMORY_CACHE.popitem(last=False)
+            MEMORY_CACHE_BYTES -= len(evicted)
+
+
+def get_connection():
+    """Connection to the shared SQLite cache, one per thread and process.
+
+    Returns:
+        sqlite3.Connection: or None if the shared cache is disabled.
+    """
+    if not RESPONSE_CACHE_DATABASE:
+        return None
+
+    # connections can't be used by forked processes
+    if getattr(CONNECTIONS, "pid", None) != getpid():
+        connection = sqlite3.connect(RESPONSE_CACHE_DATABASE, timeout=5)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS responses ("
+                           "key TEXT PRIMARY KEY, value TEXT, created_at REAL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS ix_responses_created_at ON responses (created_at)")
+        connection.commit()
+        CONNECTIONS.connection = connection
+        CONNECTIONS.pid = getpid()
+    return CONNECTIONS.connection
+
+
+def get_from_database(cache_key):
+    try:
+        connection = get_connection()
+        if connection is None:
+            return None
+        row = connection.execute("SELECT value FROM responses WHERE key = ?", (cache_key,)).fetchone()
+    except sqlite3.Error as e:
+        logging.warning("Failed to read the response cache database: %s", e)
+        return None
+    return row[0] if row else None
+
+
+def put_in_database(cache_key, value):
+    """Stores a value and removes the oldest ones over RESPONSE_CACHE_DATABASE_MAX_ENTRIES."""
+    try:
+        connection = get_connection()
+        if connection is None:
+            return
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                               (cache_key, value, time.time()))
+            connection.execute("DELETE FROM responses WHERE key IN ("
+                               "SELECT key FROM responses ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                               (RESPONSE_CACHE_DATABASE_MAX_ENTRIES,))
+    except sqlite3.Error as e:
+        logging.warning("Failed to write the response cache database: %s", e)
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""Concurrent calls to KFP, Kubernetes and MinIO."""
+from concurrent.futures import ThreadPoolExecutor
+from os import getenv
+
+IO_WORKERS = int(getenv("IO_WORKERS", "32"))
+
+EXECUTOR = ThreadPoolExecutor(IO_WORKERS)
+
+
+def map_concurrently(func, iterable):
+    """Calls func on every item, in parallel, in the shared I/O thread pool.
+
+    Blocking calls to external services release the GIL, so many of them may be
+    in flight at once. Threads are started on demand, which makes the pool safe
+    to create before gunicorn forks the workers.
+
+    Args:
+        func (callable): function with a single argument.
+        iterable (iterable): the arguments.
+
+    Returns:
+        list: the results, in the order of the arguments.
+
+    Raises:
+        Exception: the exception raised by the call on the earliest failing argument, if any.
+    """
+    futures = [EXECUTOR.submit(func, item) for item in iterable]
+    return [future.result() for future in futures]
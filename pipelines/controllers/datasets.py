@@ -7,6 +7,7 @@ from werkzeug.exceptions import NotFound
 from pipelines.database import db_session
 from pipelines.models import Operator
 from pipelines.models.utils import raise_if_experiment_does_not_exist
+from pipelines.object_storage import list_objects
 
 
 def get_dataset_name(experiment_id, operator_id,):
@@ -40,6 +41,17 @@ def get_dataset_name(experiment_id, operator_id,):
     return dataset
 
 
+def get_dataset_size(name):
+    """Get the size of a dataset in the object storage.
+    Args:
+        name (str): the dataset name.
+    Returns:
+        int: the size in bytes of the dataset files (outputs of runs are not included).
+    """
+    objects = list_objects(f"datasets/{name}/", recursive=False)
+    return sum(obj.size or 0 for obj in objects if not obj.is_dir)
+
+
 def get_dataset_pagination(application_csv,
                            name,
                            operator_id,
@@ -1,27 +1,42 @@
 # -*- coding: utf-8 -*-
-import io
 import json
 import os
+import queue
 import re
+import threading
 
 from kfp import dsl
 from kubernetes.client.rest import ApiException
 from kubernetes import client
 from werkzeug.exceptions import BadRequest, NotFound
 
+from pipelines.concurrency import map_concurrently
 from pipelines.controllers.pipeline import Pipeline
-from pipelines.controllers.utils import load_kube_config, init_pipeline_client, \
-    format_deployment_pipeline, get_cluster_ip, get_protocol, remove_non_deployable_operators
+from pipelines.controllers.utils import DEPLOYMENT_RUN, MAX_RUNS_PAGE_SIZE, build_runs_filter, \
+    load_kube_config, init_pipeline_client, format_deployment_pipeline, get_cluster_ip, get_protocol, \
+    is_run_of_kind, list_runs_page, remove_non_deployable_operators
+from pipelines.database import db_session
 from pipelines.models import Operator, Task
 
 
 KF_PIPELINES_NAMESPACE = os.getenv('KF_PIPELINES_NAMESPACE', 'deployments')
+LOG_STREAM_KEEPALIVE = int(os.getenv('LOG_STREAM_KEEPALIVE', '15'))
+
+LOG_TIMESTAMP = r'(?:\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}.\d+Z|\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d+)'
+# leading timestamps, then the first log level (with the text before it) and the message
+LOG_LINE_REGEX = re.compile(
+    rf'(?P<timestamp>{LOG_TIMESTAMP}(?: {LOG_TIMESTAMP})*)?'
+    r'(?:(?P<prefix>.*?)(?<![\w\d])(?P<level>INFO|WARN|ERROR)(?![\w\d]))?'
+    r'(?P<message>.*)'
+)
+LOG_SEPARATOR_REGEX = re.compile(r' [-:*]')
+LOG_WORD_REGEX = re.compile(r'[a-zA-Z0-9\"\'.\-@_!#$%^&*()<>?\/|}{~:]+')
 
 
 def get_deployment_details(runs, ip, protocol):
     """Get deployments run list.
     Args:
-        Runs list.
+        Runs list, of deployment runs only.
 
     Returns:
         Deployment runs details.
@@ -29,68 +44,70 @@ def get_deployment_details(runs, ip, protocol):
     deployment_runs = []
 
     for run in runs:
-        manifest = run.pipeline_spec.workflow_manifest
-        if 'SeldonDeployment' in manifest:
-            deployment_details = format_deployment_pipeline(run)
-            if deployment_details:
-                experiment_id = deployment_details['experimentId']
+        deployment_details = format_deployment_pipeline(run)
+        if deployment_details:
+            experiment_id = deployment_details['experimentId']
 
-                created_at = deployment_details['createdAt']
-                deployment_details['createdAt'] = str(created_at.isoformat(
-                    timespec='milliseconds')).replace('+00:00', 'Z')
+            created_at = deployment_details['createdAt']
+            deployment_details['createdAt'] = str(created_at.isoformat(
+                timespec='milliseconds')).replace('+00:00', 'Z')
 
-                deployment_details['url'] = f'{protocol}://{ip}/seldon/deployments/{experiment_id}/api/v1.0/predictions'
+            deployment_details['url'] = f'{protocol}://{ip}/seldon/deployments/{experiment_id}/api/v1.0/predictions'
 
-                deployment_runs.append(deployment_details)
+            deployment_runs.append(deployment_details)
 
     return deployment_runs
 
 
-def get_deployments():
-    """Get deployments list.
+def list_deployment_runs(deployment_id, page_size=MAX_RUNS_PAGE_SIZE, page_token=None,
+                         status=None, created_after=None, created_before=None):
+    """Lists a page of the runs of a deployment, newest first.
+    Args:
+        deployment_id (str): deployment uuid.
+        page_size (int): max number of runs. (optional)
+        page_token (str): the nextPageToken of the previous page. (optional)
+        status (str): only runs with this status, eg. Succeeded. (optional)
+        created_after (str): only runs created at or after this date. (optional)
+        created_before (str): only runs created before this date. (optional)
 
     Returns:
-        Deployments list.
+        A dict with the runs and the nextPageToken (None on the last page).
     """
-    kfp_client = init_pipeline_client()
-    token = ''
+    runs_filter = build_runs_filter(created_after, created_before,
+                                    kind=DEPLOYMENT_RUN, experiment_id=deployment_id)
 
-    deployment_runs = []
+    def accept(run):
+        if status and (run.status or 'Running') != status:
+            return False
+        return is_run_of_kind(run, DEPLOYMENT_RUN)
 
-    protocol = get_protocol()
-    ip = get_cluster_ip()
-
-    while True:
-        list_runs = kfp_client.list_runs(
-            page_token=token, sort_by='created_at desc', page_size=100)
-
-        if list_runs.runs:
-            runs = get_deployment_details(list_runs.runs, ip, protocol)
-            deployment_runs.extend(runs)
-
-            token = list_runs.next_page_token
-            if token is None:
-                break
-        else:
-            break
+    kfp_client = init_pipeline_client()
+    try:
+        experiment = kfp_client.get_experiment(experiment_name=deployment_id)
+    except ValueError:
+        raise NotFound("Deployment not found.")
 
-    return deployment_runs
+    runs, next_page_token = list_runs_page(kfp_client, experiment.id, accept,
+                                           page_size, page_token, runs_filter)
+    return {
+        'runs': get_deployment_details(runs, get_cluster_ip(), get_protocol()),
+        'nextPageToken': next_page_token,
+    }
 
 
 def get_deployment_by_id(deployment_id):
-    """Get deployment run by seldon deployment uuid.
+    """Get the latest deployment run by seldon deployment uuid.
     Args:
         deployment_id (str): deployment uuid.
 
     Returns:
         Deployment run.
     """
-    try:
-        deployment = list(filter(lambda d: d['experimentId'] == deployment_id, get_deployments()))[0]
-    except IndexError:
+    runs = list_deployment_runs(deployment_id, page_size=1)['runs']
+    if not runs:
         raise NotFound("Deployment not found.")
 
-    return deployment
+    return runs[0]
 
 
 def delete_deployment(deployment_id):
@@ -146,107 +163,219 @@ def delete_deployment_resource(deployment_resource):
     )
 
 
-def get_deployment_log(deploy_name):
-    """Get logs from deployment.
+def parse_deployment_log(pod_log):
+    """Parses the lines of a container log, in a single pass.
     Args:
-        deploy_name (str): Deployment name.
+        pod_log (str): the container log.
+
+    Returns:
+        A list of dicts with timestamp, level and message.
     """
-    timestamp_with_tz = r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}.\d+Z'
-    timestamp_without_tz = r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d+'
-    timestamp_regex = timestamp_with_tz + '|' + timestamp_without_tz
+    logs = []
+    for line in pod_log.splitlines():
+        match = LOG_LINE_REGEX.match(line)
+        message = LOG_SEPARATOR_REGEX.sub('', (match.group('prefix') or '') + match.group('message'))
+        logs.append({
+            'timestamp': match.group('timestamp') or '',
+            'level': match.group('level') or '',
+            'message': ' '.join(LOG_WORD_REGEX.findall(message)),
+        })
+    return logs
+
+
+def get_task_names(operator_ids):
+    """Get the task name of each operator, in a single query.
+    Args:
+        operator_ids (iterable): operator uuids.
 
-    log_level = ['INFO', 'WARN', 'ERROR']
-    log_level_regex = r'(?<![\w\d]){}(?![\w\d])'
-    full_log_level_regex = ''
-    for level in log_level:
-        if full_log_level_regex:
-            full_log_level_regex += '|' + log_level_regex.format(level)
-        else:
-            full_log_level_regex = log_level_regex.format(level)
+    Returns:
+        A dict with task names by operator uuid.
+    """
+    operator_ids = set(operator_ids)
+    if not operator_ids:
+        return {}
+
+    rows = db_session.query(Operator.uuid, Task.name) \
+        .join(Task, Task.uuid == Operator.task_id) \
+        .filter(Operator.uuid.in_(operator_ids)) \
+        .all()
+    return dict(rows)
 
-    log_message_regex = r'[a-zA-Z0-9\"\'.\-@_!#$%^&*()<>?\/|}{~:]{1,}'
 
+def list_deployment_containers(deploy_name):
+    """Lists the containers of a deployment that run operators.
+    Args:
+        deploy_name (str): Deployment name.
+
+    Returns:
+        A list of (pod name, container name) tuples.
+    """
     load_kube_config()
     custom_api = client.CustomObjectsApi()
     core_api = client.CoreV1Api()
-    try:
-        api_response = custom_api.get_namespaced_custom_object(
-            'machinelearning.seldon.io',
-            'v1',
+    api_response = custom_api.get_namespaced_custom_object(
+        'machinelearning.seldon.io',
+        'v1',
+        KF_PIPELINES_NAMESPACE,
+        'seldondeployments',
+        deploy_name,
+    )
+
+    # the pod list already has the containers spec
+    containers = []
+    for deployment_name in api_response['status']['deploymentStatus'].keys():
+        pods = core_api.list_namespaced_pod(
             KF_PIPELINES_NAMESPACE,
-            'seldondeployments',
-            deploy_name,
+            label_selector=f'app={deployment_name}'
         )
+        for pod in pods.items:
+            for container in pod.spec.containers:
+                if container.name != 'istio-proxy' and container.name != 'seldon-container-engine':
+                    containers.append((pod.metadata.name, container.name))
+    return containers
 
-        response = []
-        for deployment_name in api_response['status']['deploymentStatus'].keys():
-            api_response = core_api.list_namespaced_pod(
+
+def get_deployment_log(deploy_name):
+    """Get logs from deployment.
+    Args:
+        deploy_name (str): Deployment name.
+    """
+    try:
+        containers = list_deployment_containers(deploy_name)
+        core_api = client.CoreV1Api()
+
+        def read_log(container):
+            pod_name, name = container
+            return core_api.read_namespaced_pod_log(
+                pod_name,
                 KF_PIPELINES_NAMESPACE,
-                label_selector=f'app={deployment_name}'
-            )
-            for i in api_response.items:
-                pod_name = i.metadata.name
-                api_response = core_api.read_namespaced_pod(
-                    pod_name,
-                    KF_PIPELINES_NAMESPACE,
-                )
-                for container in api_response.spec.containers:
-                    name = container.name
-                    if name != 'istio-proxy' and name != 'seldon-container-engine':
-                        pod_log = core_api.read_namespaced_pod_log(
-                            pod_name,
-                            KF_PIPELINES_NAMESPACE,
-                            container=name,
-                            pretty='true',
-                            tail_lines=512,
-                            timestamps=True)
-
-                        logs = []
-                        buf = io.StringIO(pod_log)
-                        line = buf.readline()
-                        while line:
-                            line = line.replace('\n', '')
-
-                            timestamp = re.findall(timestamp_regex, line)
-                            timestamp = ' '.join([str(x) for x in timestamp])
-                            line = line.replace(timestamp, '')
-
-                            level = re.findall(full_log_level_regex, line)
-                            level = ' '.join([str(x) for x in level])
-                            line = line.replace(level, '')
-
-                            line = re.sub(r'( [-:*]{1})', '', line)
-                            message = re.findall(log_message_regex, line)
-                            message = ' '.join([str(x) for x in message])
-
-                            log = {}
-                            log['timestamp'] = timestamp
-                            log['level'] = level
-                            log['message'] = message
-                            logs.append(log)
-                            line = buf.readline()
-
-                        # get task name
-                        operator = Operator.query.get(name)
-                        if operator:
-                            task = Task.query.get(operator.task_id)
-                            if task:
-                                name = task.name
-
-                        resp = {}
-                        resp['containerName'] = name
-                        resp['logs'] = logs
-                        response.append(resp)
+                container=name,
+                pretty='true',
+                tail_lines=512,
+                timestamps=True)
+
+        pod_logs = map_concurrently(read_log, containers)
+        task_names = get_task_names(name for _, name in containers)
+
+        response = []
+        for (_, name), pod_log in zip(containers, pod_logs):
+            resp = {}
+            resp['containerName'] = task_names.get(name, name)
+            resp['logs'] = parse_deployment_log(pod_log)
+            response.append(resp)
         return response
     except ApiException as e:
-        body = json.loads(e.body)
-        error_message = body['message']
-        if 'not found' in error_message:
-            raise NotFound('The specified deployment does not exist')
-        raise BadRequest('{}'.format(error_message))
+        raise_deployment_api_exception(e)
+
+
+def stream_deployment_log(deploy_name, since_seconds=None):
+    """Follows the logs of a deployment.
+    Args:
+        deploy_name (str): Deployment name.
+        since_seconds (int): only lines newer than this. Resumes a stream. (optional)
+
+    Returns:
+        A generator of Server-Sent Events.
+    """
+    try:
+        containers = list_deployment_containers(deploy_name)
+        task_names = get_task_names(name for _, name in containers)
+        return stream_pod_logs([(pod_name, name, task_names.get(name, name)) for pod_name, name in containers],
+                               since_seconds)
+    except ApiException as e:
+        raise_deployment_api_exception(e)
+
+
+def stream_pod_logs(containers, since_seconds=None):
+    """Follows the logs of containers and sends the parsed lines as they arrive.
+
+    A thread reads each container log stream. The streams are closed when the
+    client disconnects.
+
+    Args:
+        containers (list): (pod name, container name, display name) tuples.
+        since_seconds (int): only lines newer than this. (optional)
+
+    Returns:
+        A generator of Server-Sent Events: "log" with the parsed line and its
+        containerName, then "end" when all containers terminated.
+    """
+    load_kube_config()
+    core_api = client.CoreV1Api()
+    kwargs = {} if since_seconds is None else {'since_seconds': since_seconds}
+
+    # opens the streams before the response starts, so that errors are reported
+    streams = []
+    try:
+        for pod_name, name, display_name in containers:
+            stream = core_api.read_namespaced_pod_log(
+                pod_name,
+                KF_PIPELINES_NAMESPACE,
+                container=name,
+                follow=True,
+                timestamps=True,
+                _preload_content=False,
+                **kwargs)
+            streams.append((stream, display_name))
+    except Exception:
+        for stream, _ in streams:
+            stream.close()
+        raise
+
+    lines = queue.Queue()
+
+    def follow(stream, display_name):
+        try:
+            for line in stream:
+                lines.put((display_name, line.decode('utf-8', errors='replace')))
+        except Exception:
+            # the stream was closed
+            pass
+        finally:
+            lines.put(None)
+
+    for stream, display_name in streams:
+        threading.Thread(target=follow, args=(stream, display_name), daemon=True).start()
+
+    def generate():
+        running = len(streams)
+        try:
+            while running:
+                try:
+                    item = lines.get(timeout=LOG_STREAM_KEEPALIVE)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+
+                if item is None:
+                    running -= 1
+                    continue
+
+                display_name, line = item
+                for log in parse_deployment_log(line):
+                    log['containerName'] = display_name
+                    yield f'event: log\ndata: {json.dumps(log)}\n\n'
+            yield 'event: end\ndata: {}\n\n'
+        finally:
+            for stream, _ in streams:
+                stream.close()
+
+    return generate()
+
+
+def raise_deployment_api_exception(e):
+    """Raises the API error of a Kubernetes exception.
+    Args:
+        e (ApiException): the exception.
+    """
+    body = json.loads(e.body)
+    error_message = body['message']
+    if 'not found' in error_message:
+        raise NotFound('The specified deployment does not exist')
+    raise BadRequest('{}'.format(error_message))
 
 
 def retry_run_deployment(deployment_id):
-    experiment = list(filter(lambda d: d['experimentId'] == deployment_id, get_deployments()))[0]
+    experiment = get_deployment_by_id(deployment_id)
     experiment = init_pipeline_client().runs.retry_run(run_id=experiment['runId'])
     return experiment
@@ -1,16 +1,39 @@
 # -*- coding: utf-8 -*-
 import json
-from werkzeug.exceptions import BadRequest, NotFound
-
-from pipelines.controllers.pipeline import Pipeline
-from pipelines.controllers.utils import init_pipeline_client, format_pipeline_run_details, \
-    get_operator_parameters, get_operator_task_id
+import logging
+import time
+from os import getenv
+from threading import Lock
+
+from kubernetes.client.rest import ApiException
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.exceptions import BadRequest, HTTPException, NotFound
+
+from pipelines.cache import cached
+from pipelines.concurrency import map_concurrently
+from pipelines.controllers.datasets import get_dataset_size
+from pipelines.controllers.deployments import stream_pod_logs
+from pipelines.controllers.operator_cache import find_cached_runs, find_upstream_runs, \
+    save_cache_keys
+from pipelines.controllers.pipeline import Pipeline, get_volume_size
+from pipelines.controllers.resource_usage import get_task_resources
+from pipelines.controllers.utils import MAX_RUNS_PAGE_SIZE, RUN_IMMUTABLE_STATUSES, TRAINING_RUN, \
+    build_runs_filter, init_pipeline_client, format_pipeline_run_details, get_operator_parameters, \
+    get_operator_task_id, get_operators_status, is_run_of_kind, list_runs_page
+from pipelines.database import db_session
 from pipelines.jupyter import read_parameters
 from pipelines.models import Experiment, Task
 from pipelines.models.utils import raise_if_project_does_not_exist
 
 created_at_desc = 'created_at desc'
 
+# pollers of a run within this time share a single request to KFP
+RUN_STATUS_TTL = float(getenv('RUN_STATUS_TTL', '2'))
+RUN_STATUS_CACHE = {}
+# (lock, number of requests using it) by run, while requests use it
+RUN_STATUS_LOCKS = {}
+RUN_STATUS_LOCK = Lock()
+
 
 def get_task_parameter(task_parameters, name):
     """Get task parameter.
@@ -62,11 +85,18 @@ def format_run_parameters(operator, task, dataset_name):
     return run_paramenters
 
 
-def create_experiment_run(project_id, experiment_id):
+def create_experiment_run(project_id, experiment_id, use_cache=False,
+                          operator_id=None, previous_run_id=None, volume=None):
     """Compile and run a experiment pipeline.
     Args:
         project_id (str): project id.
         experiment_id (str): experiment id.
+        use_cache (bool): reuse the outputs of operators that did not change since a previous run.
+        operator_id (str): run only this operator and its descendants. (optional)
+        previous_run_id (str): the run whose outputs are reused by the operators
+            that are not run. Defaults to the latest run. (optional)
+        volume (dict): size, storageClass and accessMode of the training volume.
+            The size defaults to one that fits the dataset. (optional)
     Returns:
         Pipeline run id.
     """
@@ -99,14 +129,40 @@ def create_experiment_run(project_id, experiment_id):
                 "notebookPath": task.experiment_notebook_path,
                 "operatorId": operator.uuid,
                 "parameters": run_operator_paramenters,
+                "resources": get_task_resources(task),
             }
             run_operators.append(run_operator)
     else:
         raise BadRequest('Necessary at least one operator')
 
+    volume = dict(volume or {})
+    if dataset_name and 'size' not in volume:
+        volume['size'] = get_volume_size(get_dataset_size(dataset_name))
+
     pipeline = Pipeline(experiment_id, None, run_operators)
-    pipeline.compile_training_pipeline()
-    return pipeline.run_pipeline()
+
+    # cache keys are only computed and stored by runs that use the cache
+    cache_keys = pipeline.get_cache_keys() if use_cache else {}
+    cached_runs = find_cached_runs(experiment_id, cache_keys) if use_cache else {}
+
+    if operator_id:
+        if previous_run_id is None or previous_run_id == 'latest':
+            latest_run = get_experiment_run(experiment_id, pretty=False)
+            if not latest_run:
+                raise NotFound('There is no previous run to run from')
+            previous_run_id = latest_run.run.id
+        cached_runs.update(find_upstream_runs(pipeline, operator_id, previous_run_id))
+
+    pipeline.compile_training_pipeline(cached_runs, volume)
+    run_id = pipeline.run_pipeline()
+    if cache_keys:
+        # the run exists already: without its cache keys it is just not reused later
+        try:
+            save_cache_keys(experiment_id, run_id, cache_keys)
+        except SQLAlchemyError:
+            db_session.rollback()
+            logging.exception("Failed to save the cache keys of run %s", run_id)
+    return run_id
 
 
 def get_experiment_run(experiment_id, pretty=True):
@@ -123,20 +179,18 @@ def get_experiment_run(experiment_id, pretty=True):
 
         experiment = client.get_experiment(experiment_name=experiment_id)
 
-        # lists runs for trainings and deployments of an experiment
-        experiment_runs = client.list_runs(
-            page_size='100', sort_by=created_at_desc, experiment_id=experiment.id)
-
-        # find the latest training run
-        latest_training_run = None
-        for run in experiment_runs.runs:
-            workflow_manifest = json.loads(run.pipeline_spec.workflow_manifest)
-            if workflow_manifest['metadata']['generateName'] == 'common-pipeline-':
-                latest_training_run = run
-                break
+        # find the latest training run, deployments of the experiment are filtered by KFP
+        runs_filter = build_runs_filter(kind=TRAINING_RUN, experiment_id=experiment_id)
+        training_runs, _ = list_runs_page(client, experiment.id,
+                                          lambda run: is_run_of_kind(run, TRAINING_RUN),
+                                          page_size=1, runs_filter=runs_filter)
+        latest_training_run = training_runs[0] if training_runs else None
 
         if latest_training_run:
             run_id = latest_training_run.id
+            if pretty and latest_training_run.status in RUN_IMMUTABLE_STATUSES:
+                return cached(run_id, 'run-details',
+                              lambda: format_pipeline_run_details(client.get_run(run_id)))
             run_details = client.get_run(run_id)
         else:
             return {}
@@ -149,40 +203,205 @@ def get_experiment_run(experiment_id, pretty=True):
         return run_details
 
 
-def get_experiment_run_history(experiment_id):
-    """Get experiment run history.
+def get_experiment_run_history(experiment_id, page_size=MAX_RUNS_PAGE_SIZE, page_token=None,
+                               status=None, created_after=None, created_before=None):
+    """Get experiment run history, newest first.
     Args:
         experiment_id (str): PlatIA experiment_id.
+        page_size (int): max number of runs. (optional)
+        page_token (str): the nextPageToken of the previous page. (optional)
+        status (str): only runs with this status, eg. Succeeded. (optional)
+        created_after (str): only runs created at or after this date. (optional)
+        created_before (str): only runs created before this date. (optional)
     Returns:
-       Experiment run history.
+       A dict with the runs and the nextPageToken (None on the last page).
     """
+    runs_filter = build_runs_filter(created_after, created_before,
+                                    kind=TRAINING_RUN, experiment_id=experiment_id)
+
+    def accept(run):
+        if status and run.status != status:
+            return False
+        return is_run_of_kind(run, TRAINING_RUN)
+
     try:
         client = init_pipeline_client()
 
         experiment = client.get_experiment(experiment_name=experiment_id)
 
-        experiment_runs = client.list_runs(
-            page_size='100', sort_by=created_at_desc, experiment_id=experiment.id)
+        training_runs, next_page_token = list_runs_page(client, experiment.id, accept,
+                                                        page_size, page_token, runs_filter)
+
+        # fetches the details of all runs at once, immutable runs are fetched only once
+        runs_operators = map_concurrently(lambda run: get_run_operators(client, run), training_runs)
 
         response = []
-        for run in experiment_runs.runs:
-            workflow_manifest = json.loads(run.pipeline_spec.workflow_manifest)
-            if workflow_manifest['metadata']['generateName'] == 'common-pipeline-':
-                run_id = run.id
-                run_details = client.get_run(run_id)
-                formated_operators = format_run_operators(run_details)
-                if formated_operators:
-                    resp = {}
-                    resp['runId'] = run_id
-                    resp['createdAt'] = run.created_at
-                    resp['operators'] = formated_operators
-                    response.append(resp)
+        for run, formated_operators in zip(training_runs, runs_operators):
+            if formated_operators:
+                resp = {}
+                resp['runId'] = run.id
+                resp['createdAt'] = run.created_at
+                resp['operators'] = formated_operators
+                response.append(resp)
+    except HTTPException:
+        raise
     except Exception:
-        return []
+        return {'runs': [], 'nextPageToken': None}
 
+    return {'runs': response, 'nextPageToken': next_page_token}
+
+
+def encode_run_history(runs):
+    """Dictionary-encodes a run history.
+
+    The operator ids, task ids and parameter names repeat in every run, they
+    are listed once and referenced by their index.
+
+    Args:
+        runs (list): the run history, as returned by get_experiment_run_history.
+    Returns:
+       A dict with operatorIds, taskIds, parameterNames and runs. The operators
+       of a run are [operatorIndex, taskIndex, [[parameterNameIndex, value], ...]].
+    """
+    dictionaries = {'operatorIds': {}, 'taskIds': {}, 'parameterNames': {}}
+
+    def index_of(dictionary, value):
+        return dictionaries[dictionary].setdefault(value, len(dictionaries[dictionary]))
+
+    encoded_runs = []
+    for run in runs:
+        operators = []
+        for operator in run['operators']:
+            parameters = [[index_of('parameterNames', name), value]
+                          for name, value in (operator['parameters'] or {}).items()]
+            operators.append([index_of('operatorIds', operator['operatorId']),
+                              index_of('taskIds', operator['taskId']),
+                              parameters])
+        encoded_runs.append({'runId': run['runId'], 'createdAt': run['createdAt'], 'operators': operators})
+
+    response = {name: list(dictionary) for name, dictionary in dictionaries.items()}
+    response['runs'] = encoded_runs
     return response
 
 
+def get_run_operators(client, run):
+    """Get the operators of a training run, with their parameters.
+    Args:
+        client (kfp.Client): kfp client.
+        run (ApiRun): the run.
+    Returns:
+       A list of operators, or None if the run has not started.
+    """
+    if run.status in RUN_IMMUTABLE_STATUSES:
+        return cached(run.id, 'run-operators',
+                      lambda: format_run_operators(client.get_run(run.id)))
+    return format_run_operators(client.get_run(run.id))
+
+
+def get_run_status(experiment_id, run_id):
+    """Get the status of a training run and of each of its operators.
+
+    Results are kept for RUN_STATUS_TTL seconds. Concurrent requests for the
+    same run wait for a single request to KFP.
+
+    Args:
+        experiment_id (str): PlatIA experiment_id.
+        run_id (str): the run id, or "latest".
+    Returns:
+       A dict with runId, status and the status by operator id.
+    """
+    key = (experiment_id, run_id)
+    with RUN_STATUS_LOCK:
+        expires_at, status = RUN_STATUS_CACHE.get(key, (0, None))
+        if expires_at > time.monotonic():
+            return status
+        # a lock is kept while requests use it, apart from the expiring entries
+        lock, users = RUN_STATUS_LOCKS.get(key, (None, 0))
+        lock = lock or Lock()
+        RUN_STATUS_LOCKS[key] = (lock, users + 1)
+
+    try:
+        with lock:
+            with RUN_STATUS_LOCK:
+                expires_at, status = RUN_STATUS_CACHE.get(key, (0, None))
+                if expires_at > time.monotonic():
+                    return status
+
+            status = read_run_status(experiment_id, run_id)
+
+            with RUN_STATUS_LOCK:
+                now = time.monotonic()
+                for expired in [k for k, (expires_at, _) in RUN_STATUS_CACHE.items() if expires_at <= now]:
+                    del RUN_STATUS_CACHE[expired]
+                RUN_STATUS_CACHE[key] = (now + RUN_STATUS_TTL, status)
+        return status
+    finally:
+        with RUN_STATUS_LOCK:
+            lock, users = RUN_STATUS_LOCKS.pop(key)
+            if users > 1:
+                RUN_STATUS_LOCKS[key] = (lock, users - 1)
+
+
+def read_run_status(experiment_id, run_id):
+    """Reads the status of a training run from KFP.
+    Args:
+        experiment_id (str): PlatIA experiment_id.
+        run_id (str): the run id, or "latest".
+    Returns:
+       A dict with runId, status and the status by operator id.
+    """
+    if run_id == 'latest':
+        run_details = get_experiment_run(experiment_id, pretty=False)
+    else:
+        try:
+            run_details = init_pipeline_client().get_run(run_id)
+        except Exception:
+            run_details = None
+    if not run_details:
+        raise NotFound('The specified run does not exist')
+
+    workflow_manifest = json.loads(run_details.pipeline_runtime.workflow_manifest)
+    return {
+        'runId': run_details.run.id,
+        'status': run_details.run.status or 'Pending',
+        'operators': get_operators_status(workflow_manifest),
+    }
+
+
+def stream_operator_log(experiment_id, run_id, operator_id, since_seconds=None):
+    """Follows the logs of an operator of a training run.
+    Args:
+        experiment_id (str): PlatIA experiment_id.
+        run_id (str): the run id, or "latest".
+        operator_id (str): PlatIA operator_id.
+        since_seconds (int): only lines newer than this. Resumes a stream. (optional)
+    Returns:
+        A generator of Server-Sent Events.
+    """
+    if run_id == 'latest':
+        run_details = get_experiment_run(experiment_id, pretty=False)
+    else:
+        try:
+            run_details = init_pipeline_client().get_run(run_id)
+        except Exception:
+            run_details = None
+    if not run_details:
+        raise NotFound('The specified run does not exist')
+
+    workflow_manifest = json.loads(run_details.pipeline_runtime.workflow_manifest)
+    pod_name = None
+    for node in workflow_manifest['status'].get('nodes', {}).values():
+        if node['displayName'] == operator_id and node.get('type') == 'Pod':
+            pod_name = node['id']
+    if pod_name is None:
+        raise NotFound('The specified operator has not started')
+
+    try:
+        return stream_pod_logs([(pod_name, 'main', operator_id)], since_seconds)
+    except ApiException:
+        raise NotFound('The operator logs are not available')
+
+
 def terminate_experiment_run(experiment_id):
     """Terminate experiment run.
     Args:
@@ -203,26 +422,33 @@ def terminate_experiment_run(experiment_id):
     return response
 
 
-def retry_experiment_run(experiment_id):
-    """Re-initiate a failed or terminated experiment run.
+def retry_latest_run(experiment_id):
+    """Re-initiate the latest run of an experiment, when it failed.
     Args:
         experiment_id (str): PlatIA experiment_id.
     Returns:
-       Experiment run details.
+       The KFP run id.
     """
     client = init_pipeline_client()
     experiment = client.get_experiment(experiment_name=experiment_id)
     experiment_runs = client.list_runs(
         page_size='1', sort_by=created_at_desc, experiment_id=experiment.id)
-    retry = False
 
-    for run in experiment_runs.runs:
+    for run in experiment_runs.runs or []:
         if 'Failed' == run.status:
-            init_pipeline_client().runs.retry_run(run_id=run.id)
-            retry = True
-    if not retry:
-        raise NotFound('There is no failed experimentation')
-    run_details = client.get_run(run.id)
+            client.runs.retry_run(run_id=run.id)
+            return run.id
+    raise NotFound('There is no failed experimentation')
+
+
+def get_retried_run(run_id):
+    """Get the details of a retried run.
+    Args:
+        run_id (str): the KFP run id.
+    Returns:
+       Experiment run details.
+    """
+    run_details = init_pipeline_client().get_run(run_id)
     return format_pipeline_run_details(run_details)
 
 
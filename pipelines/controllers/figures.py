@@ -1,16 +1,181 @@
 # -*- coding: utf-8 -*-
+import base64
+import json
+from io import BytesIO
+from os import getenv
+from string import Template
+
 import platiagro
+from minio.error import NoSuchKey
+from werkzeug.exceptions import NotFound
+
+from pipelines.cache import cached
+from pipelines.controllers.utils import is_run_immutable
+from pipelines.object_storage import get_object, list_objects, put_object, stat_object
+
+THUMBNAIL_SIZE = int(getenv('THUMBNAIL_SIZE', '256'))
+
+# figures saved by the SDK, and the figures and thumbnails split from them
+SDK_OPERATOR_PREFIX = Template('experiments/$experimentId/operators/$operatorId/')
+SDK_FIGURES_PREFIX = Template('experiments/$experimentId/operators/$operatorId/$runId/')
+FIGURES_PREFIX = Template('figures/experiments/$experimentId/operators/$operatorId/runs/$runId/')
+THUMBNAIL_FORMATS = ['image/png', 'image/jpeg', 'image/gif', 'image/bmp']
 
 
-def list_figures(experiment_id, operator_id, run_id):
+def list_figures(experiment_id, operator_id, run_id, immutable=None):
     """Lists all figures from object storage as data URI scheme.
     Args:
         experiment_id (str): the experiment uuid.
         operator_id (str): the operator uuid.
         run_id (str): the run id.
+        immutable (bool): whether the run is immutable, if known already. (optional)
     Returns:
         A list of data URIs.
     """
+    if immutable is None:
+        immutable = is_run_immutable(run_id)
+    if immutable:
+        return cached(run_id, f"figures:{experiment_id}:{operator_id}",
+                      lambda: platiagro.list_figures(experiment_id=experiment_id,
+                                                     operator_id=operator_id,
+                                                     run_id=run_id))
     return platiagro.list_figures(experiment_id=experiment_id,
                                   operator_id=operator_id,
                                   run_id=run_id)
+
+
+def list_figures_metadata(experiment_id, operator_id, run_id):
+    """Lists the figures of a run without their contents.
+
+    Each figure and its thumbnail are stored as separate objects, once per run.
+    They are stored again when the figures of the run change. "latest" reuses
+    the objects of the run it refers to.
+
+    Args:
+        experiment_id (str): the experiment uuid.
+        operator_id (str): the operator uuid.
+        run_id (str): the run id, or "latest".
+    Returns:
+        A list of dicts with figureId, mimeType and whether it has a thumbnail.
+    """
+    run_id = resolve_run_id(experiment_id, operator_id, run_id)
+    if run_id is None:
+        return []
+    if is_run_immutable(run_id):
+        return cached(run_id, f"figures-metadata:{experiment_id}:{operator_id}",
+                      lambda: store_figures(experiment_id, operator_id, run_id))
+    return store_figures(experiment_id, operator_id, run_id)
+
+
+def store_figures(experiment_id, operator_id, run_id):
+    """Stores each figure of a run and its thumbnail as separate objects.
+    Args:
+        experiment_id (str): the experiment uuid.
+        operator_id (str): the operator uuid.
+        run_id (str): the run id.
+    Returns:
+        A list of dicts with figureId, mimeType and whether it has a thumbnail.
+    """
+    prefix = FIGURES_PREFIX.substitute(experimentId=experiment_id, operatorId=operator_id, runId=run_id)
+
+    # the etags of the figures saved by the SDK tell whether they changed
+    sdk_prefix = SDK_FIGURES_PREFIX.substitute(experimentId=experiment_id, operatorId=operator_id, runId=run_id)
+    signature = sorted(obj.etag for obj in list_objects(sdk_prefix) if 'figure' in obj.object_name)
+    try:
+        index = json.loads(get_object(f'{prefix}index.json'))
+        if signature and index['signature'] == signature:
+            return index['figures']
+    except NoSuchKey:
+        pass
+
+    figures = []
+    for figure_id, data_uri in enumerate(list_figures(experiment_id, operator_id, run_id)):
+        header, encoded = data_uri.split(',', 1)
+        mime_type = header[len('data:'):].split(';')[0]
+        data = base64.b64decode(encoded)
+        put_object(f'{prefix}{figure_id}', data)
+
+        thumbnail = create_thumbnail(data) if mime_type in THUMBNAIL_FORMATS else None
+        if thumbnail:
+            put_object(f'{prefix}{figure_id}-thumbnail', thumbnail)
+
+        figures.append({
+            'figureId': str(figure_id),
+            'mimeType': mime_type,
+            'size': len(data),
+            'thumbnail': thumbnail is not None,
+        })
+
+    index = {'signature': signature, 'figures': figures}
+    put_object(f'{prefix}index.json', json.dumps(index).encode())
+    return figures
+
+
+def resolve_run_id(experiment_id, operator_id, run_id):
+    """Resolves "latest" to the run id the SDK saved in the operator metadata.
+    Args:
+        experiment_id (str): the experiment uuid.
+        operator_id (str): the operator uuid.
+        run_id (str): the run id, or "latest".
+    Returns:
+        str: the run id, or None when the operator has no runs.
+    """
+    if run_id != 'latest':
+        return run_id
+
+    sdk_prefix = SDK_OPERATOR_PREFIX.substitute(experimentId=experiment_id, operatorId=operator_id)
+    try:
+        metadata = json.loads(get_object(f'{sdk_prefix}.metadata'))
+    except NoSuchKey:
+        return None
+    return metadata.get('run_id')
+
+
+def create_thumbnail(data):
+    """Creates a PNG thumbnail no larger than THUMBNAIL_SIZE.
+    Args:
+        data (bytes): the image.
+    Returns:
+        bytes: the thumbnail, or None if the image can't be read.
+    """
+    from PIL import Image
+
+    try:
+        image = Image.open(BytesIO(data))
+        image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        buffer = BytesIO()
+        image.save(buffer, format='PNG')
+        return buffer.getvalue()
+    except (IOError, ValueError):
+        return None
+
+
+def get_figure(experiment_id, operator_id, run_id, figure_id, thumbnail=False):
+    """Get the stored object of a figure, or of its thumbnail.
+
+    The figures of the run are stored first, when they were not yet or changed.
+
+    Args:
+        experiment_id (str): the experiment uuid.
+        operator_id (str): the operator uuid.
+        run_id (str): the run id, or "latest".
+        figure_id (str): the figure id.
+        thumbnail (bool): whether to get the thumbnail.
+    Returns:
+        A tuple with the object name, mime type and etag.
+    """
+    run_id = resolve_run_id(experiment_id, operator_id, run_id)
+    if run_id is None:
+        raise NotFound('The specified figure does not exist')
+    prefix = FIGURES_PREFIX.substitute(experimentId=experiment_id, operatorId=operator_id, runId=run_id)
+    figures = list_figures_metadata(experiment_id, operator_id, run_id)
+    figure = next((f for f in figures if f['figureId'] == figure_id), None)
+    if figure is None:
+        raise NotFound('The specified figure does not exist')
+
+    if thumbnail:
+        if not figure['thumbnail']:
+            raise NotFound('The specified figure has no thumbnail')
+        return f'{prefix}{figure_id}-thumbnail', 'image/png', stat_object(f'{prefix}{figure_id}-thumbnail').etag
+
+    return f'{prefix}{figure_id}', figure['mimeType'], stat_object(f'{prefix}{figure_id}').etag
@@ -3,9 +3,30 @@ import platiagro
 
 from werkzeug.exceptions import NotFound
 
+from pipelines.cache import cached
+from pipelines.controllers.utils import is_run_immutable
 
-def list_metrics(experiment_id, operator_id, run_id):
+
+def list_metrics(experiment_id, operator_id, run_id, immutable=None):
     """Lists all metrics from object storage.
+    Args:
+        experiment_id (str): the experiment uuid.
+        operator_id (str): the operator uuid.
+        run_id (str): the run id.
+        immutable (bool): whether the run is immutable, if known already. (optional)
+    Returns:
+        A list of metrics.
+    """
+    if immutable is None:
+        immutable = is_run_immutable(run_id)
+    if immutable:
+        return cached(run_id, f"metrics:{experiment_id}:{operator_id}",
+                      lambda: read_metrics(experiment_id, operator_id, run_id))
+    return read_metrics(experiment_id, operator_id, run_id)
+
+
+def read_metrics(experiment_id, operator_id, run_id):
+    """Reads the metrics from object storage.
     Args:
         experiment_id (str): the experiment uuid.
         operator_id (str): the operator uuid.
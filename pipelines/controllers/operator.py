@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import base64
+import hashlib
 import yaml
 import json
 import os
@@ -9,12 +10,28 @@ from string import Template
 from kfp import dsl
 from kubernetes import client as k8s_client
 
-from pipelines.controllers.utils import TRAINING_DATASETS_DIR, check_pvc_is_bound, \
-    validate_notebook_path
-from pipelines.resources.templates import COMPONENT_SPEC, GRAPH, LOGGER, \
-    POD_DEPLOYMENT, POD_DEPLOYMENT_VOLUME
+from minio.error import MinioError
+from urllib3.exceptions import HTTPError
+
+from pipelines.controllers.utils import TRAINING_DATASETS_DIR, TRAINING_DATASETS_STAGING_NAME, \
+    check_pvc_is_bound, validate_notebook_path
+from pipelines.object_storage import BUCKET_NAME, MINIO_ENDPOINT, MINIO_REGION_NAME, MINIO_SECRET_NAME, \
+    stat_object
+from pipelines.resources.templates import COPY_CACHED_OUTPUTS, EXECUTED_NOTEBOOK_PATH, POD_DEPLOYMENT, \
+    POD_DEPLOYMENT_VOLUME, STAGE_DATASET, UPLOAD_EXECUTED_NOTEBOOK, UPLOAD_VOLUME_OUTPUTS, \
+    VOLUME_OUTPUTS_PATH, build_component_spec, build_graph, build_logger
 
 KF_PIPELINES_NAMESPACE = os.getenv('KF_PIPELINES_NAMESPACE', 'deployments')
+DATASET_STAGING_WORKERS = int(os.getenv('DATASET_STAGING_WORKERS', '8'))
+DATASET_STAGING_CHUNK_SIZE = int(os.getenv('DATASET_STAGING_CHUNK_SIZE', str(16 * 2**20)))
+# changes whenever the outputs saved by operators change, so older runs are not reused
+CACHE_KEY_VERSION = 3
+
+# object storage prefixes of the outputs (figures, metrics, datasets) of an operator run
+CACHED_OUTPUT_PREFIXES = [
+    'experiments/$experimentId/operators/$operatorId/$runId/',
+    'datasets/$dataset/runs/$runId/operators/$operatorId/',
+]
 
 
 class Operator():
@@ -22,10 +39,12 @@ class Operator():
 
     Attributes:
         container_op (kfp.dsl.ContainerOp): operator ContainerOp.
+        resources (dict): operator resource profile.
     """
 
     def __init__(self, experiment_id, operator_id,
-                 image, commands, arguments, notebook_path, parameters):
+                 image, commands, arguments, notebook_path, parameters,
+                 resources=None):
         """Create a new instance of Operator.
 
         Args:
@@ -36,8 +55,10 @@ class Operator():
             arguments (str): ContainerOp arguments.
             notebook_path (str): path to operator notebook in MinIO.
             parameters (list): list of operator parameters.
+            resources (dict): requests, limits, nodeSelector and tolerations. (optional)
         """
         self.container_op = None
+        self.resources = resources
         self._experiment_id = experiment_id
         self._operator_id = operator_id
         self._image = image
@@ -63,24 +84,20 @@ class Operator():
         return base64.b64encode(yaml.dump(parameters_dict).encode()).decode()
 
     def _create_parameters_seldon(self):
-        seldon_parameters = []
-        if self._parameters:
-            return dumps(seldon_parameters.extend(self._parameters)).replace('"', '\\"')
-        return dumps(seldon_parameters).replace('"', '\\"')
+        return dumps(self._parameters or [])
 
     def create_operator_spec(self):
-        """Create a string from operator spec.
+        """Create the operator component spec.
         Returns:
-            Operator spec in JSON format.
+            Operator component spec.
         """
-        operator_spec = COMPONENT_SPEC.substitute({
-            'experimentId': self._experiment_id,
-            'operatorId': self._operator_id,
-            'parameters': self._create_parameters_seldon()
-        })
+        operator_spec = build_component_spec(
+            experiment_id=self._experiment_id,
+            operator_id=self._operator_id,
+            parameters=self._create_parameters_seldon(),
+        )
         if check_pvc_is_bound(f'vol-{self._experiment_id}', 'deployments'):
-            operator_spec_json = json.loads(operator_spec)
-            spec = operator_spec_json['spec']
+            spec = operator_spec['spec']
             spec['containers'][0]['volumeMounts'].append({
                 "name": "data",
                 "mountPath": "/tmp/data"
@@ -91,29 +108,25 @@ class Operator():
                     "claimName": f'vol-{self._experiment_id}'
                 }
             })
-            operator_spec = json.dumps(operator_spec_json)
 
         return operator_spec
 
-    def create_operator_graph(self, children, include_logger=False):
-        """Creates a string from the operator's graph with its children.
+    def create_operator_graph(self, child=None, include_logger=False):
+        """Creates the operator's graph with its child.
 
         Returns:
-            Pipeline operators graph in JSON format.
+            Pipeline operators graph.
         """
-        operator_graph = GRAPH.substitute({
-            'name': self._operator_id,
-            'children': children,
-            'logger': self._create_seldon_logger() if include_logger is True else ''
-        })
-
-        return operator_graph
+        return build_graph(
+            name=self._operator_id,
+            child=child,
+            logger=build_logger(self._experiment_id) if include_logger is True else None,
+        )
 
-    def _create_seldon_logger(self):
-        logger = LOGGER.substitute({
-            'experimentId': self._experiment_id
-        })
-        return logger
+    @property
+    def dataset(self):
+        """The dataset name of this operator, or None."""
+        return self._get_dataset_from_parameters()
 
     def _get_dataset_from_parameters(self):
         dataset = None
@@ -124,6 +137,179 @@ class Operator():
                     dataset = parameter.get('value')
         return dataset
 
+    @property
+    def saves_outputs(self):
+        """Whether the executed notebook and the files written to the volume are
+        saved after this operator runs. Only the default task command (sh -c) does."""
+        return self._commands == ['sh', '-c'] and len(self._arguments) == 1
+
+    def create_cache_key(self, upstream_cache_keys):
+        """Create the operator cache key.
+
+        The key changes whenever the task notebook, the parameters, the image,
+        the commands or any upstream operator changes.
+
+        Args:
+            upstream_cache_keys (list): cache keys of the operator dependencies.
+
+        Returns:
+            str: the cache key, or None if the operator can't be cached.
+        """
+        if not self._notebook_path or not self.saves_outputs or None in upstream_cache_keys:
+            return None
+
+        object_name = self._notebook_path[len(f"s3://{BUCKET_NAME}/"):]
+        try:
+            notebook_etag = stat_object(object_name).etag
+        except (MinioError, HTTPError):
+            # a cache miss, the operator is executed
+            return None
+
+        key = dumps({
+            'version': CACHE_KEY_VERSION,
+            'experimentId': self._experiment_id,
+            'operatorId': self._operator_id,
+            'notebook': notebook_etag,
+            'parameters': self._parameters,
+            'image': self._image,
+            'commands': self._commands,
+            'arguments': self._arguments,
+            'upstream': sorted(upstream_cache_keys),
+        }, sort_keys=True)
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _add_env_variables(self, container_op):
+        container_op.container.set_image_pull_policy('IfNotPresent') \
+            .add_env_variable(k8s_client.V1EnvVar(
+                name='EXPERIMENT_ID',
+                value=self._experiment_id)) \
+            .add_env_variable(k8s_client.V1EnvVar(
+                name='OPERATOR_ID',
+                value=self._operator_id)) \
+            .add_env_variable(k8s_client.V1EnvVar(
+                name='RUN_ID',
+                value=dsl.RUN_ID_PLACEHOLDER))
+
+    @property
+    def output_dir(self):
+        """Directory of the training volume whose files are the outputs of this operator.
+
+        It is emptied before the operator runs, and restored when its outputs are reused.
+        """
+        return f'{TRAINING_DATASETS_DIR}/operators/{self._operator_id}'
+
+    def _add_output_dir_env_variable(self, container_op):
+        container_op.container.add_env_variable(k8s_client.V1EnvVar(
+            name='OPERATOR_OUTPUT_DIR',
+            value=self.output_dir))
+
+    def _add_minio_env_variables(self, container_op):
+        """Sets the MinIO config of the server on a ContainerOp that runs a MINIO_CLIENT_SCRIPT.
+
+        The keys are read from the MINIO_SECRET_NAME secret, so that they are
+        not stored in the run manifests.
+        """
+        for name, value in [('MINIO_ENDPOINT', MINIO_ENDPOINT),
+                            ('MINIO_REGION_NAME', MINIO_REGION_NAME)]:
+            container_op.container.add_env_variable(k8s_client.V1EnvVar(name=name, value=value))
+        for name in ['MINIO_ACCESS_KEY', 'MINIO_SECRET_KEY']:
+            container_op.container.add_env_variable(k8s_client.V1EnvVar(
+                name=name,
+                value_from=k8s_client.V1EnvVarSource(
+                    secret_key_ref=k8s_client.V1SecretKeySelector(name=MINIO_SECRET_NAME, key=name),
+                ),
+            ))
+
+    def create_cached_container_op(self, cached_run_id):
+        """Create a ContainerOp that reuses the outputs of a previous run.
+
+        Instead of executing the notebook, the outputs of the cached run are
+        copied to the current run in the object storage: figures, metrics,
+        datasets and the executed notebook. The files it wrote to its output
+        directory in the training volume are restored too.
+
+        Args:
+            cached_run_id (str): the run id whose outputs are reused.
+        """
+        dataset = self._get_dataset_from_parameters()
+        prefixes = []
+        for prefix in CACHED_OUTPUT_PREFIXES:
+            if '$dataset' in prefix and not dataset:
+                continue
+            prefixes.append(Template(prefix).substitute({
+                'experimentId': self._experiment_id,
+                'operatorId': self._operator_id,
+                'runId': cached_run_id,
+                'dataset': dataset,
+            }))
+
+        script = COPY_CACHED_OUTPUTS.substitute({
+            'bucket': BUCKET_NAME,
+            'cachedRunId': cached_run_id,
+            'prefixes': dumps(prefixes),
+            'notebookName': EXECUTED_NOTEBOOK_PATH.safe_substitute({
+                'experimentId': self._experiment_id,
+                'operatorId': self._operator_id,
+            }),
+            'volumeOutputsName': VOLUME_OUTPUTS_PATH.safe_substitute({
+                'experimentId': self._experiment_id,
+                'operatorId': self._operator_id,
+            }),
+        })
+
+        # the skipped papermill command is kept (as a no-op) so that the run
+        # details still show the operator task and parameters
+        container_op = dsl.ContainerOp(
+            name=self._operator_id,
+            image=self._image,
+            command=['sh', '-c'],
+            arguments=[
+                f': papermill {self._notebook_path} output.ipynb -b {self._create_parameters_papermill()}; '
+                'python -c "$COPY_CACHED_OUTPUTS"'
+            ],
+        )
+        self._add_env_variables(container_op)
+        self._add_output_dir_env_variable(container_op)
+        self._add_minio_env_variables(container_op)
+        container_op.container.add_env_variable(k8s_client.V1EnvVar(
+            name='COPY_CACHED_OUTPUTS',
+            value=script))
+
+        self.container_op = container_op
+
+    def create_staging_container_op(self):
+        """Create a ContainerOp that stages the dataset of this operator in TRAINING_DATASETS_DIR.
+
+        Files are downloaded with parallel ranged GETs and verified against their
+        etag. Files whose etag matches the one staged by a previous run are kept.
+
+        Returns:
+            kfp.dsl.ContainerOp: the staging ContainerOp.
+        """
+        script = STAGE_DATASET.substitute({
+            'bucket': BUCKET_NAME,
+            'datasetDir': TRAINING_DATASETS_DIR,
+            'workers': DATASET_STAGING_WORKERS,
+            'chunkSize': DATASET_STAGING_CHUNK_SIZE,
+        })
+
+        container_op = dsl.ContainerOp(
+            name=TRAINING_DATASETS_STAGING_NAME,
+            image=self._image,
+            command=['sh', '-c'],
+            arguments=['python -c "$STAGE_DATASET"'],
+        )
+        # the dataset name is given by users, it is not pasted in the script
+        container_op.container.set_image_pull_policy('IfNotPresent') \
+            .add_env_variable(k8s_client.V1EnvVar(
+                name='STAGE_DATASET',
+                value=script)) \
+            .add_env_variable(k8s_client.V1EnvVar(
+                name='DATASET_NAME',
+                value=self.dataset))
+        self._add_minio_env_variables(container_op)
+        return container_op
+
     def create_container_op(self):
         """Create operator operator from YAML file."""
         arguments = []
@@ -139,23 +325,47 @@ class Operator():
             })
             arguments.append(argument)
 
+        if self.saves_outputs:
+            # uploads the executed notebook and the files written to the output directory,
+            # keeping the exit status of the task script
+            arguments = [
+                'rm -rf "$OPERATOR_OUTPUT_DIR"; mkdir -p "$OPERATOR_OUTPUT_DIR"; '
+                f'( {arguments[0]} ); status=$?; '
+                'python -c "$UPLOAD_EXECUTED_NOTEBOOK"; python -c "$UPLOAD_VOLUME_OUTPUTS"; '
+                'exit $status'
+            ]
+
         container_op = dsl.ContainerOp(
             name=self._operator_id,
             image=self._image,
             command=self._commands,
             arguments=arguments,
         )
+        self._add_env_variables(container_op)
 
-        container_op.container.set_image_pull_policy('IfNotPresent') \
-            .add_env_variable(k8s_client.V1EnvVar(
-                name='EXPERIMENT_ID',
-                value=self._experiment_id)) \
-            .add_env_variable(k8s_client.V1EnvVar(
-                name='OPERATOR_ID',
-                value=self._operator_id)) \
-            .add_env_variable(k8s_client.V1EnvVar(
-                name='RUN_ID',
-                value=dsl.RUN_ID_PLACEHOLDER))
+        if self.saves_outputs:
+            self._add_output_dir_env_variable(container_op)
+            self._add_minio_env_variables(container_op)
+            script = UPLOAD_EXECUTED_NOTEBOOK.substitute({
+                'bucket': BUCKET_NAME,
+                'objectName': EXECUTED_NOTEBOOK_PATH.safe_substitute({
+                    'experimentId': self._experiment_id,
+                    'operatorId': self._operator_id,
+                }),
+            })
+            container_op.container.add_env_variable(k8s_client.V1EnvVar(
+                name='UPLOAD_EXECUTED_NOTEBOOK',
+                value=script))
+            script = UPLOAD_VOLUME_OUTPUTS.substitute({
+                'bucket': BUCKET_NAME,
+                'objectName': VOLUME_OUTPUTS_PATH.safe_substitute({
+                    'experimentId': self._experiment_id,
+                    'operatorId': self._operator_id,
+                }),
+            })
+            container_op.container.add_env_variable(k8s_client.V1EnvVar(
+                name='UPLOAD_VOLUME_OUTPUTS',
+                value=script))
 
         self.container_op = container_op
 
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import json
+
+from werkzeug.exceptions import BadRequest
+
+from pipelines.concurrency import map_concurrently
+from pipelines.controllers.utils import init_pipeline_client
+from pipelines.database import db_session
+from pipelines.models import OperatorCacheKey
+
+
+def get_succeeded_operators(client, run_id):
+    """Lists the operators that succeeded in a run.
+
+    Args:
+        client (kfp.Client): kfp client.
+        run_id (str): the run id.
+
+    Returns:
+        set: operator ids.
+    """
+    try:
+        run_details = client.get_run(run_id)
+        workflow_manifest = json.loads(run_details.pipeline_runtime.workflow_manifest)
+    except Exception:
+        return set()
+
+    nodes = workflow_manifest['status'].get('nodes', {})
+    return {str(node['displayName']) for node in nodes.values() if node.get('phase') == 'Succeeded'}
+
+
+def find_cached_runs(experiment_id, cache_keys):
+    """Find previous runs whose outputs can be reused by each operator.
+
+    A run is reused when the operator had the same cache key in it and succeeded.
+
+    Args:
+        experiment_id (str): the experiment uuid.
+        cache_keys (dict): cache key by operator id.
+
+    Returns:
+        dict: run id by operator id.
+    """
+    keys = [key for key in cache_keys.values() if key]
+    if not keys:
+        return {}
+
+    candidates = db_session.query(OperatorCacheKey) \
+        .filter_by(experiment_id=experiment_id) \
+        .filter(OperatorCacheKey.cache_key.in_(keys)) \
+        .order_by(OperatorCacheKey.created_at.desc()) \
+        .all()
+
+    # the latest run of each operator is usually the one reused, fetches them at once
+    latest_run_ids = {}
+    for candidate in candidates:
+        latest_run_ids.setdefault(candidate.operator_id, candidate.run_id)
+    run_ids = list(set(latest_run_ids.values()))
+
+    client = init_pipeline_client()
+    succeeded_operators = dict(zip(run_ids, map_concurrently(
+        lambda run_id: get_succeeded_operators(client, run_id), run_ids)))
+
+    cached_runs = {}
+    for candidate in candidates:
+        operator_id = candidate.operator_id
+        if operator_id in cached_runs or cache_keys.get(operator_id) != candidate.cache_key:
+            continue
+
+        run_id = candidate.run_id
+        if run_id not in succeeded_operators:
+            succeeded_operators[run_id] = get_succeeded_operators(client, run_id)
+        if operator_id in succeeded_operators[run_id]:
+            cached_runs[operator_id] = run_id
+    return cached_runs
+
+
+def find_upstream_runs(pipeline, operator_id, run_id):
+    """Reuse the outputs of a previous run for the operators that are not
+    downstream of the given operator. Operators of independent branches that
+    did not succeed in the previous run are executed again.
+
+    Args:
+        pipeline (Pipeline): the pipeline to run.
+        operator_id (str): the operator to run from.
+        run_id (str): the previous run id.
+
+    Returns:
+        dict: run id by operator id.
+
+    Raises:
+        BadRequest: if an upstream operator did not succeed in the previous run.
+    """
+    upstream_operators = pipeline.get_upstream_operators(operator_id)
+    succeeded_operators = get_succeeded_operators(init_pipeline_client(), run_id)
+    if not upstream_operators.issubset(succeeded_operators):
+        raise BadRequest('The upstream operators did not succeed in the specified run')
+
+    return {skipped: run_id for skipped in pipeline.get_skipped_operators(operator_id)
+            if skipped in succeeded_operators}
+
+
+def save_cache_keys(experiment_id, run_id, cache_keys):
+    """Stores the operator cache keys of a run.
+
+    Args:
+        experiment_id (str): the experiment uuid.
+        run_id (str): the run id.
+        cache_keys (dict): cache key by operator id.
+    """
+    for operator_id, cache_key in cache_keys.items():
+        if cache_key:
+            db_session.add(OperatorCacheKey(run_id=run_id,
+                                            operator_id=operator_id,
+                                            experiment_id=experiment_id,
+                                            cache_key=cache_key))
+    db_session.commit()
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-import json
+import math
 from os import getenv
 from collections import defaultdict
 
@@ -7,17 +7,82 @@ from kfp import compiler, dsl
 from werkzeug.exceptions import BadRequest
 
 from pipelines.controllers.operator import Operator
-from pipelines.controllers.utils import TRAINING_DATASETS_DIR, TRAINING_DATASETS_VOLUME_NAME, \
-    init_pipeline_client, validate_operator, validate_parameters
-from pipelines.resources.templates import SELDON_DEPLOYMENT
+from pipelines.controllers.utils import DEPLOYMENT_RUN, TRAINING_DATASETS_DIR, \
+    TRAINING_DATASETS_VOLUME_NAME, TRAINING_RUN, get_pvc_spec, get_run_name, init_pipeline_client, \
+    parse_quantity, validate_operator, validate_parameters, validate_volume
+from pipelines.resources.templates import build_seldon_deployment
+from pipelines.utils import to_snake_case
 
-from kubernetes.client.models import V1PersistentVolumeClaim
+from kubernetes.client.models import V1PersistentVolumeClaim, V1Toleration
 
 KF_PIPELINES_NAMESPACE = getenv('KF_PIPELINES_NAMESPACE', 'deployments')
 MEMORY_REQUEST = getenv('MEMORY_REQUEST', '2G')
 MEMORY_LIMIT = getenv('MEMORY_LIMIT', '4G')
 CPU_REQUEST = getenv('CPU_REQUEST', '500m')
 CPU_LIMIT = getenv('CPU_LIMIT', '2000m')
+TRAINING_VOLUME_SIZE = getenv('TRAINING_VOLUME_SIZE', '1Gi')
+TRAINING_VOLUME_ACCESS_MODE = getenv('TRAINING_VOLUME_ACCESS_MODE', 'ReadWriteOnce')
+TRAINING_VOLUME_STORAGE_CLASS = getenv('TRAINING_VOLUME_STORAGE_CLASS')
+# room for the dataset plus the files operators write to the volume
+TRAINING_VOLUME_DATASET_FACTOR = float(getenv('TRAINING_VOLUME_DATASET_FACTOR', '3'))
+DEFAULT_RESOURCES = {
+    'requests': {
+        'memory': MEMORY_REQUEST,
+        'cpu': CPU_REQUEST,
+    },
+    'limits': {
+        'memory': MEMORY_LIMIT,
+        'cpu': CPU_LIMIT,
+    },
+}
+
+
+def get_volume_size(dataset_size):
+    """Get the training volume size needed by a dataset.
+
+    Args:
+        dataset_size (int): dataset size in bytes.
+
+    Returns:
+        str: the volume size, never smaller than TRAINING_VOLUME_SIZE.
+    """
+    size = math.ceil(dataset_size * TRAINING_VOLUME_DATASET_FACTOR / 2**30)
+    if size * 2**30 <= parse_quantity(TRAINING_VOLUME_SIZE):
+        return TRAINING_VOLUME_SIZE
+    return f'{size}Gi'
+
+
+def get_volume_spec(name, volume):
+    """Get the spec of the training volume of an experiment.
+
+    The volume is created by the first run of the experiment and reused by
+    the next ones. Kubernetes rejects changes to the access mode and storage
+    class of a bound claim, and shrinking it, so the spec of an existing
+    claim is kept as is.
+
+    Args:
+        name (str): the claim name.
+        volume (dict): size, storageClass and accessMode of the volume to create.
+
+    Returns:
+        dict: the PersistentVolumeClaim spec.
+    """
+    spec = get_pvc_spec(name, KF_PIPELINES_NAMESPACE)
+    if spec:
+        return spec
+
+    spec = {
+        'accessModes': [volume.get('accessMode', TRAINING_VOLUME_ACCESS_MODE)],
+        'resources': {
+            'requests': {
+                'storage': volume.get('size', TRAINING_VOLUME_SIZE)
+            }
+        }
+    }
+    storage_class = volume.get('storageClass', TRAINING_VOLUME_STORAGE_CLASS)
+    if storage_class:
+        spec['storageClassName'] = storage_class
+    return spec
 
 
 class Pipeline():
@@ -41,6 +106,7 @@ class Pipeline():
 
         self._experiment_id = experiment_id
         self._name = name
+        self._run_name = experiment_id
 
         self._client = init_pipeline_client()
         self._experiment = self._client.create_experiment(name=experiment_id)
@@ -92,6 +158,7 @@ class Pipeline():
                  operator_id (str): PlatIA operator UUID.
                  notebook_path (str): operator notebook MinIO path.
                  parameters (list): operator parameters list. (optional)
+                 resources (dict): operator resource profile. (optional)
         """
 
         if not validate_operator(operator):
@@ -119,7 +186,8 @@ class Pipeline():
 
         self._operators[operator_id] = Operator(
             self._experiment_id, operator_id, image,
-            commands, arguments, notebook_path, parameters
+            commands, arguments, notebook_path, parameters,
+            operator.get('resources'),
         )
 
     def _get_operator(self, operator_id):
@@ -169,29 +237,113 @@ class Pipeline():
 
         return final_operators
 
-    def _create_operator_specs_json(self):
-        """Create KubeFlow specs to each operator from this pipeline.
+    def _set_operator_resources(self, operator):
+        """Apply the operator resource profile to its ContainerOp.
+
+        Requests and limits not given by the profile fall back to the
+        MEMORY_REQUEST, MEMORY_LIMIT, CPU_REQUEST and CPU_LIMIT defaults.
+        A default request above a limit of the profile is lowered to the limit.
+
+        Args:
+            operator (Operator): a pipeline operator with a ContainerOp.
+        """
+        resources = operator.resources or {}
+        container_op = operator.container_op
+
+        requests = {**DEFAULT_RESOURCES['requests'], **resources.get('requests', {})}
+        limits = {**DEFAULT_RESOURCES['limits'], **resources.get('limits', {})}
+        for name, limit in resources.get('limits', {}).items():
+            if name in requests and parse_quantity(requests[name]) > parse_quantity(limit):
+                requests[name] = limit
+
+        for name, value in requests.items():
+            container_op.container.add_resource_request(name, str(value))
+
+        for name, value in limits.items():
+            container_op.container.add_resource_limit(name, str(value))
+
+        for label_name, value in resources.get('nodeSelector', {}).items():
+            container_op.add_node_selector_constraint(label_name, value)
+
+        for toleration in resources.get('tolerations', []):
+            container_op.add_toleration(
+                V1Toleration(**{to_snake_case(k): v for k, v in toleration.items()})
+            )
+
+    def _get_reachable_operators(self, operator_id, edges):
+        if operator_id not in self._operators:
+            raise BadRequest('The specified operator does not exist')
+
+        reachable = set()
+        stack = [operator_id]
+        while stack:
+            for neighbour in edges[stack.pop()]:
+                if neighbour not in reachable:
+                    reachable.add(neighbour)
+                    stack.append(neighbour)
+        return reachable
+
+    def get_upstream_operators(self, operator_id):
+        """Get all operators that the given operator depends on.
+
+        Args:
+            operator_id (str): PlatIA operator UUID.
+
+        Returns:
+            A set of operator ids.
+        """
+        return self._get_reachable_operators(operator_id, self._inverted_edges)
+
+    def get_skipped_operators(self, operator_id):
+        """Get the operators that are not executed when running from the given operator.
+
+        Args:
+            operator_id (str): PlatIA operator UUID.
+
+        Returns:
+            A set with all operator ids but the given operator and its descendants.
+        """
+        downstream = self._get_reachable_operators(operator_id, self._edges)
+        downstream.add(operator_id)
+        return set(self._operators.keys()) - downstream
+
+    def get_cache_keys(self):
+        """Compute the cache key of each operator of this pipeline.
 
         Returns:
-            A string in JSON format with the specs of each operator.
+            dict: cache key by operator id.
         """
-        specs = []
+        cache_keys = {}
 
-        for _, operator in self._operators.items():
-            specs.append(operator.create_operator_spec())
+        def create_cache_key(operator_id):
+            if operator_id not in cache_keys:
+                upstream_cache_keys = [create_cache_key(d) for d in self._inverted_edges[operator_id]]
+                operator = self._get_operator(operator_id)
+                cache_keys[operator_id] = operator.create_cache_key(upstream_cache_keys)
+            return cache_keys[operator_id]
+
+        for operator_id in self._operators.keys():
+            create_cache_key(operator_id)
+        return cache_keys
+
+    def _create_operator_specs(self):
+        """Create KubeFlow specs to each operator from this pipeline.
 
-        return ",".join(specs)
+        Returns:
+            A list with the specs of each operator.
+        """
+        return [operator.create_operator_spec() for operator in self._operators.values()]
 
-    def _create_graph_json(self):
-        """Create a KubeFlow Graph in JSON format from this pipeline.
+    def _create_graph(self):
+        """Create a KubeFlow Graph from this pipeline.
 
         Returns:
-            A string in JSON format describing this pipeline.
+            A dict describing this pipeline.
         """
         if self._is_sequential():
             current_operator = self._get_final_operators()[0]
 
-            graph = ""
+            graph = None
             include_logger = True
 
             while True:
@@ -207,25 +359,35 @@ class Pipeline():
         else:
             raise BadRequest('Non-sequential pipeline.')
 
-    def compile_training_pipeline(self):
-        """Compile the pipeline in a training format."""
+    def compile_training_pipeline(self, cached_runs=None, volume=None):
+        """Compile the pipeline in a training format.
+
+        Args:
+            cached_runs (dict): run id whose outputs are reused, by operator id.
+                These operators are not executed. (optional)
+            volume (dict): size, storageClass and accessMode of the training volume.
+                ReadWriteMany allows independent branches to run on different nodes.
+                Only used when the volume of the experiment is created. (optional)
+        """
+        cached_runs = cached_runs or {}
+        volume = volume or {}
+
+        if not validate_volume(volume):
+            raise BadRequest('Invalid volume.')
+
+        volume_name = f'vol-{self._experiment_id}'
+        volume_spec = get_volume_spec(volume_name, volume)
+
         @dsl.pipeline(name='Common pipeline')
         def training_pipeline():
             pvc = V1PersistentVolumeClaim(
                 api_version="v1",
                 kind="PersistentVolumeClaim",
                 metadata={
-                    'name': f'vol-{self._experiment_id}',
+                    'name': volume_name,
                     'namespace': KF_PIPELINES_NAMESPACE,
                 },
-                spec={
-                    'accessModes': ['ReadWriteOnce'],
-                    'resources': {
-                        'requests': {
-                            'storage': '1Gi'
-                        }
-                    }
-                }
+                spec=volume_spec
             )
 
             wrkdirop = dsl.VolumeOp(
@@ -235,14 +397,20 @@ class Pipeline():
             )
 
             # Create container_op for all operators
-            for _, operator in self._operators.items():
-                operator.create_container_op()
-
-                operator.container_op.container \
-                    .set_memory_request(MEMORY_REQUEST) \
-                    .set_memory_limit(MEMORY_LIMIT) \
-                    .set_cpu_request(CPU_REQUEST) \
-                    .set_cpu_limit(CPU_LIMIT)
+            for operator_id, operator in self._operators.items():
+                if operator_id in cached_runs:
+                    operator.create_cached_container_op(cached_runs[operator_id])
+                else:
+                    operator.create_container_op()
+                    self._set_operator_resources(operator)
+
+            # Stage the dataset once in the volume, before any operator reads it
+            staging_op = None
+            staging_operator = next((operator for operator_id, operator in self._operators.items()
+                                     if operator.dataset and operator_id not in cached_runs), None)
+            if staging_operator:
+                staging_op = staging_operator.create_staging_container_op()
+                staging_op.add_pvolumes({TRAINING_DATASETS_DIR: wrkdirop.volume})
 
             # Define operators volumes and dependecies
             for operator_id, operator in self._operators.items():
@@ -250,26 +418,27 @@ class Pipeline():
                     dependencies = self._inverted_edges[operator_id]
                     dependencies_ops = [self._get_operator(d).container_op for d in dependencies]
                     operator.container_op.after(*dependencies_ops)
+                elif staging_op:
+                    operator.container_op.after(staging_op)
                 operator.container_op.add_pvolumes({TRAINING_DATASETS_DIR: wrkdirop.volume})
 
         compiler.Compiler().compile(training_pipeline, self._experiment_id + '.yaml')
+        self._run_name = get_run_name(TRAINING_RUN, self._experiment_id)
 
     def compile_deployment_pipeline(self):
         """Compile pipeline in a deployment format."""
-        operator_specs = self._create_operator_specs_json()
-        graph = self._create_graph_json()
+        operator_specs = self._create_operator_specs()
+        graph = self._create_graph()
 
         @dsl.pipeline(name='Common Seldon Deployment.')
         def deployment_pipeline():
-            seldonserving = SELDON_DEPLOYMENT.substitute({
-                "namespace": KF_PIPELINES_NAMESPACE,
-                "experimentId": self._experiment_id,
-                "deploymentName": self._name,
-                "componentSpecs": operator_specs,
-                "graph": graph
-            })
-
-            seldon_deployment = json.loads(seldonserving)
+            seldon_deployment = build_seldon_deployment(
+                experiment_id=self._experiment_id,
+                deployment_name=self._name,
+                namespace=KF_PIPELINES_NAMESPACE,
+                component_specs=operator_specs,
+                graph=graph,
+            )
             serve_op = dsl.ResourceOp(
                 name="deployment",
                 k8s_resource=seldon_deployment,
@@ -285,6 +454,7 @@ class Pipeline():
             compiler.Compiler().compile(deployment_pipeline, f'{self._experiment_id}.yaml')
         except RuntimeError:
             pass
+        self._run_name = get_run_name(DEPLOYMENT_RUN, self._experiment_id)
 
     def run_pipeline(self):
         """Run this pipeline on the KubeFlow instance.
@@ -292,7 +462,7 @@ class Pipeline():
         Returns:
             KubeFlow run object.
         """
-        run = self._client.run_pipeline(self._experiment.id, self._experiment_id,
+        run = self._client.run_pipeline(self._experiment.id, self._run_name,
                                         f'{self._experiment_id}.yaml')
 
         return run.id
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+import logging
+import math
+import threading
+import time
+from datetime import datetime
+from os import getenv
+
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+from sqlalchemy.exc import SQLAlchemyError
+
+from pipelines.controllers.task_resources import get_resources_profile
+from pipelines.controllers.utils import load_kube_config, get_operator_task_id, parse_quantity
+from pipelines.database import db_session
+from pipelines.models import ResourceUsage, Task
+
+KF_PIPELINES_NAMESPACE = getenv('KF_PIPELINES_NAMESPACE', 'deployments')
+RESOURCE_RIGHT_SIZING = getenv('RESOURCE_RIGHT_SIZING', 'false').lower() == 'true'
+RIGHT_SIZING_HEADROOM = float(getenv('RIGHT_SIZING_HEADROOM', '0.2'))
+RIGHT_SIZING_HISTORY = int(getenv('RIGHT_SIZING_HISTORY', '10'))
+RESOURCE_SAMPLING_INTERVAL = int(getenv('RESOURCE_SAMPLING_INTERVAL', '30'))
+
+MIN_CPU = 0.1                   # cores
+MIN_MEMORY = 128 * 2**20        # bytes
+WORKFLOW_LABEL = 'workflows.argoproj.io/workflow'
+COMPLETED_LABEL = 'workflows.argoproj.io/completed'
+RUN_ID_LABEL = 'pipeline/runid'
+
+SAMPLER = None
+SAMPLER_LOCK = threading.Lock()
+
+
+def list_pod_metrics(workflow_name):
+    """Lists the current usage of the pods of a workflow from the metrics API.
+
+    Args:
+        workflow_name (str): Argo workflow name.
+
+    Returns:
+        dict: (cpu, memory) usage of the main container of each pod, by pod name.
+    """
+    load_kube_config()
+    custom_api = client.CustomObjectsApi()
+    try:
+        pod_metrics = custom_api.list_namespaced_custom_object(
+            'metrics.k8s.io',
+            'v1beta1',
+            KF_PIPELINES_NAMESPACE,
+            'pods',
+            label_selector=f'{WORKFLOW_LABEL}={workflow_name}',
+        )
+    except ApiException:
+        return {}
+
+    usage = {}
+    for item in pod_metrics['items']:
+        for container in item['containers']:
+            if container['name'] == 'main':
+                usage[item['metadata']['name']] = (
+                    parse_quantity(container['usage']['cpu']),
+                    parse_quantity(container['usage']['memory']),
+                )
+    return usage
+
+
+def get_operator_memory_limit(workflow_manifest, operator):
+    """Get the memory limit that was applied to an operator.
+
+    Args:
+        workflow_manifest (dict): workflow manifest from pipeline runtime.
+        operator (str): operator id.
+
+    Returns:
+        int: memory limit in bytes, or None.
+    """
+    for template in workflow_manifest['spec']['templates']:
+        if template['name'] == operator and 'container' in template:
+            limits = template['container'].get('resources', {}).get('limits', {})
+            if 'memory' in limits:
+                return int(parse_quantity(limits['memory']))
+
+
+def start_sampler():
+    """Starts the resource usage sampler thread, once per process.
+
+    Called once at startup (the gunicorn master process), as each sampler
+    samples every training run.
+    """
+    global SAMPLER
+    with SAMPLER_LOCK:
+        if SAMPLER is None:
+            SAMPLER = threading.Thread(target=sample, daemon=True)
+            SAMPLER.start()
+
+
+def sample():
+    """Samples the resource usage of the running training runs every RESOURCE_SAMPLING_INTERVAL."""
+    running = set()
+    while True:
+        try:
+            running = sample_resource_usage(running)
+        except Exception:
+            logging.exception("Failed to sample the resource usage of training runs")
+        finally:
+            db_session.remove()
+        time.sleep(RESOURCE_SAMPLING_INTERVAL)
+
+
+def sample_resource_usage(previously_running):
+    """Records the resource usage of the training workflows that are running.
+
+    The workflows that finished since the previous sample are read once more,
+    as their final status tells which operators were OOM killed.
+
+    Args:
+        previously_running (set): names of the workflows running in the previous sample.
+
+    Returns:
+        set: names of the workflows running now.
+    """
+    load_kube_config()
+    custom_api = client.CustomObjectsApi()
+    workflows = custom_api.list_namespaced_custom_object(
+        'argoproj.io',
+        'v1alpha1',
+        KF_PIPELINES_NAMESPACE,
+        'workflows',
+        label_selector=f'{RUN_ID_LABEL},{COMPLETED_LABEL}!=true',
+    )['items']
+    running = {workflow['metadata']['name'] for workflow in workflows}
+
+    for name in previously_running - running:
+        try:
+            workflows.append(custom_api.get_namespaced_custom_object(
+                'argoproj.io', 'v1alpha1', KF_PIPELINES_NAMESPACE, 'workflows', name))
+        except ApiException:
+            pass
+
+    for workflow in workflows:
+        if workflow['metadata'].get('generateName') != 'common-pipeline-':
+            continue
+        try:
+            record_resource_usage(workflow['metadata']['labels'][RUN_ID_LABEL], workflow)
+        except Exception:
+            logging.exception("Failed to record the resource usage of workflow %s", workflow['metadata']['name'])
+    return running
+
+
+def record_resource_usage(run_id, workflow_manifest):
+    """Samples the resource usage of the operators of a training run.
+
+    Keeps the peak CPU and memory seen for each operator and whether it was OOM killed.
+
+    Args:
+        run_id (str): the run id.
+        workflow_manifest (dict): the Argo workflow of the run.
+    """
+    nodes = workflow_manifest.get('status', {}).get('nodes', {})
+    if not nodes:
+        return
+
+    pod_metrics = list_pod_metrics(workflow_manifest['metadata']['name'])
+
+    try:
+        for node in nodes.values():
+            if node.get('type') != 'Pod':
+                continue
+
+            operator_id = str(node['displayName'])
+            cpu, memory = pod_metrics.get(node['id'], (0, 0))
+            oom_killed = 'OOMKilled' in str(node.get('message', ''))
+            if not (cpu or memory or oom_killed):
+                continue
+
+            usage = ResourceUsage.query.get((run_id, operator_id))
+            if usage is None:
+                task_id = get_operator_task_id(workflow_manifest, operator_id)
+                if not task_id or Task.query.get(task_id) is None:
+                    continue
+                usage = ResourceUsage(run_id=run_id,
+                                      operator_id=operator_id,
+                                      task_id=task_id,
+                                      cpu=0,
+                                      memory=0,
+                                      memory_limit=get_operator_memory_limit(workflow_manifest, operator_id),
+                                      oom_killed=False)
+                db_session.add(usage)
+
+            usage.cpu = max(usage.cpu, cpu)
+            usage.memory = max(usage.memory, int(memory))
+            usage.oom_killed = usage.oom_killed or oom_killed
+            usage.updated_at = datetime.utcnow()
+        db_session.commit()
+    except SQLAlchemyError:
+        db_session.rollback()
+
+
+def recommend_resources(task_id):
+    """Right-sized requests and limits for a task, learned from its latest runs.
+
+    Requests are the peak usage plus RIGHT_SIZING_HEADROOM. The memory limit is
+    doubled whenever a recent run was OOM killed.
+
+    Args:
+        task_id (str): the task uuid.
+
+    Returns:
+        dict: the recommended resources, or None if the task has no usage history.
+    """
+    usages = db_session.query(ResourceUsage) \
+        .filter_by(task_id=task_id) \
+        .order_by(ResourceUsage.updated_at.desc()) \
+        .limit(RIGHT_SIZING_HISTORY) \
+        .all()
+    if not usages:
+        return None
+
+    cpu = max(MIN_CPU, max(u.cpu for u in usages) * (1 + RIGHT_SIZING_HEADROOM))
+    memory = max(MIN_MEMORY, max(u.memory for u in usages) * (1 + RIGHT_SIZING_HEADROOM))
+
+    memory_limit = 2 * memory
+    for usage in usages:
+        if usage.oom_killed and usage.memory_limit:
+            memory_limit = max(memory_limit, 2 * usage.memory_limit)
+
+    return {
+        'requests': {
+            'cpu': f'{math.ceil(cpu * 1000)}m',
+            'memory': f'{math.ceil(memory / 2**20)}Mi',
+        },
+        'limits': {
+            'cpu': f'{math.ceil(2 * cpu * 1000)}m',
+            'memory': f'{math.ceil(memory_limit / 2**20)}Mi',
+        },
+    }
+
+
+def get_task_resources(task):
+    """Get the resource profile to run a task with.
+
+    When RESOURCE_RIGHT_SIZING is enabled, recommended requests and limits are
+    used for every value the task profile does not set.
+
+    Args:
+        task (obj): task model.
+
+    Returns:
+        dict: the resource profile.
+    """
+    profile = get_resources_profile(task.uuid)
+    if not RESOURCE_RIGHT_SIZING:
+        return profile
+
+    resources = recommend_resources(task.uuid)
+    if not resources:
+        return profile
+
+    profile = profile or {}
+    for key, value in profile.items():
+        if isinstance(value, dict):
+            resources[key] = {**resources.get(key, {}), **value}
+        else:
+            resources[key] = value
+
+    # a recommended limit below a request of the profile would make an invalid pod spec
+    for name, request in resources['requests'].items():
+        limit = resources['limits'].get(name)
+        if name in profile.get('limits', {}) or limit is None:
+            continue
+        if parse_quantity(str(limit)) < parse_quantity(str(request)):
+            resources['limits'][name] = request
+    return resources
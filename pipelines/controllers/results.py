@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+from os import getenv
+
+from werkzeug.exceptions import BadRequest, HTTPException
+
+from pipelines.concurrency import map_concurrently
+from pipelines.controllers.figures import list_figures
+from pipelines.controllers.metrics import list_metrics
+from pipelines.controllers.utils import is_run_immutable
+
+MAX_RESULTS = int(getenv("MAX_RESULTS", "200"))
+
+RESULT_KINDS = {
+    "metrics": list_metrics,
+    "figures": list_figures,
+}
+
+
+def list_results(experiment_id, operators, kinds=None):
+    """Lists the metrics and figures of many operator runs at once.
+
+    The results are fetched concurrently from the object storage. A result
+    that can't be fetched is reported in errors, without failing the others.
+
+    Args:
+        experiment_id (str): the experiment uuid.
+        operators (list): dicts with operatorId and runId.
+        kinds (list): metrics and/or figures. Defaults to both.
+    Returns:
+        A dict with the results of each operator run and the errors.
+    """
+    kinds = kinds or list(RESULT_KINDS.keys())
+    if not isinstance(operators, list) or not operators:
+        raise BadRequest("operators is required")
+    if any(kind not in RESULT_KINDS for kind in kinds):
+        raise BadRequest(f"kinds must be in {list(RESULT_KINDS.keys())}")
+    if len(operators) * len(kinds) > MAX_RESULTS:
+        raise BadRequest(f"Too many results. The limit is {MAX_RESULTS}")
+
+    for operator in operators:
+        if not isinstance(operator, dict) or "operatorId" not in operator or "runId" not in operator:
+            raise BadRequest("Each operator must have an operatorId and a runId")
+
+    calls = [(operator["operatorId"], operator["runId"], kind) for operator in operators for kind in kinds]
+
+    # the status of each run is asked to KFP once
+    run_ids = list({run_id for _, run_id, _ in calls})
+    immutable_runs = dict(zip(run_ids, map_concurrently(is_run_immutable, run_ids)))
+
+    def fetch(call):
+        operator_id, run_id, kind = call
+        try:
+            return RESULT_KINDS[kind](experiment_id=experiment_id,
+                                      operator_id=operator_id,
+                                      run_id=run_id,
+                                      immutable=immutable_runs[run_id]), None
+        except HTTPException as e:
+            return None, e.description
+        except Exception as e:
+            return None, str(e)
+
+    results = {}
+    errors = []
+    for (operator_id, run_id, kind), (value, error) in zip(calls, map_concurrently(fetch, calls)):
+        result = results.setdefault((operator_id, run_id), {"operatorId": operator_id, "runId": run_id})
+        if error is None:
+            result[kind] = value
+        else:
+            errors.append({"operatorId": operator_id, "runId": run_id, "kind": kind, "message": error})
+
+    return {"results": list(results.values()), "errors": errors}
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+from collections import Counter
+from datetime import datetime, timedelta
+from os import getenv
+
+from sqlalchemy import or_
+
+from pipelines.controllers.utils import RUN_COMPLETED_STATUSES, init_pipeline_client
+from pipelines.database import db_session
+from pipelines.models import Submission
+
+# 0 disables the cap
+MAX_RUNNING_RUNS = int(getenv('MAX_RUNNING_RUNS', '0'))
+MAX_RUNNING_RUNS_PER_PROJECT = int(getenv('MAX_RUNNING_RUNS_PER_PROJECT', '0'))
+# compiling and uploading a run that takes longer than this is considered lost
+SUBMISSION_TIMEOUT = int(getenv('SUBMISSION_TIMEOUT', '600'))
+
+
+def caps_enabled():
+    """Whether any concurrency cap is set.
+
+    Returns:
+        bool
+    """
+    return bool(MAX_RUNNING_RUNS or MAX_RUNNING_RUNS_PER_PROJECT)
+
+
+def refresh_active_runs():
+    """Marks the submitted runs that KFP reports as finished as completed.
+
+    Submissions that are compiling for longer than SUBMISSION_TIMEOUT are failed.
+    """
+    now = datetime.utcnow()
+    db_session.query(Submission) \
+        .filter_by(status='Running') \
+        .filter(Submission.updated_at < now - timedelta(seconds=SUBMISSION_TIMEOUT)) \
+        .update({'status': 'Failed', 'message': 'Submission timed out', 'updated_at': now},
+                synchronize_session=False)
+
+    # completions only matter to the caps
+    submitted = []
+    if caps_enabled():
+        submitted = db_session.query(Submission) \
+            .filter_by(status='Succeeded', completed_at=None) \
+            .all()
+    if submitted:
+        client = init_pipeline_client()
+        for submission in submitted:
+            try:
+                status = client.get_run(submission.run_id).run.status
+            except Exception:
+                continue
+            if status in RUN_COMPLETED_STATUSES:
+                submission.completed_at = now
+    db_session.commit()
+
+
+def count_active_runs():
+    """Counts the runs that are compiling or running in KFP.
+
+    Returns:
+        collections.Counter: number of active runs by project id.
+    """
+    rows = db_session.query(Submission.project_id) \
+        .filter(or_(Submission.status == 'Running',
+                    (Submission.status == 'Succeeded') & (Submission.completed_at.is_(None)))) \
+        .all()
+    return Counter(project_id for project_id, in rows)
+
+
+def has_capacity(active_runs, project_id):
+    """Whether another run of a project fits the concurrency caps.
+
+    Args:
+        active_runs (collections.Counter): number of active runs by project id.
+        project_id (str): the project uuid.
+
+    Returns:
+        bool
+    """
+    if MAX_RUNNING_RUNS and sum(active_runs.values()) >= MAX_RUNNING_RUNS:
+        return False
+    if MAX_RUNNING_RUNS_PER_PROJECT and active_runs[project_id] >= MAX_RUNNING_RUNS_PER_PROJECT:
+        return False
+    return True
+
+
+def select_submissions(pending, active_runs):
+    """Choose the pending submissions that can start now.
+
+    Higher priorities go first. Among equal priorities, the project with
+    fewer active runs goes first (fair share), then the oldest submission.
+
+    Args:
+        pending (list): pending submissions.
+        active_runs (collections.Counter): number of active runs by project id.
+            It is updated with the selected submissions.
+
+    Returns:
+        list: the submissions to start, in order.
+    """
+    pending = list(pending)
+    selected = []
+    while pending:
+        candidates = [s for s in pending if has_capacity(active_runs, s.project_id)]
+        if not candidates:
+            break
+        submission = min(candidates,
+                         key=lambda s: (-s.priority, active_runs[s.project_id], s.created_at))
+        pending.remove(submission)
+        active_runs[submission.project_id] += 1
+        selected.append(submission)
+    return selected
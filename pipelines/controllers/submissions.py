@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from os import getenv
+
+from werkzeug.exceptions import HTTPException, NotFound, TooManyRequests
+
+from pipelines.controllers.experiment_runs import create_experiment_run, get_retried_run, \
+    retry_latest_run
+from pipelines.controllers.scheduler import caps_enabled, count_active_runs, has_capacity, \
+    refresh_active_runs, select_submissions
+from pipelines.database import db_session
+from pipelines.models import Submission
+from pipelines.models.utils import raise_if_experiment_does_not_exist, \
+    raise_if_project_does_not_exist
+from pipelines.utils import uuid_alpha
+
+SUBMISSION_WORKERS = int(getenv('SUBMISSION_WORKERS', '4'))
+SCHEDULER_INTERVAL = int(getenv('SCHEDULER_INTERVAL', '15'))
+
+EXECUTOR = ThreadPoolExecutor(SUBMISSION_WORKERS)
+DISPATCH_LOCK = threading.Lock()
+SCHEDULER = None
+SCHEDULER_WAKEUP = threading.Event()
+
+QUEUED_MESSAGE = "Too many runs. Retry later or submit with async=true to queue the run."
+
+
+def create_submission(project_id, experiment_id, use_cache=False,
+                      operator_id=None, previous_run_id=None, volume=None,
+                      priority=0):
+    """Queue an experiment run to be compiled and submitted by a worker.
+
+    The run waits in the queue while the concurrency caps are reached.
+    It is dispatched by the scheduler thread, not by the request.
+
+    Args:
+        project_id (str): project id.
+        experiment_id (str): experiment id.
+        use_cache (bool): reuse the outputs of operators that did not change since a previous run.
+        operator_id (str): run only this operator and its descendants. (optional)
+        previous_run_id (str): the run whose outputs are reused. (optional)
+        volume (dict): size, storageClass and accessMode of the training volume. (optional)
+        priority (int): queued runs with higher priority start first. (optional)
+
+    Returns:
+        The submission info.
+    """
+    raise_if_project_does_not_exist(project_id)
+    raise_if_experiment_does_not_exist(experiment_id)
+
+    submission = Submission(uuid=uuid_alpha(),
+                            project_id=project_id,
+                            experiment_id=experiment_id,
+                            use_cache=use_cache,
+                            operator_id=operator_id,
+                            previous_run_id=previous_run_id,
+                            volume=volume,
+                            priority=priority)
+    db_session.add(submission)
+    db_session.commit()
+
+    start_scheduler()
+    SCHEDULER_WAKEUP.set()
+    return get_submission(project_id, experiment_id, submission.uuid)
+
+
+def run_now(project_id, experiment_id, use_cache=False, operator_id=None,
+            previous_run_id=None, volume=None):
+    """Compile and submit an experiment run right away.
+
+    When the concurrency caps are set, the run claims a slot before it is compiled,
+    so that runs submitted concurrently can't exceed the caps.
+
+    Args:
+        project_id (str): project id.
+        experiment_id (str): experiment id.
+        use_cache (bool): reuse the outputs of operators that did not change since a previous run.
+        operator_id (str): run only this operator and its descendants. (optional)
+        previous_run_id (str): the run whose outputs are reused. (optional)
+        volume (dict): size, storageClass and accessMode of the training volume. (optional)
+
+    Returns:
+        The KFP run id.
+
+    Raises:
+        TooManyRequests: when the caps are reached or runs are queued.
+    """
+    return run_in_slot(project_id, experiment_id, create_experiment_run,
+                       project_id, experiment_id, use_cache,
+                       operator_id=operator_id,
+                       previous_run_id=previous_run_id,
+                       volume=volume)
+
+
+def retry_now(project_id, experiment_id):
+    """Re-initiate the failed run of an experiment right away.
+
+    The retried run claims a slot of the concurrency caps, as new runs do.
+
+    Args:
+        project_id (str): project id.
+        experiment_id (str): experiment id.
+
+    Returns:
+        Experiment run details.
+
+    Raises:
+        NotFound: when the latest run did not fail.
+        TooManyRequests: when the caps are reached or runs are queued.
+    """
+    run_id = run_in_slot(project_id, experiment_id, retry_latest_run, experiment_id)
+    return get_retried_run(run_id)
+
+
+def run_in_slot(project_id, experiment_id, submit, *args, **kwargs):
+    """Calls a function that starts a KFP run, within the concurrency caps.
+
+    When the caps are set, a slot is claimed before the function is called,
+    so that runs started concurrently can't exceed the caps.
+
+    Args:
+        project_id (str): project id.
+        experiment_id (str): experiment id.
+        submit (callable): starts the run and returns its KFP run id.
+        *args: positional arguments of submit.
+        **kwargs: keyword arguments of submit.
+
+    Returns:
+        The KFP run id.
+
+    Raises:
+        TooManyRequests: when the caps are reached or runs are queued.
+    """
+    if not caps_enabled():
+        return submit(*args, **kwargs)
+
+    submission = claim_slot(project_id, experiment_id)
+    try:
+        run_id = submit(*args, **kwargs)
+    except HTTPException as e:
+        db_session.rollback()
+        update_submission(submission, "Failed", message=e.description)
+        raise
+    except Exception as e:
+        db_session.rollback()
+        update_submission(submission, "Failed", message=str(e))
+        raise
+    update_submission(submission, "Succeeded", run_id=run_id)
+    return run_id
+
+
+def claim_slot(project_id, experiment_id):
+    """Claims a slot of the concurrency caps for a run started synchronously.
+
+    The slot is a Running submission. It is inserted before the caps are counted,
+    so that concurrent claims, in this or other API processes, see each other.
+
+    Args:
+        project_id (str): project id.
+        experiment_id (str): experiment id.
+
+    Returns:
+        The Submission that holds the slot.
+
+    Raises:
+        TooManyRequests: when the caps are reached or runs are queued.
+    """
+    start_scheduler()
+    with DISPATCH_LOCK:
+        pending = db_session.query(Submission.uuid).filter_by(status='Pending').first()
+        if pending is not None:
+            raise TooManyRequests(QUEUED_MESSAGE)
+
+        submission = Submission(uuid=uuid_alpha(),
+                                project_id=project_id,
+                                experiment_id=experiment_id,
+                                status='Running')
+        db_session.add(submission)
+        db_session.commit()
+
+        active_runs = count_active_runs()
+        active_runs[project_id] -= 1
+        if not has_capacity(active_runs, project_id):
+            db_session.delete(submission)
+            db_session.commit()
+            raise TooManyRequests(QUEUED_MESSAGE)
+    return submission
+
+
+def dispatch():
+    """Starts the pending submissions that fit the concurrency caps."""
+    with DISPATCH_LOCK:
+        refresh_active_runs()
+        pending = db_session.query(Submission) \
+            .filter_by(status='Pending') \
+            .all()
+        for submission in select_submissions(pending, count_active_runs()):
+            # claims the submission, as other API processes dispatch too
+            claimed = db_session.query(Submission) \
+                .filter_by(uuid=submission.uuid, status='Pending') \
+                .update({'status': 'Running', 'updated_at': datetime.utcnow()},
+                        synchronize_session=False)
+            db_session.commit()
+            if claimed:
+                EXECUTOR.submit(run_submission, submission.uuid)
+
+
+def schedule():
+    """Dispatches queued runs as KFP reports completions, and when runs are queued."""
+    while True:
+        SCHEDULER_WAKEUP.wait(SCHEDULER_INTERVAL)
+        SCHEDULER_WAKEUP.clear()
+        try:
+            dispatch()
+        except Exception:
+            logging.exception("Failed to dispatch the queued runs")
+        finally:
+            db_session.remove()
+
+
+def start_scheduler():
+    """Starts the scheduler thread, once per process."""
+    global SCHEDULER
+    with DISPATCH_LOCK:
+        if SCHEDULER is None:
+            SCHEDULER = threading.Thread(target=schedule, daemon=True)
+            SCHEDULER.start()
+
+
+def run_submission(submission_id):
+    """Compile and submit a queued experiment run.
+
+    Runs in a worker thread, with its own database session.
+
+    Args:
+        submission_id (str): the submission uuid.
+    """
+    try:
+        submission = Submission.query.get(submission_id)
+
+        try:
+            run_id = create_experiment_run(submission.project_id,
+                                           submission.experiment_id,
+                                           submission.use_cache,
+                                           operator_id=submission.operator_id,
+                                           previous_run_id=submission.previous_run_id,
+                                           volume=submission.volume)
+        except HTTPException as e:
+            db_session.rollback()
+            update_submission(submission, "Failed", message=e.description)
+            dispatch()
+        except Exception as e:
+            db_session.rollback()
+            update_submission(submission, "Failed", message=str(e))
+            dispatch()
+        else:
+            update_submission(submission, "Succeeded", run_id=run_id)
+    finally:
+        db_session.remove()
+
+
+def update_submission(submission, status, **kwargs):
+    """Updates the status of a submission.
+
+    Args:
+        submission (Submission): the submission.
+        status (str): Pending, Running, Succeeded or Failed.
+        **kwargs: arbitrary keyword arguments.
+    """
+    submission.status = status
+    for key, value in kwargs.items():
+        setattr(submission, key, value)
+    submission.updated_at = datetime.utcnow()
+    db_session.commit()
+
+
+def get_submission(project_id, experiment_id, submission_id):
+    """Details a submission. When it succeeds, runId is the KFP run id.
+
+    Args:
+        project_id (str): project id.
+        experiment_id (str): experiment id.
+        submission_id (str): the submission uuid.
+
+    Returns:
+        The submission info.
+    """
+    submission = Submission.query.get(submission_id)
+    if submission is None or submission.experiment_id != experiment_id \
+            or submission.project_id != project_id:
+        raise NotFound("The specified submission does not exist")
+    return submission.as_dict()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+
+from werkzeug.exceptions import BadRequest, NotFound
+
+from pipelines.controllers.utils import validate_resources
+from pipelines.database import db_session
+from pipelines.models import Task, TaskResources
+
+
+def raise_if_task_does_not_exist(task_id):
+    """Raises an exception if the specified task does not exist.
+
+    Args:
+        task_id (str): the task uuid.
+    """
+    if Task.query.get(task_id) is None:
+        raise NotFound("The specified task does not exist")
+
+
+def get_resources_profile(task_id):
+    """Get the resource profile of a task.
+
+    Profiles are kept by this service, the tasks table belongs to the projects service.
+
+    Args:
+        task_id (str): the task uuid.
+
+    Returns:
+        dict: the resource profile, or None if the task has none.
+    """
+    task_resources = TaskResources.query.get(task_id)
+    if task_resources is None:
+        return None
+    return task_resources.resources
+
+
+def get_task_resources_profile(task_id):
+    """Details the resource profile of a task.
+
+    Args:
+        task_id (str): the task uuid.
+
+    Returns:
+        dict: the resource profile, empty if the task has none.
+    """
+    raise_if_task_does_not_exist(task_id)
+    return get_resources_profile(task_id) or {}
+
+
+def update_task_resources_profile(task_id, resources):
+    """Sets the resource profile of a task.
+
+    Args:
+        task_id (str): the task uuid.
+        resources (dict): requests, limits, nodeSelector and tolerations.
+
+    Returns:
+        dict: the resource profile.
+    """
+    raise_if_task_does_not_exist(task_id)
+
+    if not isinstance(resources, dict) or not validate_resources(resources):
+        raise BadRequest("Invalid resources.")
+
+    task_resources = TaskResources.query.get(task_id)
+    if task_resources is None:
+        task_resources = TaskResources(task_id=task_id, resources=resources)
+        db_session.add(task_resources)
+    else:
+        task_resources.resources = resources
+        task_resources.updated_at = datetime.utcnow()
+    db_session.commit()
+    return task_resources.resources
+
+
+def delete_task_resources_profile(task_id):
+    """Removes the resource profile of a task. Its runs use the service defaults again.
+
+    Args:
+        task_id (str): the task uuid.
+
+    Returns:
+        dict: a success message.
+    """
+    raise_if_task_does_not_exist(task_id)
+
+    db_session.query(TaskResources).filter_by(task_id=task_id).delete()
+    db_session.commit()
+    return {"message": "Resource profile deleted"}
@@ -4,8 +4,11 @@ import base64
 import json
 import re
 import yaml
+from collections import OrderedDict
+from datetime import datetime
 from os import getenv
 from itertools import chain
+from threading import Lock
 
 from kfp import Client
 from kubernetes import config, client
@@ -16,6 +19,32 @@ from werkzeug.exceptions import BadRequest, InternalServerError
 
 TRAINING_DATASETS_DIR = '/tmp/data'
 TRAINING_DATASETS_VOLUME_NAME = 'vol-tmp-data'
+TRAINING_DATASETS_STAGING_NAME = 'stage-dataset'
+
+RUN_COMPLETED_STATUSES = ['Succeeded', 'Failed', 'Error', 'Skipped', 'Terminated']
+
+# failed, errored and terminated runs may be retried, their outputs may still change
+RUN_IMMUTABLE_STATUSES = ['Succeeded', 'Skipped']
+
+# run ids that KFP reported as immutable
+IMMUTABLE_RUNS_CACHE_SIZE = int(getenv('IMMUTABLE_RUNS_CACHE_SIZE', '4096'))
+IMMUTABLE_RUNS = OrderedDict()
+IMMUTABLE_RUNS_LOCK = Lock()
+
+# KFP does not return more runs at once
+MAX_RUNS_PAGE_SIZE = 100
+DATE_FORMATS = ['%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%d']
+
+# runs are named "<kind>-<experiment or deployment uuid>", so KFP filters them by kind
+TRAINING_RUN = 'training'
+DEPLOYMENT_RUN = 'deployment'
+RUN_KINDS = [TRAINING_RUN, DEPLOYMENT_RUN]
+
+QUANTITY_SUFFIXES = {
+    'n': 1e-9, 'u': 1e-6, 'm': 1e-3, '': 1,
+    'k': 1e3, 'M': 1e6, 'G': 1e9, 'T': 1e12, 'P': 1e15, 'E': 1e18,
+    'Ki': 2**10, 'Mi': 2**20, 'Gi': 2**30, 'Ti': 2**40, 'Pi': 2**50, 'Ei': 2**60,
+}
 
 
 def init_pipeline_client():
@@ -28,6 +57,193 @@ def init_pipeline_client():
                   namespace=getenv('KF_PIPELINES_NAMESPACE', 'deployments'))
 
 
+def is_run_immutable(run_id):
+    """Whether a run finished and can't be retried. Its outputs don't change anymore.
+
+    Args:
+        run_id (str): the run id, or "latest".
+
+    Returns:
+        bool
+    """
+    if run_id == 'latest':
+        return False
+
+    with IMMUTABLE_RUNS_LOCK:
+        if run_id in IMMUTABLE_RUNS:
+            IMMUTABLE_RUNS.move_to_end(run_id)
+            return True
+
+    try:
+        status = init_pipeline_client().get_run(run_id).run.status
+    except Exception:
+        return False
+
+    if status not in RUN_IMMUTABLE_STATUSES:
+        return False
+
+    with IMMUTABLE_RUNS_LOCK:
+        IMMUTABLE_RUNS[run_id] = True
+        if len(IMMUTABLE_RUNS) > IMMUTABLE_RUNS_CACHE_SIZE:
+            IMMUTABLE_RUNS.popitem(last=False)
+    return True
+
+
+def parse_date(value):
+    """Parses a date given as YYYY-MM-DD or YYYY-MM-DDTHH:MM:SSZ (UTC).
+
+    Args:
+        value (str): the date.
+
+    Returns:
+        datetime
+
+    Raises:
+        BadRequest: if the date is invalid.
+    """
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    raise BadRequest(f'Invalid date: {value}. Use YYYY-MM-DD or YYYY-MM-DDTHH:MM:SSZ')
+
+
+def get_run_name(kind, experiment_id):
+    """The name of a new run, which tells its kind.
+
+    Args:
+        kind (str): TRAINING_RUN or DEPLOYMENT_RUN.
+        experiment_id (str): the experiment (or deployment) uuid.
+
+    Returns:
+        str
+    """
+    return f'{kind}-{experiment_id}'
+
+
+def is_run_of_kind(run, kind):
+    """Whether a run is a training or a deployment.
+
+    Runs submitted before their names told the kind are named after the
+    experiment uuid only. Their kind is found in the workflow manifest.
+
+    Args:
+        run (ApiRun): the run.
+        kind (str): TRAINING_RUN or DEPLOYMENT_RUN.
+
+    Returns:
+        bool
+    """
+    for run_kind in RUN_KINDS:
+        if run.name.startswith(f'{run_kind}-'):
+            return run_kind == kind
+
+    manifest = run.pipeline_spec.workflow_manifest
+    if kind == DEPLOYMENT_RUN:
+        return 'SeldonDeployment' in manifest
+    return json.loads(manifest)['metadata']['generateName'] == 'common-pipeline-'
+
+
+def build_runs_filter(created_after=None, created_before=None, kind=None, experiment_id=None):
+    """Builds a KFP filter of runs by creation date and kind.
+
+    Args:
+        created_after (str): only runs created at or after this date. (optional)
+        created_before (str): only runs created before this date. (optional)
+        kind (str): only runs of this kind, and runs that don't tell their kind. (optional)
+        experiment_id (str): the experiment (or deployment) uuid. Required by kind.
+
+    Returns:
+        str: the filter as JSON, or None.
+    """
+    predicates = []
+    if created_after:
+        predicates.append({'key': 'created_at', 'op': 'GREATER_THAN_EQUALS',
+                           'timestamp_value': parse_date(created_after).strftime(DATE_FORMATS[0])})
+    if created_before:
+        predicates.append({'key': 'created_at', 'op': 'LESS_THAN',
+                           'timestamp_value': parse_date(created_before).strftime(DATE_FORMATS[0])})
+    if kind:
+        names = [get_run_name(kind, experiment_id), experiment_id]
+        predicates.append({'key': 'name', 'op': 'IN', 'string_values': {'values': names}})
+    if not predicates:
+        return None
+    return json.dumps({'predicates': predicates})
+
+
+def encode_page_token(kfp_page_token, offset, kfp_page_size):
+    """The cursor of the next page: a KFP page and how many of its runs were returned already."""
+    cursor = json.dumps([kfp_page_token, offset, kfp_page_size])
+    return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+
+def decode_page_token(page_token):
+    """Decodes a cursor made by encode_page_token.
+
+    Raises:
+        BadRequest: if the cursor is invalid.
+    """
+    try:
+        kfp_page_token, offset, kfp_page_size = json.loads(base64.urlsafe_b64decode(page_token.encode()))
+        return str(kfp_page_token), int(offset), int(kfp_page_size)
+    except (ValueError, TypeError):
+        raise BadRequest('Invalid page token')
+
+
+def list_runs_page(client, experiment_id, accept, page_size=MAX_RUNS_PAGE_SIZE, page_token=None,
+                   runs_filter=None):
+    """Lists a page of the runs of an experiment, newest first.
+
+    KFP pages are read until page_size runs are accepted. The next cursor
+    resumes after the last accepted run, even in the middle of a KFP page.
+
+    Args:
+        client (kfp.Client): kfp client.
+        experiment_id (str): the KFP experiment id.
+        accept (callable): whether a run is listed.
+        page_size (int): max number of runs. (optional)
+        page_token (str): the cursor returned with the previous page. (optional)
+        runs_filter (str): a KFP filter, see build_runs_filter. (optional)
+
+    Returns:
+        tuple: the runs and the cursor of the next page (None on the last page).
+
+    Raises:
+        BadRequest: if page_size or page_token are invalid.
+    """
+    if not 1 <= page_size <= MAX_RUNS_PAGE_SIZE:
+        raise BadRequest(f'The page size must be between 1 and {MAX_RUNS_PAGE_SIZE}')
+
+    kfp_page_token, offset, kfp_page_size = '', 0, page_size
+    if page_token:
+        kfp_page_token, offset, kfp_page_size = decode_page_token(page_token)
+
+    runs = []
+    while True:
+        response = client.runs.list_runs(page_token=kfp_page_token,
+                                         page_size=kfp_page_size,
+                                         sort_by='created_at desc',
+                                         resource_reference_key_type='EXPERIMENT',
+                                         resource_reference_key_id=experiment_id,
+                                         filter=runs_filter)
+        page = response.runs or []
+        for index in range(offset, len(page)):
+            if not accept(page[index]):
+                continue
+            runs.append(page[index])
+            if len(runs) == page_size:
+                if index + 1 < len(page):
+                    return runs, encode_page_token(kfp_page_token, index + 1, kfp_page_size)
+                if response.next_page_token:
+                    return runs, encode_page_token(response.next_page_token, 0, kfp_page_size)
+                return runs, None
+
+        if not response.next_page_token:
+            return runs, None
+        kfp_page_token, offset = response.next_page_token, 0
+
+
 def load_kube_config():
     try:
         config.load_kube_config()  # default is ~/.kube/config
@@ -51,6 +267,24 @@ parameter_schema = Schema({
 })
 
 
+def parse_quantity(quantity):
+    """Converts a kubernetes quantity to a number.
+
+    Args:
+        quantity (str): a quantity, eg. '500m', '2Gi' or '12345n'.
+
+    Returns:
+        float: cores for CPU quantities, bytes for memory quantities.
+
+    Raises:
+        ValueError: if quantity is not valid.
+    """
+    match = re.match(r'^([0-9.]+)([a-zA-Z]*)$', str(quantity))
+    if not match or match.group(2) not in QUANTITY_SUFFIXES:
+        raise ValueError(f'Invalid quantity: {quantity}')
+    return float(match.group(1)) * QUANTITY_SUFFIXES[match.group(2)]
+
+
 def remove_ansi_escapes(traceback):
     compiler = re.compile(r'(\x9B|\x1B\[)[0-?]*[ -\/]*[@-~]')
     readable_text = [compiler.sub('', line).split('\n') for line in traceback]
@@ -86,6 +320,44 @@ def validate_parameters(parameters):
         return False
 
 
+resources_schema = Schema({
+    Optional('requests'): {str: Or(str, int, float)},
+    Optional('limits'): {str: Or(str, int, float)},
+    Optional('nodeSelector'): {str: str},
+    Optional('tolerations'): [{str: Or(str, int)}],
+})
+
+
+def validate_resources(resources):
+    try:
+        resources_schema.validate(resources)
+        requests = {name: parse_quantity(value) for name, value in resources.get('requests', {}).items()}
+        limits = {name: parse_quantity(value) for name, value in resources.get('limits', {}).items()}
+        # kubernetes rejects pods that request more than their limit
+        if any(name in limits and request > limits[name] for name, request in requests.items()):
+            return False
+        return True
+    except (SchemaError, ValueError):
+        return False
+
+
+volume_schema = Schema({
+    Optional('size'): str,
+    Optional('storageClass'): str,
+    Optional('accessMode'): Or('ReadWriteOnce', 'ReadWriteMany'),
+})
+
+
+def validate_volume(volume):
+    try:
+        volume_schema.validate(volume)
+        if 'size' in volume:
+            parse_quantity(volume['size'])
+        return True
+    except (SchemaError, ValueError):
+        return False
+
+
 operator_schema = Schema({
     'operatorId': str,
     'notebookPath': Or(str, None),
@@ -93,7 +365,8 @@ operator_schema = Schema({
     'commands': list,
     'arguments': list,
     Optional('parameters'): list,
-    Optional('dependencies'): list
+    Optional('dependencies'): list,
+    Optional('resources'): Or(None, resources_schema),
 })
 
 
@@ -118,12 +391,35 @@ def format_pipeline_run_details(run_details):
     workflow_manifest = json.loads(
         run_details.pipeline_runtime.workflow_manifest)
 
+    operators_status = get_operators_status(workflow_manifest)
+
     if 'nodes' not in workflow_manifest['status']:
         # nodes are creating, returns the tasks with no dependencies as Pending
+        return {'operators': dict((name, {'status': status}) for name, status in operators_status.items())}
+
+    operators = {}
+    for display_name, status in operators_status.items():
+        operator = {}
+        operator['status'] = status
+        operator['parameters'] = get_operator_parameters(workflow_manifest, display_name)
+        operators[display_name] = operator
+    return {"operators": operators}
+
+
+def get_operators_status(workflow_manifest):
+    """Get the status of each operator of a training run.
+
+    Args:
+        workflow_manifest (dict): the Argo workflow of the run.
+
+    Returns:
+        dict: status by operator id.
+    """
+    if 'nodes' not in workflow_manifest['status']:
+        # nodes are creating, the tasks with no dependencies are Pending
         template = list(filter(lambda t: t['name'] == 'common-pipeline', workflow_manifest['spec']['templates']))[0]
         tasks = filter(lambda t: 'dependencies' not in t, template['dag']['tasks'])
-        status = dict((t['name'], {'status': 'Pending'}) for t in tasks)
-        return {'operators': status}
+        return dict((t['name'], 'Pending') for t in tasks)
 
     nodes = workflow_manifest['status']['nodes']
 
@@ -132,16 +428,13 @@ def format_pipeline_run_details(run_details):
     for index, node in enumerate(nodes.values()):
         if index != 0:
             display_name = str(node['displayName'])
-            if TRAINING_DATASETS_VOLUME_NAME != display_name:
-                operator = {}
+            if display_name not in (TRAINING_DATASETS_VOLUME_NAME, TRAINING_DATASETS_STAGING_NAME):
                 # check if pipeline was interrupted
                 if 'message' in node and str(node['message']) == 'terminated':
-                    operator['status'] = 'Terminated'
+                    operators_status[display_name] = 'Terminated'
                 else:
-                    operator['status'] = str(node['phase'])
-                operator['parameters'] = get_operator_parameters(workflow_manifest, display_name)
-                operators_status[display_name] = operator
-    return {"operators": operators_status}
+                    operators_status[display_name] = str(node['phase'])
+    return operators_status
 
 
 def get_operator_parameters(workflow_manifest, operator):
@@ -152,9 +445,10 @@ def get_operator_parameters(workflow_manifest, operator):
             args = template['container']['args']
             for arg in args:
                 if 'papermill' in arg:
-                    # split the arg and get base64 parameters in fifth position
+                    # split the arg and get base64 parameters in the fourth position after papermill
                     splited_arg = arg.split()
-                    base64_parameters = splited_arg[4].replace(';', '')
+                    index = splited_arg.index('papermill')
+                    base64_parameters = splited_arg[index + 4].replace(';', '')
                     # decode base64 parameters
                     parameters = base64.b64decode(base64_parameters).decode()
                     # replace \n- to make list parameter to be in same line
@@ -214,7 +508,8 @@ def get_operator_task_id(workflow_manifest, operator):
             for arg in args:
                 if 'papermill' in arg:
                     splited_arg = arg.split()
-                    task_id = splited_arg[1] \
+                    index = splited_arg.index('papermill')
+                    task_id = splited_arg[index + 1] \
                         .replace('s3://anonymous/tasks/', '') \
                         .replace('/Experiment.ipynb', '')
                     return task_id
@@ -286,6 +581,38 @@ def check_pvc_is_bound(name, namespace):
         return False
 
 
+def get_pvc_spec(name, namespace):
+    """Get the spec of an existing PersistentVolumeClaim.
+
+    Args:
+        name (str): the claim name.
+        namespace (str): the claim namespace.
+
+    Returns:
+        dict: accessModes, resources and storageClassName, or None if the claim does not exist.
+    """
+    load_kube_config()
+    v1 = client.CoreV1Api()
+    try:
+        volume = v1.read_namespaced_persistent_volume_claim(name=name, namespace=namespace)
+    except ApiException as e:
+        if e.status == 404:
+            return None
+        raise
+
+    spec = {
+        'accessModes': volume.spec.access_modes,
+        'resources': {
+            'requests': {
+                'storage': volume.spec.resources.requests['storage']
+            }
+        }
+    }
+    if volume.spec.storage_class_name:
+        spec['storageClassName'] = volume.spec.storage_class_name
+    return spec
+
+
 def remove_non_deployable_operators(operators: list):
     """Removes operators that are not part of the deployment pipeline.
     If the non-deployable operator is dependent on another operator, it will be
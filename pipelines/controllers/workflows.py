@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""Follows the status of training runs with a single watch on Argo workflows."""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from kubernetes import client, watch
+from kubernetes.client.rest import ApiException
+
+from pipelines.controllers.experiment_runs import get_run_status
+from pipelines.controllers.utils import RUN_COMPLETED_STATUSES, get_operators_status, load_kube_config
+
+KF_PIPELINES_NAMESPACE = os.getenv('KF_PIPELINES_NAMESPACE', 'deployments')
+# a watch request is renewed after this time
+WORKFLOW_WATCH_TIMEOUT = int(os.getenv('WORKFLOW_WATCH_TIMEOUT', '300'))
+RUN_STATUS_KEEPALIVE = int(os.getenv('RUN_STATUS_KEEPALIVE', '15'))
+
+RUN_ID_LABEL = 'pipeline/runid'
+
+# status of the runs that are not done yet, and the queues of their clients, by run id
+WORKFLOWS = {}
+SUBSCRIBERS = defaultdict(set)
+LOCK = threading.Lock()
+WATCHER = None
+WATCHING = threading.Event()
+
+
+def start_watcher():
+    """Starts the watcher thread, once per process."""
+    global WATCHER
+    with LOCK:
+        if WATCHER is None:
+            WATCHER = threading.Thread(target=watch_workflows, daemon=True)
+            WATCHER.start()
+
+
+def watch_workflows():
+    """Watches the Argo workflows of KF_PIPELINES_NAMESPACE and publishes their status.
+
+    The watch is resumed from the last resource version seen, or restarted
+    with a full list when that version expired.
+    """
+    resource_version = None
+    while True:
+        try:
+            load_kube_config()
+            custom_api = client.CustomObjectsApi()
+            kwargs = {} if resource_version is None else {'resource_version': resource_version}
+            events = watch.Watch().stream(custom_api.list_namespaced_custom_object,
+                                          'argoproj.io',
+                                          'v1alpha1',
+                                          KF_PIPELINES_NAMESPACE,
+                                          'workflows',
+                                          timeout_seconds=WORKFLOW_WATCH_TIMEOUT,
+                                          **kwargs)
+            WATCHING.set()
+            for event in events:
+                workflow = event['object']
+                if event['type'] == 'ERROR':
+                    # the resource version is too old
+                    resource_version = None
+                    break
+                resource_version = workflow['metadata']['resourceVersion']
+                update_workflow(event['type'], workflow)
+        except ApiException as e:
+            WATCHING.clear()
+            if e.status == 410:
+                resource_version = None
+            else:
+                logging.warning("Failed to watch the workflows of %s: %s", KF_PIPELINES_NAMESPACE, e)
+                time.sleep(RUN_STATUS_KEEPALIVE)
+        except Exception:
+            WATCHING.clear()
+            logging.exception("Failed to follow the workflows of %s", KF_PIPELINES_NAMESPACE)
+            time.sleep(RUN_STATUS_KEEPALIVE)
+
+
+def update_workflow(event_type, workflow):
+    """Stores the status of a training run and sends it to its clients when it changes.
+
+    Runs that are done are forgotten once their clients got the last status.
+
+    Args:
+        event_type (str): ADDED, MODIFIED or DELETED.
+        workflow (dict): the Argo workflow.
+    """
+    metadata = workflow['metadata']
+    run_id = metadata.get('labels', {}).get(RUN_ID_LABEL)
+    if run_id is None or metadata.get('generateName') != 'common-pipeline-':
+        return
+
+    if event_type == 'DELETED':
+        with LOCK:
+            WORKFLOWS.pop(run_id, None)
+        return
+
+    workflow.setdefault('status', {})
+    status = {
+        'runId': run_id,
+        'status': workflow['status'].get('phase') or 'Pending',
+        'operators': get_operators_status(workflow),
+    }
+
+    with LOCK:
+        if WORKFLOWS.get(run_id) == status:
+            return
+        if status['status'] in RUN_COMPLETED_STATUSES:
+            WORKFLOWS.pop(run_id, None)
+        else:
+            WORKFLOWS[run_id] = status
+        subscribers = list(SUBSCRIBERS.get(run_id, ()))
+
+    for subscriber in subscribers:
+        publish(subscriber, status)
+
+
+def publish(subscriber, status):
+    """Sends a status to a client. Only the latest status is kept for slow clients."""
+    while True:
+        try:
+            subscriber.put_nowait(status)
+            return
+        except queue.Full:
+            try:
+                subscriber.get_nowait()
+            except queue.Empty:
+                pass
+
+
+def stream_run_status(experiment_id, run_id):
+    """Follows the status of a training run and of its operators.
+
+    All clients share the watch on Argo workflows instead of polling KFP. If
+    the watch is down, the status is polled while the client is idle.
+
+    Args:
+        experiment_id (str): PlatIA experiment_id.
+        run_id (str): the run id, or "latest".
+
+    Returns:
+        A generator of Server-Sent Events: "status" when it changes, then
+        "end" when the run is done.
+    """
+    start_watcher()
+
+    # reports a missing run before the response starts
+    status = get_run_status(experiment_id, run_id)
+    run_id = status['runId']
+
+    subscriber = queue.Queue(maxsize=1)
+    with LOCK:
+        SUBSCRIBERS[run_id].add(subscriber)
+        status = WORKFLOWS.get(run_id, status)
+
+    def generate(status):
+        try:
+            yield f'event: status\ndata: {json.dumps(status)}\n\n'
+            while status['status'] not in RUN_COMPLETED_STATUSES:
+                try:
+                    update = subscriber.get(timeout=RUN_STATUS_KEEPALIVE)
+                except queue.Empty:
+                    update = None if WATCHING.is_set() else get_run_status(experiment_id, run_id)
+                if update is None or update == status:
+                    yield ': keep-alive\n\n'
+                    continue
+                status = update
+                yield f'event: status\ndata: {json.dumps(status)}\n\n'
+            yield 'event: end\ndata: {}\n\n'
+        finally:
+            with LOCK:
+                SUBSCRIBERS[run_id].discard(subscriber)
+                if not SUBSCRIBERS[run_id]:
+                    del SUBSCRIBERS[run_id]
+
+    return generate(status)
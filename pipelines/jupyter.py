@@ -1,7 +1,10 @@
+from collections import OrderedDict
 from json import loads, JSONDecodeError
 from os import getenv
 from re import compile, sub
+from threading import Lock
 
+import ijson
 from minio.error import NoSuchKey
 from requests import Session
 from requests.adapters import HTTPAdapter
@@ -9,8 +12,10 @@ from requests.exceptions import HTTPError
 from requests.packages.urllib3.util.retry import Retry
 from werkzeug.exceptions import NotFound
 
-from pipelines.controllers.utils import remove_ansi_escapes, search_for_pod_name
-from pipelines.object_storage import BUCKET_NAME, get_object
+from pipelines.controllers.utils import init_pipeline_client, remove_ansi_escapes, \
+    search_for_pod_name
+from pipelines.object_storage import BUCKET_NAME, get_object, get_object_stream
+from pipelines.resources.templates import EXECUTED_NOTEBOOK_PATH
 
 
 JUPYTER_ENDPOINT = getenv("JUPYTER_ENDPOINT", "http://server.anonymous:80/notebook/anonymous/server")
@@ -34,12 +39,21 @@ RETRY_STRATEGY = Retry(
 ADAPTER = HTTPAdapter(max_retries=RETRY_STRATEGY)
 SESSION.mount("http://", ADAPTER)
 
+OPERATOR_LOGS_CACHE_SIZE = int(getenv("OPERATOR_LOGS_CACHE_SIZE", "1024"))
+OPERATOR_LOGS_CACHE = OrderedDict()
+OPERATOR_LOGS_LOCK = Lock()
 
-def get_operator_logs(experiment_id: str, operator_id: str):
+
+def get_operator_logs(experiment_id: str, operator_id: str, run_id: str = "latest"):
     """Retrive logs from a failed operator.
+
+    Logs of finished operators of a given run id are cached, once the run
+    uploaded the executed notebook.
+
     Args:
         experiment_id (str): experiment id
         operator_id (str): operator id
+        run_id (str): run id, or "latest"
     Raises:
         NotFound: notebook does not exist.
     Returns:
@@ -47,16 +61,119 @@ def get_operator_logs(experiment_id: str, operator_id: str):
     """
     from pipelines.controllers.experiment_runs import get_experiment_run
 
+    key = (experiment_id, operator_id, run_id)
+    with OPERATOR_LOGS_LOCK:
+        if key in OPERATOR_LOGS_CACHE:
+            OPERATOR_LOGS_CACHE.move_to_end(key)
+            return OPERATOR_LOGS_CACHE[key]
+
+    # the executed notebook of a run is uploaded when its operator finishes
+    executed = True
+    run_details = None
+    try:
+        logs = read_failed_cell_logs(experiment_id, operator_id, run_id)
+    except NoSuchKey:
+        executed = False
+        logs = None
+        if run_id != "latest":
+            latest_run = get_experiment_run(experiment_id, pretty=False)
+            if latest_run and latest_run.run.id == run_id:
+                run_details = latest_run
+        # the notebook in the Jupyter server is the one of the latest run,
+        # old runs and operators that don't save outputs don't upload it
+        if run_id == "latest" or run_details is not None:
+            logs = read_jupyter_failed_cell_logs(experiment_id, operator_id)
+
+    # an operator with a failed cell has finished
+    finished = logs is not None
+    if logs is None:
+        if run_details is None and run_id == "latest":
+            run_details = get_experiment_run(experiment_id, pretty=False)
+        elif run_details is None:
+            run_details = init_pipeline_client().get_run(run_id)
+        details = loads(run_details.pipeline_runtime.workflow_manifest)
+        operator_container = search_for_pod_name(details, operator_id)
+
+        if operator_container and operator_container['status'] == 'Failed':
+            logs = {"exception": operator_container['message'],
+                    "traceback": [f"Kernel has died: {operator_container['message']}"]}
+        else:
+            logs = {"message": "Notebook finished with status completed"}
+        finished = operator_container is not None and \
+            operator_container['status'] in ['Succeeded', 'Failed', 'Error', 'Skipped']
+
+    if finished and executed and run_id != "latest":
+        with OPERATOR_LOGS_LOCK:
+            OPERATOR_LOGS_CACHE[key] = logs
+            if len(OPERATOR_LOGS_CACHE) > OPERATOR_LOGS_CACHE_SIZE:
+                OPERATOR_LOGS_CACHE.popitem(last=False)
+    return logs
+
+
+def read_failed_cell_logs(experiment_id, operator_id, run_id):
+    """Reads the error of the executed notebook of an operator.
+
+    The notebook is streamed from the object storage.
+
+    Args:
+        experiment_id (str): experiment id
+        operator_id (str): operator id
+        run_id (str): run id, or "latest"
+    Raises:
+        NoSuchKey: the run did not upload the notebook.
+    Returns:
+        dict: exception and traceback, or None if no cell failed.
+    """
+    object_name = EXECUTED_NOTEBOOK_PATH.substitute({
+        "experimentId": experiment_id,
+        "operatorId": operator_id,
+        "runId": run_id,
+    })
+    response = get_object_stream(object_name)
+    try:
+        return find_failed_cell_logs(ijson.items(response, "cells.item"))
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def read_jupyter_failed_cell_logs(experiment_id, operator_id):
+    """Reads the error of the notebook of an operator in the Jupyter server.
+
+    It is the notebook of the latest run, for runs that did not upload it.
+
+    Args:
+        experiment_id (str): experiment id
+        operator_id (str): operator id
+    Raises:
+        NotFound: notebook does not exist.
+    Returns:
+        dict: exception and traceback, or None if no cell failed.
+    """
     operator_endpoint = f"experiments/{experiment_id}/operators/{operator_id}/Experiment.ipynb"
     try:
-        r = SESSION.get(url=f"{URL_CONTENTS}/{operator_endpoint}").content
-        notebook_content = loads(r.decode("utf-8"))["content"]
+        with SESSION.get(url=f"{URL_CONTENTS}/{operator_endpoint}", stream=True) as r:
+            r.raw.decode_content = True
+            return find_failed_cell_logs(ijson.items(r.raw, "content.cells.item"))
     except HTTPError as e:
         status_code = e.response.status_code
         if status_code == 404:
             raise NotFound("The specified notebook does not exist")
+        raise
 
-    for cell in notebook_content["cells"]:
+
+def find_failed_cell_logs(cells):
+    """Finds the error of the first failed papermill cell.
+
+    Cells are consumed one at a time, so that the rest of the notebook is not
+    parsed once the failed cell is found.
+
+    Args:
+        cells (iterable): notebook cells.
+    Returns:
+        dict: exception and traceback, or None if no cell failed.
+    """
+    for cell in cells:
         try:
             metadata = cell["metadata"]["papermill"]
 
@@ -70,16 +187,6 @@ def get_operator_logs(experiment_id: str, operator_id: str):
         except KeyError:
             pass
 
-    run_details = get_experiment_run(experiment_id, pretty=False)
-    details = loads(run_details.pipeline_runtime.workflow_manifest)
-    operator_container = search_for_pod_name(details, operator_id)
-
-    if operator_container['status'] == 'Failed':
-        return {"exception": operator_container['message'],
-                "traceback": [f"Kernel has died: {operator_container['message']}"]}
-
-    return {"message": "Notebook finished with status completed"}
-
 
 def read_parameters(path):
     """Lists the parameters declared in a notebook.
@@ -2,14 +2,22 @@ from pipelines.models.compare_result import CompareResult
 from pipelines.models.deployment import Deployment
 from pipelines.models.experiment import Experiment
 from pipelines.models.operator import Operator
+from pipelines.models.operator_cache_key import OperatorCacheKey
 from pipelines.models.project import Project
+from pipelines.models.resource_usage import ResourceUsage
+from pipelines.models.submission import Submission
 from pipelines.models.task import Task
+from pipelines.models.task_resources import TaskResources
 from pipelines.models.template import Template
 
 __all__ = ['CompareResult',
            'Deployment',
            'Experiment',
            'Operator',
+           'OperatorCacheKey',
            'Project',
+           'ResourceUsage',
+           'Submission',
            'Task',
+           'TaskResources',
            'Template']
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""Operator cache key model."""
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, String
+
+from pipelines.database import Base
+from pipelines.utils import to_camel_case
+
+
+class OperatorCacheKey(Base):
+    __tablename__ = "operator_cache_keys"
+    run_id = Column(String(255), primary_key=True)
+    operator_id = Column(String(255), primary_key=True)
+    experiment_id = Column(String(255), nullable=False)
+    cache_key = Column(String(255), nullable=False, index=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<OperatorCacheKey {self.run_id} {self.operator_id}>"
+
+    def as_dict(self):
+        d = {to_camel_case(c.name): getattr(self, c.name) for c in self.__table__.columns}
+        return d
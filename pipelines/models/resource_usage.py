@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""Resource usage model."""
+from datetime import datetime
+
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Float, String
+from sqlalchemy.sql import expression
+
+from pipelines.database import Base
+from pipelines.utils import to_camel_case
+
+
+class ResourceUsage(Base):
+    __tablename__ = "resource_usages"
+    run_id = Column(String(255), primary_key=True)
+    operator_id = Column(String(255), primary_key=True)
+    task_id = Column(String(255), nullable=False)
+    cpu = Column(Float, nullable=False, default=0)
+    memory = Column(BigInteger, nullable=False, default=0)
+    memory_limit = Column(BigInteger, nullable=True)
+    oom_killed = Column(Boolean, nullable=False, server_default=expression.false())
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ResourceUsage {self.run_id} {self.operator_id}>"
+
+    def as_dict(self):
+        d = {to_camel_case(c.name): getattr(self, c.name) for c in self.__table__.columns}
+        return d
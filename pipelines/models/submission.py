@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""Submission model."""
+from datetime import datetime
+
+from sqlalchemy import Boolean, Column, DateTime, Integer, JSON, String, Text
+from sqlalchemy.sql import expression
+
+from pipelines.database import Base
+from pipelines.utils import to_camel_case
+
+
+class Submission(Base):
+    __tablename__ = "submissions"
+    uuid = Column(String(255), primary_key=True)
+    project_id = Column(String(255), nullable=False, index=True)
+    experiment_id = Column(String(255), nullable=False, index=True)
+    status = Column(String(255), nullable=False, default="Pending", index=True)
+    priority = Column(Integer, nullable=False, default=0)
+    use_cache = Column(Boolean, nullable=False, server_default=expression.false())
+    operator_id = Column(String(255), nullable=True)
+    previous_run_id = Column(String(255), nullable=True)
+    volume = Column(JSON, nullable=True)
+    run_id = Column(String(255), nullable=True)
+    message = Column(Text, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<Submission {self.uuid}>"
+
+    def as_dict(self):
+        d = {to_camel_case(c.name): getattr(self, c.name) for c in self.__table__.columns}
+        return d
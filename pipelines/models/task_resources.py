@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""Task resources model."""
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, JSON, String
+
+from pipelines.database import Base
+from pipelines.utils import to_camel_case
+
+
+class TaskResources(Base):
+    __tablename__ = "task_resources"
+    task_id = Column(String(255), primary_key=True)
+    resources = Column(JSON, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<TaskResources {self.task_id}>"
+
+    def as_dict(self):
+        d = {to_camel_case(c.name): getattr(self, c.name) for c in self.__table__.columns}
+        return d
@@ -6,14 +6,30 @@ from minio import Minio
 from minio.error import BucketAlreadyOwnedByYou
 
 BUCKET_NAME = "anonymous"
+MINIO_ENDPOINT = getenv("MINIO_ENDPOINT", "minio-service.kubeflow:9000")
+MINIO_ACCESS_KEY = getenv("MINIO_ACCESS_KEY", "minio")
+MINIO_SECRET_KEY = getenv("MINIO_SECRET_KEY", "minio123")
+MINIO_REGION_NAME = getenv("MINIO_REGION_NAME", "us-east-1")
+# secret of KF_PIPELINES_NAMESPACE with the MINIO_ACCESS_KEY and MINIO_SECRET_KEY of training operators
+MINIO_SECRET_NAME = getenv("MINIO_SECRET_NAME", "minio-credentials")
 
-MINIO_CLIENT = Minio(
-    endpoint=getenv("MINIO_ENDPOINT", "minio-service.kubeflow:9000"),
-    access_key=getenv("MINIO_ACCESS_KEY", "minio"),
-    secret_key=getenv("MINIO_SECRET_KEY", "minio123"),
-    region=getenv("MINIO_REGION_NAME", "us-east-1"),
-    secure=False,
-)
+
+def create_client():
+    """Creates a MinIO client with the config of the server.
+
+    Returns:
+        minio.Minio: the client.
+    """
+    return Minio(
+        endpoint=MINIO_ENDPOINT,
+        access_key=MINIO_ACCESS_KEY,
+        secret_key=MINIO_SECRET_KEY,
+        region=MINIO_REGION_NAME,
+        secure=False,
+    )
+
+
+MINIO_CLIENT = create_client()
 
 
 def make_bucket(name):
@@ -53,6 +69,37 @@ def get_object(source):
     return buffer.read()
 
 
+def get_object_stream(source):
+    """Get an object in MinIO, without reading it.
+
+    Args:
+        source (str): the path to source object.
+
+    Returns:
+        urllib3.response.HTTPResponse: a file-like object. The caller must
+            close and release_conn it.
+    """
+    return MINIO_CLIENT.get_object(
+        bucket_name=BUCKET_NAME,
+        object_name=source,
+    )
+
+
+def stat_object(source):
+    """Get the metadata of an object in MinIO.
+
+    Args:
+        source (str): the path to source object.
+
+    Returns:
+        minio.Object: the object metadata (etag, size, last_modified...).
+    """
+    return MINIO_CLIENT.stat_object(
+        bucket_name=BUCKET_NAME,
+        object_name=source,
+    )
+
+
 def put_object(name, data):
     """Puts an object into MinIO.
 
@@ -87,17 +134,18 @@ def duplicate_object(source, destination):
     )
 
 
-def list_objects(prefix):
+def list_objects(prefix, recursive=True):
     """Get objects from MinIO.
 
     Args:
         prefix (str): String specifying objects returned must begin with
+        recursive (bool): whether to list objects in nested directories.
     """
 
     objects = MINIO_CLIENT.list_objects(
         bucket_name=BUCKET_NAME,
         prefix=prefix,
-        recursive=True,
+        recursive=recursive,
     )
 
     return objects
@@ -124,3 +172,13 @@ def remove_objects(prefix):
     """
     for obj in MINIO_CLIENT.list_objects(BUCKET_NAME, prefix=prefix, recursive=True):
         MINIO_CLIENT.remove_object(BUCKET_NAME, obj.object_name)
+
+
+def reset_client():
+    """Replaces the MinIO client with a new one, that opens its own connections.
+
+    Must be called in forked processes, as sockets inherited from the parent
+    process can't be shared.
+    """
+    global MINIO_CLIENT
+    MINIO_CLIENT = create_client()
@@ -1,116 +1,173 @@
 # -*- coding: utf-8 -*-
 from string import Template
 
-SELDON_DEPLOYMENT = Template("""{
-    "apiVersion": "machinelearning.seldon.io/v1alpha2",
-    "kind": "SeldonDeployment",
-    "metadata": {
-        "labels": {
-            "app": "seldon"
-        },
-        "name": "$experimentId",
-        "deploymentName": "$deploymentName",
-        "namespace": "$namespace"
-    },
-    "spec": {
-        "annotations": {
-            "deployment_version": "v1",
-            "prometheus.io/scrape": "false",
-            "seldon.io/rest-read-timeout": "60000",
-            "seldon.io/rest-connection-timeout": "60000",
-            "seldon.io/grpc-read-timeout": "60000",
-            "seldon.io/engine-separate-pod": "true"
-        },
-        "name": "$experimentId",
-        "resources": {
-            "requests": {
-                "memory": "2G"
-            }
+SELDON_DEPLOYMENT_IMAGE = "platiagro/platiagro-deployment-image:0.2.0"
+SELDON_LOGGER_URL = Template("http://pipelines.kubeflow/seldon/logger/$experimentId")
+# executed notebook of a training operator, by run id (and "latest")
+EXECUTED_NOTEBOOK_PATH = Template(
+    "notebooks/experiments/$experimentId/operators/$operatorId/runs/$runId/Experiment.ipynb"
+)
+# files a training operator wrote to the training volume, by run id
+VOLUME_OUTPUTS_PATH = Template(
+    "volumes/experiments/$experimentId/operators/$operatorId/runs/$runId/outputs.tar.gz"
+)
+
+
+def build_seldon_deployment(experiment_id, deployment_name, namespace, component_specs, graph):
+    """Builds a SeldonDeployment resource.
+
+    Args:
+        experiment_id (str): PlatIAgro experiment's uuid.
+        deployment_name (str): deployment name.
+        namespace (str): kubernetes namespace.
+        component_specs (list): component specs of each operator.
+        graph (dict): inference graph.
+
+    Returns:
+        dict: the SeldonDeployment resource.
+    """
+    return {
+        "apiVersion": "machinelearning.seldon.io/v1alpha2",
+        "kind": "SeldonDeployment",
+        "metadata": {
+            "labels": {
+                "app": "seldon",
+            },
+            "name": experiment_id,
+            "deploymentName": deployment_name,
+            "namespace": namespace,
         },
-        "predictors": [
-            {
-                "componentSpecs": [$componentSpecs
-                ],
-                "graph": $graph,
-                "labels": {
-                    "version": "v1"
+        "spec": {
+            "annotations": {
+                "deployment_version": "v1",
+                "prometheus.io/scrape": "false",
+                "seldon.io/rest-read-timeout": "60000",
+                "seldon.io/rest-connection-timeout": "60000",
+                "seldon.io/grpc-read-timeout": "60000",
+                "seldon.io/engine-separate-pod": "true",
+            },
+            "name": experiment_id,
+            "resources": {
+                "requests": {
+                    "memory": "2G",
                 },
-                "name": "model",
-                "replicas": 1,
-                "svcOrchSpec": {
-                    "env": [
-                        {
-                            "name": "SELDON_LOG_LEVEL",
-                            "value": "DEBUG"
-                        }
-                    ]
-                }
-            }
-        ]
+            },
+            "predictors": [
+                {
+                    "componentSpecs": component_specs,
+                    "graph": graph,
+                    "labels": {
+                        "version": "v1",
+                    },
+                    "name": "model",
+                    "replicas": 1,
+                    "svcOrchSpec": {
+                        "env": [
+                            {
+                                "name": "SELDON_LOG_LEVEL",
+                                "value": "DEBUG",
+                            },
+                        ],
+                    },
+                },
+            ],
+        },
     }
-}
-""")
 
-COMPONENT_SPEC = Template("""
-{
-    "spec": {
-        "containers": [
-            {
-                "image": "platiagro/platiagro-deployment-image:0.2.0",
-                "name": "$operatorId",
-                "securityContext": {
-                    "allowPrivilegeEscalation": false,
-                    "runAsUser": 0
-                },
-                "env": [
-                    {
-                        "name": "EXPERIMENT_ID",
-                        "value": "$experimentId"
+
+def build_component_spec(experiment_id, operator_id, parameters):
+    """Builds the component spec of an operator.
+
+    Args:
+        experiment_id (str): PlatIAgro experiment's uuid.
+        operator_id (str): PlatIAgro operator's uuid.
+        parameters (str): operator parameters in JSON format.
+
+    Returns:
+        dict: the component spec.
+    """
+    return {
+        "spec": {
+            "containers": [
+                {
+                    "image": SELDON_DEPLOYMENT_IMAGE,
+                    "name": operator_id,
+                    "securityContext": {
+                        "allowPrivilegeEscalation": False,
+                        "runAsUser": 0,
                     },
-                    {
-                        "name": "OPERATOR_ID",
-                        "value": "$operatorId"
+                    "env": [
+                        {
+                            "name": "EXPERIMENT_ID",
+                            "value": experiment_id,
+                        },
+                        {
+                            "name": "OPERATOR_ID",
+                            "value": operator_id,
+                        },
+                        {
+                            "name": "PARAMETERS",
+                            "value": parameters,
+                        },
+                    ],
+                    "volumeMounts": [
+                        {
+                            "name": "workspace",
+                            "mountPath": "/app",
+                        },
+                    ],
+                },
+            ],
+            "volumes": [
+                {
+                    "name": "workspace",
+                    "persistentVolumeClaim": {
+                        "claimName": f"{{{{workflow.name}}}}-{operator_id}",
                     },
-                    {
-                        "name": "PARAMETERS",
-                        "value": "$parameters"
-                    }
-                ],
-                "volumeMounts": [
-                    {
-                        "name": "workspace",
-                        "mountPath": "/app"
-                    }
-                ]
-            }
-        ],
-        "volumes": [
-            {
-                "name": "workspace",
-                "persistentVolumeClaim": {
-                    "claimName": "{{workflow.name}}-$operatorId"
-                }
-            }
-        ]
+                },
+            ],
+        },
     }
-}""")
 
-GRAPH = Template("""{
-    "name": "$name",
-    "type": "MODEL",
-    "endpoint": {
-        "type": "REST"
-    },
-    "children": [
-        $children
-    ]$logger
-}""")
 
-LOGGER = Template(""",
-    "logger": {
-        "url": "http://pipelines.kubeflow/seldon/logger/$experimentId",
-        "mode": "all"
-    }""")
+def build_graph(name, child=None, logger=None):
+    """Builds an inference graph node.
+
+    Args:
+        name (str): the node name (operator uuid).
+        child (dict): the next node of the graph. (optional)
+        logger (dict): request logger of this node. (optional)
+
+    Returns:
+        dict: the graph node.
+    """
+    graph = {
+        "name": name,
+        "type": "MODEL",
+        "endpoint": {
+            "type": "REST",
+        },
+        "children": [child] if child else [],
+    }
+    if logger:
+        graph["logger"] = logger
+    return graph
+
+
+def build_logger(experiment_id):
+    """Builds a Seldon request logger.
+
+    Args:
+        experiment_id (str): PlatIAgro experiment's uuid.
+
+    Returns:
+        dict: the logger spec.
+    """
+    return {
+        "url": SELDON_LOGGER_URL.substitute({"experimentId": experiment_id}),
+        "mode": "all",
+    }
+
 
 POD_DEPLOYMENT_VOLUME = Template("""
 {
@@ -188,3 +245,127 @@ POD_DEPLOYMENT = Template("""
         "restartPolicy": "Never"
     }
 }""")
+
+# MinIO client of the scripts run by training ContainerOps, configured by
+# the MINIO_* environment variables the server sets on them
+MINIO_CLIENT_SCRIPT = """
+import os
+from minio import Minio
+
+client = Minio(
+    endpoint=os.environ["MINIO_ENDPOINT"],
+    access_key=os.environ["MINIO_ACCESS_KEY"],
+    secret_key=os.environ["MINIO_SECRET_KEY"],
+    region=os.environ["MINIO_REGION_NAME"],
+    secure=False,
+)
+"""
+
+COPY_CACHED_OUTPUTS = Template(MINIO_CLIENT_SCRIPT + """
+import shutil
+import tarfile
+
+run_id = os.getenv("RUN_ID")
+for prefix in $prefixes:
+    for obj in client.list_objects("$bucket", prefix=prefix, recursive=True):
+        destination = obj.object_name.replace("$cachedRunId", run_id, 1)
+        client.copy_object("$bucket", destination, "$bucket/" + obj.object_name)
+
+# the executed notebook and the files written to the volume, so that later runs may reuse this run too
+for object_name, destinations in [("$notebookName", [run_id, "latest"]), ("$volumeOutputsName", [run_id])]:
+    source = object_name.replace("$$runId", "$cachedRunId")
+    try:
+        for destination in destinations:
+            client.copy_object("$bucket", object_name.replace("$$runId", destination), "$bucket/" + source)
+    except Exception as e:
+        print("Not copied: " + source, e)
+
+# only the output directory of this operator is restored, the files of other operators are kept
+output_dir = os.environ["OPERATOR_OUTPUT_DIR"]
+try:
+    client.fget_object("$bucket", "$volumeOutputsName".replace("$$runId", "$cachedRunId"), "/tmp/outputs.tar.gz")
+except Exception as e:
+    print("No volume outputs to restore", e)
+else:
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir)
+    with tarfile.open("/tmp/outputs.tar.gz") as tar:
+        tar.extractall(output_dir)
+    print("Restored the volume outputs of run $cachedRunId")
+""")
+
+STAGE_DATASET = Template(MINIO_CLIENT_SCRIPT + """
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+
+def download_range(obj, path, offset):
+    length = min($chunkSize, obj.size - offset)
+    response = client.get_partial_object("$bucket", obj.object_name, offset, length)
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        for data in response.stream(2**20):
+            f.write(data)
+    response.release_conn()
+
+
+def verify(obj, path):
+    if os.path.getsize(path) != obj.size:
+        raise RuntimeError("Size mismatch: " + obj.object_name)
+    etag = obj.etag.strip('"')
+    if "-" in etag:
+        # multipart uploads do not have the md5 as etag
+        return
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(2**20), b""):
+            md5.update(data)
+    if md5.hexdigest() != etag:
+        raise RuntimeError("Checksum mismatch: " + obj.object_name)
+
+
+os.makedirs("$datasetDir", exist_ok=True)
+with ThreadPoolExecutor($workers) as executor:
+    for obj in client.list_objects("$bucket", prefix="datasets/" + os.environ["DATASET_NAME"] + "/"):
+        if obj.is_dir:
+            continue
+        path = os.path.join("$datasetDir", os.path.basename(obj.object_name))
+        marker = os.path.join("$datasetDir", "." + os.path.basename(obj.object_name) + ".etag")
+        if os.path.exists(path) and os.path.exists(marker):
+            with open(marker) as f:
+                if f.read() == obj.etag and os.path.getsize(path) == obj.size:
+                    print("Already staged: " + obj.object_name)
+                    continue
+
+        part = path + ".part"
+        with open(part, "wb") as f:
+            f.truncate(obj.size)
+        futures = [executor.submit(download_range, obj, part, offset)
+                   for offset in range(0, obj.size, $chunkSize)]
+        for future in futures:
+            future.result()
+        verify(obj, part)
+        os.replace(part, path)
+        with open(marker, "w") as f:
+            f.write(obj.etag)
+        print("Staged: " + obj.object_name)
+""")
+
+UPLOAD_EXECUTED_NOTEBOOK = Template(MINIO_CLIENT_SCRIPT + """
+if os.path.exists("output.ipynb"):
+    object_name = "$objectName".replace("$$runId", os.getenv("RUN_ID"))
+    client.fput_object("$bucket", object_name, "output.ipynb", content_type="application/json")
+    client.copy_object("$bucket", "$objectName".replace("$$runId", "latest"), "$bucket/" + object_name)
+""")
+
+UPLOAD_VOLUME_OUTPUTS = Template(MINIO_CLIENT_SCRIPT + """
+import tarfile
+
+# the output directory of this operator, other operators may write to the volume at the same time
+output_dir = os.environ["OPERATOR_OUTPUT_DIR"]
+with tarfile.open("/tmp/outputs.tar.gz", "w:gz") as tar:
+    for name in sorted(os.listdir(output_dir)):
+        tar.add(os.path.join(output_dir, name), arcname=name)
+object_name = "$objectName".replace("$$runId", os.getenv("RUN_ID"))
+client.fput_object("$bucket", object_name, "/tmp/outputs.tar.gz", content_type="application/gzip")
+""")
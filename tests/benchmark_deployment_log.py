@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""Micro-benchmark of the deployment log parser.
+
+Usage: python -m tests.benchmark_deployment_log
+"""
+from timeit import repeat
+
+from pipelines.controllers.deployments import parse_deployment_log
+
+LINES = [
+    "2020-09-01T12:00:00.123456789Z 2020-09-01 12:00:00,123 - root:INFO - Loaded model",
+    "2020-09-01T12:00:01.123456789Z 2020-09-01 12:00:01,123 - root:WARN - Missing feature: petal_width",
+    "2020-09-01T12:00:02.123456789Z ERROR: Exception on /predict [POST]",
+    "2020-09-01T12:00:03.123456789Z  * Running on http://0.0.0.0:9000/ (Press CTRL+C to quit)",
+]
+NUMBER_OF_LINES = 100000
+
+if __name__ == "__main__":
+    pod_log = "\n".join(LINES[i % len(LINES)] for i in range(NUMBER_OF_LINES))
+    best = min(repeat(lambda: parse_deployment_log(pod_log), number=1, repeat=5))
+    print(f"{NUMBER_OF_LINES} lines in {best:.3f}s ({NUMBER_OF_LINES / best:.0f} lines/s)")
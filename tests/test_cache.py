@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+import tempfile
+from collections import OrderedDict
+from threading import local
+from unittest import TestCase, mock
+
+from pipelines import cache
+
+
+class TestCache(TestCase):
+
+    def setUp(self):
+        self.patches = [
+            mock.patch.object(cache, "MEMORY_CACHE", OrderedDict()),
+            mock.patch.object(cache, "MEMORY_CACHE_BYTES", 0),
+            mock.patch.object(cache, "STATS", cache.Counter()),
+            mock.patch.object(cache, "RESPONSE_CACHE_DATABASE", ""),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def test_cached(self):
+        func = mock.MagicMock(return_value={"accuracy": 1.0})
+
+        self.assertEqual(cache.cached("run", "metrics:op", func), {"accuracy": 1.0})
+        result = cache.cached("run", "metrics:op", func)
+        self.assertEqual(result, {"accuracy": 1.0})
+        func.assert_called_once()
+
+        # each hit is a copy
+        result["accuracy"] = 0.0
+        self.assertEqual(cache.cached("run", "metrics:op", func), {"accuracy": 1.0})
+
+        self.assertEqual(cache.get_stats(), {"hits": 2, "databaseHits": 0, "misses": 1,
+                                             "entries": 1, "bytes": len('{"accuracy": 1.0}')})
+
+    @mock.patch.object(cache, "RESPONSE_CACHE_MAX_BYTES", 30)
+    def test_put_in_memory_evicts_least_recently_used(self):
+        cache.put_in_memory("a", "x" * 10)
+        cache.put_in_memory("b", "x" * 10)
+        cache.put_in_memory("c", "x" * 10)
+        self.assertEqual(cache.get_from_memory("a"), "x" * 10)
+
+        cache.put_in_memory("d", "x" * 10)
+        self.assertEqual(list(cache.MEMORY_CACHE.keys()), ["c", "a", "d"])
+        self.assertIsNone(cache.get_from_memory("b"))
+        self.assertEqual(cache.MEMORY_CACHE_BYTES, 30)
+
+        # a replaced value is counted once
+        cache.put_in_memory("d", "x" * 20)
+        self.assertEqual(list(cache.MEMORY_CACHE.keys()), ["a", "d"])
+        self.assertEqual(cache.MEMORY_CACHE_BYTES, 30)
+
+        # values larger than the cache are not stored, nor evict others
+        cache.put_in_memory("e", "x" * 31)
+        self.assertIsNone(cache.get_from_memory("e"))
+        self.assertEqual(list(cache.MEMORY_CACHE.keys()), ["a", "d"])
+
+
+class TestDatabaseCache(TestCase):
+
+    def setUp(self):
+        fd, self.database = tempfile.mkstemp(suffix=".sqlite")
+        os.close(fd)
+        self.patches = [
+            mock.patch.object(cache, "MEMORY_CACHE", OrderedDict()),
+            mock.patch.object(cache, "MEMORY_CACHE_BYTES", 0),
+            mock.patch.object(cache, "STATS", cache.Counter()),
+            mock.patch.object(cache, "RESPONSE_CACHE_DATABASE", self.database),
+            mock.patch.object(cache, "CONNECTIONS", local()),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        if getattr(cache.CONNECTIONS, "connection", None) is not None:
+            cache.CONNECTIONS.connection.close()
+        for patch in self.patches:
+            patch.stop()
+        for suffix in ["", "-wal", "-shm"]:
+            if os.path.exists(self.database + suffix):
+                os.remove(self.database + suffix)
+
+    def test_cached_database(self):
+        func = mock.MagicMock(return_value=[1, 2])
+        self.assertEqual(cache.cached("run", "figures:op", func), [1, 2])
+
+        # as another process would, with an empty memory cache
+        cache.MEMORY_CACHE.clear()
+        self.assertEqual(cache.cached("run", "figures:op", func), [1, 2])
+        func.assert_called_once()
+        self.assertEqual(cache.STATS["databaseHits"], 1)
+
+        # and the value is kept in memory again
+        self.assertEqual(cache.cached("run", "figures:op", func), [1, 2])
+        self.assertEqual(cache.STATS["hits"], 1)
+
+    @mock.patch.object(cache, "RESPONSE_CACHE_DATABASE_MAX_ENTRIES", 2)
+    @mock.patch.object(cache.time, "time", side_effect=[1.0, 2.0, 3.0])
+    def test_put_in_database_removes_oldest(self, mock_time):
+        cache.put_in_database("a", "1")
+        cache.put_in_database("b", "2")
+        cache.put_in_database("c", "3")
+
+        self.assertIsNone(cache.get_from_database("a"))
+        self.assertEqual(cache.get_from_database("b"), "2")
+        self.assertEqual(cache.get_from_database("c"), "3")
+
+    def test_database_errors(self):
+        cache.get_connection().execute("DROP TABLE responses")
+
+        # a broken shared cache is a miss, and responses are still cached in memory
+        func = mock.MagicMock(return_value="foo")
+        self.assertEqual(cache.cached("run", "key", func), "foo")
+        self.assertEqual(cache.cached("run", "key", func), "foo")
+        func.assert_called_once()
+
+    def test_get_connection_after_fork(self):
+        connection = cache.get_connection()
+        self.assertIs(cache.get_connection(), connection)
+
+        with mock.patch.object(cache, "getpid", return_value=-1):
+            other = cache.get_connection()
+        self.assertIsNot(other, connection)
+        self.assertIsInstance(other, sqlite3.Connection)
+        connection.close()
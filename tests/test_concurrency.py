@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from unittest import TestCase
+
+from pipelines.concurrency import map_concurrently
+
+
+class TestConcurrency(TestCase):
+
+    def test_map_concurrently_order(self):
+        def delayed(item):
+            # later arguments return first
+            time.sleep(0.01 * (5 - item))
+            return item * 2
+
+        self.assertEqual(map_concurrently(delayed, range(5)), [0, 2, 4, 6, 8])
+        self.assertEqual(map_concurrently(delayed, []), [])
+
+    def test_map_concurrently_parallel(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def wait(item):
+            # fails with BrokenBarrierError if the calls run one at a time
+            barrier.wait()
+            return item
+
+        self.assertEqual(map_concurrently(wait, ["a", "b", "c"]), ["a", "b", "c"])
+
+    def test_map_concurrently_exception(self):
+        def fail(item):
+            if item % 2:
+                time.sleep(0.01 * (5 - item))
+                raise ValueError(item)
+            return item
+
+        with self.assertRaises(ValueError) as context:
+            map_concurrently(fail, range(5))
+
+        # the exception of the earliest argument, even though another call failed first
+        self.assertEqual(context.exception.args, (1,))
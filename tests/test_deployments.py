@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
 from json import dumps
-from unittest import TestCase
+from unittest import TestCase, mock
+
+from kubernetes.client.rest import ApiException
 
 from pipelines.api.main import app
+from pipelines.controllers import deployments
+from pipelines.controllers.deployments import parse_deployment_log, stream_pod_logs
 from pipelines.controllers.utils import init_pipeline_client
 from pipelines.database import engine
 from pipelines.object_storage import BUCKET_NAME
@@ -304,6 +308,60 @@ class TestDeployments(TestCase):
             self.assertIsInstance(result, list)
             self.assertEqual(rv.status_code, 200)
 
+    def test_parse_deployment_log(self):
+        pod_log = ("2020-09-01T12:00:00.123456789Z 2020-09-01 12:00:00,123 - root:INFO - Loaded model\n"
+                   "2020-09-01T12:00:01.123456789Z plain text")
+        result = parse_deployment_log(pod_log)
+        expected = [
+            {
+                "timestamp": "2020-09-01T12:00:00.123456789Z 2020-09-01 12:00:00,123",
+                "level": "INFO",
+                "message": "root: Loaded model",
+            },
+            {
+                "timestamp": "2020-09-01T12:00:01.123456789Z",
+                "level": "",
+                "message": "plain text",
+            },
+        ]
+        self.assertListEqual(expected, result)
+
+    @mock.patch.object(deployments, "load_kube_config")
+    @mock.patch.object(deployments, "client")
+    def test_stream_pod_logs(self, mock_client, mock_load):
+        stream_1 = mock.MagicMock()
+        stream_1.__iter__.return_value = [b"2020-09-01T12:00:00.123456789Z plain text\n"]
+        stream_2 = mock.MagicMock()
+        stream_2.__iter__.return_value = []
+        read_log = mock_client.CoreV1Api.return_value.read_namespaced_pod_log
+        read_log.side_effect = [stream_1, stream_2]
+
+        containers = [("pod", "main", "Model"), ("pod", "logger", "Logger")]
+        events = list(stream_pod_logs(containers, since_seconds=60))
+
+        log = {"timestamp": "2020-09-01T12:00:00.123456789Z", "level": "", "message": "plain text",
+               "containerName": "Model"}
+        self.assertEqual(events, [f"event: log\ndata: {dumps(log)}\n\n", "event: end\ndata: {}\n\n"])
+        self.assertEqual(read_log.call_args[1]["since_seconds"], 60)
+        stream_1.close.assert_called_once()
+        stream_2.close.assert_called_once()
+
+    @mock.patch.object(deployments, "load_kube_config")
+    @mock.patch.object(deployments, "client")
+    def test_stream_pod_logs_error(self, mock_client, mock_load):
+        stream_1 = mock.MagicMock()
+        stream_2 = mock.MagicMock()
+        read_log = mock_client.CoreV1Api.return_value.read_namespaced_pod_log
+        read_log.side_effect = [stream_1, stream_2, ApiException(status=404)]
+
+        containers = [("pod", "main", "Model"), ("pod", "logger", "Logger"), ("pod", "gone", "Gone")]
+        with self.assertRaises(ApiException):
+            stream_pod_logs(containers)
+
+        # the streams opened before the error are not leaked
+        stream_1.close.assert_called_once()
+        stream_2.close.assert_called_once()
+
     def test_delete_deployment(self):
         with app.test_client() as c:
             rv = c.delete(f"/projects/1/deployments/{MOCKED_DEPLOYMENT_ID}/runs")
@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
-from unittest import TestCase
+import json
+from unittest import TestCase, mock
 
 import matplotlib.pyplot as plt
 import numpy as np
+from minio.error import NoSuchKey
 
 import platiagro
 from pipelines.api.main import app
+from pipelines.controllers import figures
 from pipelines.object_storage import BUCKET_NAME, MINIO_CLIENT
 from pipelines.utils import uuid_alpha
 
@@ -38,3 +41,53 @@ class TestFigures(TestCase):
             rv = c.get(f"/projects/1/experiments/{EXPERIMENT_ID}/runs/{RUN_ID}/operators/{OPERATOR_ID}/figures")
             result = rv.get_json()
             self.assertIsInstance(result, list)
+
+    def test_list_figures_thumbnails(self):
+        with app.test_client() as c:
+            url = f"/projects/1/experiments/{EXPERIMENT_ID}/runs/{RUN_ID}/operators/{OPERATOR_ID}/figures"
+            rv = c.get(f"{url}?thumbnails=true")
+            result = rv.get_json()
+            self.assertEqual(len(result), 1)
+            self.assertEqual(result[0]["mimeType"], "image/png")
+            self.assertTrue(result[0]["thumbnailUrl"].endswith(f"{url}/0/thumbnail"))
+
+            rv = c.get(f"{url}/0/thumbnail")
+            self.assertEqual(rv.status_code, 200)
+            self.assertEqual(rv.mimetype, "image/png")
+
+            rv = c.get(f"{url}/0", headers={"If-None-Match": rv.headers["ETag"]})
+            self.assertEqual(rv.status_code, 200)
+
+            rv = c.get(f"{url}/0")
+            etag = rv.headers["ETag"]
+            rv = c.get(f"{url}/0", headers={"If-None-Match": etag})
+            self.assertEqual(rv.status_code, 304)
+
+            rv = c.get(f"{url}/1")
+            self.assertEqual(rv.status_code, 404)
+
+    def test_get_figure_before_list(self):
+        with app.test_client() as c:
+            # the figures are split on the first request for one of them
+            url = f"/projects/1/experiments/{EXPERIMENT_ID}/runs/{RUN_ID}/operators/{OPERATOR_ID}/figures"
+            rv = c.get(f"{url}/0/thumbnail")
+            self.assertEqual(rv.status_code, 200)
+            self.assertEqual(rv.mimetype, "image/png")
+
+            rv = c.get(f"{url}/1")
+            self.assertEqual(rv.status_code, 404)
+
+    @mock.patch.object(figures, "is_run_immutable", return_value=False)
+    @mock.patch.object(figures, "store_figures", return_value=[])
+    @mock.patch.object(figures, "get_object")
+    def test_list_figures_metadata_latest(self, mock_get_object, mock_store_figures, mock_immutable):
+        # "latest" reuses the stored figures of the run the SDK saved last
+        mock_get_object.return_value = json.dumps({"run_id": RUN_ID}).encode()
+        figures.list_figures_metadata(EXPERIMENT_ID, OPERATOR_ID, "latest")
+        mock_get_object.assert_called_once_with(f"experiments/{EXPERIMENT_ID}/operators/{OPERATOR_ID}/.metadata")
+        mock_store_figures.assert_called_once_with(EXPERIMENT_ID, OPERATOR_ID, RUN_ID)
+
+        mock_store_figures.reset_mock()
+        mock_get_object.side_effect = NoSuchKey(None)
+        self.assertEqual(figures.list_figures_metadata(EXPERIMENT_ID, OPERATOR_ID, "latest"), [])
+        mock_store_figures.assert_not_called()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+from unittest import TestCase, mock
+
+from minio.error import NoSuchKey
+
+from pipelines import jupyter
+
+EXPERIMENT_ID = "experiment"
+OPERATOR_ID = "operator"
+RUN_ID = "run"
+
+FAILED_NOTEBOOK = {
+    "cells": [
+        {
+            "cell_type": "code",
+            "metadata": {"papermill": {"exception": False, "status": "completed"}},
+            "outputs": [],
+        },
+        {
+            "cell_type": "code",
+            "metadata": {"papermill": {"exception": True, "status": "failed"}},
+            "outputs": [
+                {"output_type": "error", "ename": "ValueError", "traceback": ["foo", "bar"]},
+            ],
+        },
+    ],
+}
+
+
+def build_response(notebook):
+    response = io.BytesIO(json.dumps(notebook).encode())
+    response.release_conn = mock.MagicMock()
+    return response
+
+
+def build_run(status):
+    workflow = {"status": {"nodes": {"node": {"displayName": OPERATOR_ID,
+                                              "phase": status,
+                                              "message": "OOMKilled"}}}}
+    run_details = mock.MagicMock()
+    run_details.pipeline_runtime.workflow_manifest = json.dumps(workflow)
+    return run_details
+
+
+@mock.patch.object(jupyter, "remove_ansi_escapes", side_effect=lambda traceback: traceback)
+@mock.patch.object(jupyter, "search_for_pod_name")
+@mock.patch.object(jupyter, "init_pipeline_client")
+@mock.patch.object(jupyter, "get_object_stream")
+class TestJupyter(TestCase):
+
+    def setUp(self):
+        jupyter.OPERATOR_LOGS_CACHE.clear()
+
+    def test_get_operator_logs_executed_notebook(self, mock_stream, mock_client, mock_search, mock_remove):
+        mock_stream.side_effect = lambda name: build_response(FAILED_NOTEBOOK)
+
+        logs = jupyter.get_operator_logs(EXPERIMENT_ID, OPERATOR_ID, RUN_ID)
+
+        self.assertEqual(logs, {"exception": "ValueError", "traceback": ["foo", "bar"]})
+        mock_stream.assert_called_once_with(
+            f"notebooks/experiments/{EXPERIMENT_ID}/operators/{OPERATOR_ID}/runs/{RUN_ID}/Experiment.ipynb")
+
+        # the logs of the run are cached
+        jupyter.get_operator_logs(EXPERIMENT_ID, OPERATOR_ID, RUN_ID)
+        mock_stream.assert_called_once()
+
+    @mock.patch("pipelines.controllers.experiment_runs.get_experiment_run")
+    @mock.patch.object(jupyter, "read_jupyter_failed_cell_logs")
+    def test_get_operator_logs_missing_notebook(self, mock_jupyter, mock_latest, mock_stream, mock_client,
+                                                mock_search, mock_remove):
+        mock_stream.side_effect = NoSuchKey(None)
+        mock_latest.return_value.run.id = "other-run"
+        mock_client.return_value.get_run.return_value = build_run("Failed")
+        mock_search.return_value = {"status": "Failed", "message": "OOMKilled"}
+
+        logs = jupyter.get_operator_logs(EXPERIMENT_ID, OPERATOR_ID, RUN_ID)
+
+        self.assertEqual(logs, {"exception": "OOMKilled", "traceback": ["Kernel has died: OOMKilled"]})
+        # the notebook in the Jupyter server is of another run
+        mock_jupyter.assert_not_called()
+        # and the notebook may be uploaded later
+        self.assertNotIn((EXPERIMENT_ID, OPERATOR_ID, RUN_ID), jupyter.OPERATOR_LOGS_CACHE)
+
+    @mock.patch("pipelines.controllers.experiment_runs.get_experiment_run")
+    @mock.patch.object(jupyter, "read_jupyter_failed_cell_logs")
+    def test_get_operator_logs_latest_run_id(self, mock_jupyter, mock_latest, mock_stream, mock_client,
+                                             mock_search, mock_remove):
+        # old runs and operators that don't save outputs have no executed notebook
+        mock_stream.side_effect = NoSuchKey(None)
+        mock_latest.return_value.run.id = RUN_ID
+        mock_jupyter.return_value = {"exception": "KeyError", "traceback": []}
+
+        logs = jupyter.get_operator_logs(EXPERIMENT_ID, OPERATOR_ID, RUN_ID)
+
+        self.assertEqual(logs, {"exception": "KeyError", "traceback": []})
+        mock_jupyter.assert_called_once_with(EXPERIMENT_ID, OPERATOR_ID)
+        self.assertEqual(jupyter.OPERATOR_LOGS_CACHE, {})
+
+    @mock.patch.object(jupyter, "read_jupyter_failed_cell_logs")
+    def test_get_operator_logs_latest(self, mock_jupyter, mock_stream, mock_client, mock_search, mock_remove):
+        mock_stream.side_effect = NoSuchKey(None)
+        mock_jupyter.return_value = {"exception": "KeyError", "traceback": []}
+
+        logs = jupyter.get_operator_logs(EXPERIMENT_ID, OPERATOR_ID, "latest")
+
+        self.assertEqual(logs, {"exception": "KeyError", "traceback": []})
+        mock_jupyter.assert_called_once_with(EXPERIMENT_ID, OPERATOR_ID)
+        self.assertEqual(jupyter.OPERATOR_LOGS_CACHE, {})
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
-from unittest import TestCase
+import gzip
+import json
+from unittest import TestCase, mock
 
 import platiagro
+from pipelines.api import main
 from pipelines.api.main import app
 from pipelines.object_storage import BUCKET_NAME, MINIO_CLIENT
 from pipelines.utils import uuid_alpha
@@ -30,3 +33,34 @@ class TestMetrics(TestCase):
             result = rv.get_json()
             self.assertIsInstance(result, list)
             self.assertEquals(result, [{"accuracy": 1.0}])
+
+    def test_list_metrics_not_modified(self):
+        with app.test_client() as c:
+            url = f"/projects/1/experiments/{EXPERIMENT_ID}/runs/{RUN_ID}/operators/{OPERATOR_ID}/metrics"
+            rv = c.get(url)
+            self.assertEqual(rv.headers["Cache-Control"], "no-cache")
+            etag = rv.headers["ETag"]
+
+            rv = c.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(rv.status_code, 304)
+            self.assertEqual(rv.data, b"")
+
+    @mock.patch.object(main, "COMPRESSION_MIN_SIZE", 0)
+    @mock.patch.object(main, "brotli", None)
+    def test_list_metrics_compressed(self):
+        with app.test_client() as c:
+            url = f"/projects/1/experiments/{EXPERIMENT_ID}/runs/{RUN_ID}/operators/{OPERATOR_ID}/metrics"
+            rv = c.get(url)
+            self.assertNotIn("Content-Encoding", rv.headers)
+            etag, weak = rv.get_etag()
+            self.assertFalse(weak)
+
+            rv = c.get(url, headers={"Accept-Encoding": "gzip"})
+            self.assertEqual(rv.headers["Content-Encoding"], "gzip")
+            self.assertIn("Accept-Encoding", rv.vary)
+            self.assertEqual(json.loads(gzip.decompress(rv.data)), [{"accuracy": 1.0}])
+            # the same content, in other bytes
+            self.assertEqual(rv.get_etag(), (etag, True))
+
+            rv = c.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": rv.headers["ETag"]})
+            self.assertEqual(rv.status_code, 304)
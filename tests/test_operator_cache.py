@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import json
+from unittest import TestCase, mock
+
+from minio.error import MinioError, NoSuchKey
+from urllib3.exceptions import MaxRetryError
+from werkzeug.exceptions import BadRequest
+
+from pipelines.controllers import operator as operator_module
+from pipelines.controllers import operator_cache
+from pipelines.controllers.operator import Operator
+from pipelines.database import engine
+from pipelines.object_storage import BUCKET_NAME
+from pipelines.utils import uuid_alpha
+
+EXPERIMENT_ID = str(uuid_alpha())
+OPERATOR_ID_1 = str(uuid_alpha())
+OPERATOR_ID_2 = str(uuid_alpha())
+RUN_ID_1 = str(uuid_alpha())
+RUN_ID_2 = str(uuid_alpha())
+NOTEBOOK_PATH = f"minio://{BUCKET_NAME}/tasks/foo/Experiment.ipynb"
+IMAGE = "platiagro/platiagro-notebook-image:0.2.0"
+
+
+def create_operator(operator_id=OPERATOR_ID_1, parameters=None, commands=None, arguments=None):
+    return Operator(EXPERIMENT_ID, operator_id, IMAGE,
+                    commands or ["sh", "-c"],
+                    arguments or ["papermill $notebookPath output.ipynb -b $parameters"],
+                    NOTEBOOK_PATH,
+                    parameters or [{"name": "coef", "value": 0.1}])
+
+
+def run_details(nodes):
+    manifest = {"status": {"nodes": nodes}}
+    return mock.Mock(pipeline_runtime=mock.Mock(workflow_manifest=json.dumps(manifest)))
+
+
+class TestOperatorCache(TestCase):
+    def tearDown(self):
+        conn = engine.connect()
+        text = f"DELETE FROM operator_cache_keys WHERE experiment_id = '{EXPERIMENT_ID}'"
+        conn.execute(text)
+        conn.close()
+
+    @mock.patch.object(operator_module, "stat_object")
+    def test_create_cache_key(self, stat_object):
+        stat_object.return_value = mock.Mock(etag="etag-1")
+        key = create_operator().create_cache_key([])
+        self.assertIsInstance(key, str)
+        self.assertEqual(key, create_operator().create_cache_key([]))
+
+        # parameters, upstream operators and the notebook change the key
+        self.assertNotEqual(key, create_operator(parameters=[{"name": "coef", "value": 0.2}]).create_cache_key([]))
+        self.assertNotEqual(key, create_operator().create_cache_key(["upstream"]))
+        stat_object.return_value = mock.Mock(etag="etag-2")
+        self.assertNotEqual(key, create_operator().create_cache_key([]))
+
+        # operators downstream of an operator that can't be cached
+        self.assertIsNone(create_operator().create_cache_key([None]))
+
+        # operators whose outputs are not saved
+        self.assertIsNone(create_operator(commands=["python"], arguments=["main.py"]).create_cache_key([]))
+
+    @mock.patch.object(operator_module, "stat_object")
+    def test_create_cache_key_object_storage_errors(self, stat_object):
+        stat_object.side_effect = NoSuchKey(mock.MagicMock())
+        self.assertIsNone(create_operator().create_cache_key([]))
+
+        stat_object.side_effect = MinioError("foo")
+        self.assertIsNone(create_operator().create_cache_key([]))
+
+        stat_object.side_effect = MaxRetryError(None, "http://minio-service.kubeflow:9000")
+        self.assertIsNone(create_operator().create_cache_key([]))
+
+    def test_get_succeeded_operators(self):
+        client = mock.Mock()
+        client.get_run.return_value = run_details({
+            "node-1": {"displayName": OPERATOR_ID_1, "phase": "Succeeded"},
+            "node-2": {"displayName": OPERATOR_ID_2, "phase": "Failed"},
+        })
+        self.assertSetEqual({OPERATOR_ID_1}, operator_cache.get_succeeded_operators(client, RUN_ID_1))
+
+        client.get_run.side_effect = Exception("foo")
+        self.assertSetEqual(set(), operator_cache.get_succeeded_operators(client, RUN_ID_1))
+
+    @mock.patch.object(operator_cache, "init_pipeline_client")
+    @mock.patch.object(operator_cache, "get_succeeded_operators")
+    def test_find_upstream_runs(self, get_succeeded_operators, init_pipeline_client):
+        pipeline = mock.Mock()
+        pipeline.get_upstream_operators.return_value = {OPERATOR_ID_1}
+        pipeline.get_skipped_operators.return_value = {OPERATOR_ID_1}
+
+        get_succeeded_operators.return_value = {OPERATOR_ID_1}
+        result = operator_cache.find_upstream_runs(pipeline, OPERATOR_ID_2, RUN_ID_1)
+        self.assertDictEqual({OPERATOR_ID_1: RUN_ID_1}, result)
+
+        get_succeeded_operators.return_value = set()
+        with self.assertRaises(BadRequest):
+            operator_cache.find_upstream_runs(pipeline, OPERATOR_ID_2, RUN_ID_1)
+
+    @mock.patch.object(operator_cache, "init_pipeline_client")
+    @mock.patch.object(operator_cache, "get_succeeded_operators")
+    def test_find_cached_runs(self, get_succeeded_operators, init_pipeline_client):
+        self.assertDictEqual({}, operator_cache.find_cached_runs(EXPERIMENT_ID, {OPERATOR_ID_1: None}))
+
+        operator_cache.save_cache_keys(EXPERIMENT_ID, RUN_ID_1, {OPERATOR_ID_1: "key-1", OPERATOR_ID_2: None})
+        operator_cache.save_cache_keys(EXPERIMENT_ID, RUN_ID_2, {OPERATOR_ID_1: "key-1", OPERATOR_ID_2: "key-2"})
+
+        # the operator 1 failed in the latest run, the previous run is reused
+        get_succeeded_operators.side_effect = lambda client, run_id: {
+            RUN_ID_1: {OPERATOR_ID_1, OPERATOR_ID_2},
+            RUN_ID_2: {OPERATOR_ID_2},
+        }[run_id]
+        result = operator_cache.find_cached_runs(EXPERIMENT_ID, {OPERATOR_ID_1: "key-1", OPERATOR_ID_2: "key-2"})
+        self.assertDictEqual({OPERATOR_ID_1: RUN_ID_1, OPERATOR_ID_2: RUN_ID_2}, result)
+
+        # changed operators are executed
+        result = operator_cache.find_cached_runs(EXPERIMENT_ID, {OPERATOR_ID_1: "key-1", OPERATOR_ID_2: "key-3"})
+        self.assertDictEqual({OPERATOR_ID_1: RUN_ID_1}, result)
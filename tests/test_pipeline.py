@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, mock
+
+from kubernetes.client.models import V1Toleration
+
+from pipelines.controllers.pipeline import DEFAULT_RESOURCES, Pipeline, get_volume_spec
+
+
+class TestPipeline(TestCase):
+    def setUp(self):
+        # skips __init__, which connects to KFP
+        self.pipeline = Pipeline.__new__(Pipeline)
+
+    def create_operator(self, resources):
+        return mock.Mock(resources=resources, container_op=mock.MagicMock())
+
+    def test_set_operator_resources_defaults(self):
+        operator = self.create_operator(None)
+        self.pipeline._set_operator_resources(operator)
+
+        container = operator.container_op.container
+        container.add_resource_request.assert_has_calls([
+            mock.call(name, value) for name, value in DEFAULT_RESOURCES['requests'].items()
+        ], any_order=True)
+        container.add_resource_limit.assert_has_calls([
+            mock.call(name, value) for name, value in DEFAULT_RESOURCES['limits'].items()
+        ], any_order=True)
+        operator.container_op.add_node_selector_constraint.assert_not_called()
+        operator.container_op.add_toleration.assert_not_called()
+
+    def test_set_operator_resources_profile(self):
+        operator = self.create_operator({
+            'requests': {'cpu': '100m', 'nvidia.com/gpu': 1},
+            'limits': {'memory': '512M'},
+            'nodeSelector': {'node-pool': 'highmem'},
+            'tolerations': [
+                {'key': 'dedicated', 'operator': 'Equal', 'value': 'training', 'effect': 'NoSchedule'},
+                {'key': 'spot', 'operator': 'Exists', 'tolerationSeconds': 60},
+            ],
+        })
+        self.pipeline._set_operator_resources(operator)
+
+        container = operator.container_op.container
+        container.add_resource_request.assert_has_calls([
+            mock.call('cpu', '100m'),
+            # the default request is above the limit of the profile
+            mock.call('memory', '512M'),
+            mock.call('nvidia.com/gpu', '1'),
+        ], any_order=True)
+        container.add_resource_limit.assert_has_calls([
+            mock.call('cpu', DEFAULT_RESOURCES['limits']['cpu']),
+            mock.call('memory', '512M'),
+        ], any_order=True)
+
+        operator.container_op.add_node_selector_constraint.assert_called_once_with('node-pool', 'highmem')
+        operator.container_op.add_toleration.assert_has_calls([
+            mock.call(V1Toleration(key='dedicated', operator='Equal', value='training', effect='NoSchedule')),
+            mock.call(V1Toleration(key='spot', operator='Exists', toleration_seconds=60)),
+        ])
+
+    @mock.patch('pipelines.controllers.pipeline.get_pvc_spec')
+    def test_get_volume_spec(self, get_pvc_spec):
+        get_pvc_spec.return_value = None
+        spec = get_volume_spec('vol-foo', {'size': '5Gi', 'accessMode': 'ReadWriteMany', 'storageClass': 'nfs'})
+        self.assertDictEqual({
+            'accessModes': ['ReadWriteMany'],
+            'resources': {'requests': {'storage': '5Gi'}},
+            'storageClassName': 'nfs',
+        }, spec)
+
+        # the spec of an existing claim can't change
+        existing = {'accessModes': ['ReadWriteOnce'], 'resources': {'requests': {'storage': '1Gi'}}}
+        get_pvc_spec.return_value = existing
+        spec = get_volume_spec('vol-foo', {'size': '5Gi', 'accessMode': 'ReadWriteMany', 'storageClass': 'nfs'})
+        self.assertDictEqual(existing, spec)
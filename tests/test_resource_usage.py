@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, mock
+
+from kubernetes.client.rest import ApiException
+
+from pipelines.controllers import resource_usage
+
+RECOMMENDED = {
+    'requests': {'cpu': '120m', 'memory': '154Mi'},
+    'limits': {'cpu': '240m', 'memory': '308Mi'},
+}
+
+
+def workflow(name, run_id, nodes=None):
+    return {
+        'metadata': {
+            'name': name,
+            'generateName': 'common-pipeline-',
+            'labels': {'pipeline/runid': run_id},
+        },
+        'status': {'nodes': nodes or {}},
+    }
+
+
+class TestResourceUsage(TestCase):
+    def get_task_resources(self, profile):
+        with mock.patch.object(resource_usage, 'RESOURCE_RIGHT_SIZING', True), \
+                mock.patch.object(resource_usage, 'get_resources_profile', return_value=profile), \
+                mock.patch.object(resource_usage, 'recommend_resources',
+                                  return_value={k: dict(v) for k, v in RECOMMENDED.items()}):
+            return resource_usage.get_task_resources(mock.Mock(uuid='task'))
+
+    def test_get_task_resources(self):
+        self.assertDictEqual(RECOMMENDED, self.get_task_resources(None))
+
+        resources = self.get_task_resources({'nodeSelector': {'node-pool': 'highmem'}})
+        self.assertDictEqual({'node-pool': 'highmem'}, resources['nodeSelector'])
+
+    def test_get_task_resources_limits_not_below_requests(self):
+        resources = self.get_task_resources({'requests': {'memory': '1Gi', 'cpu': 1}})
+        self.assertDictEqual({'cpu': 1, 'memory': '1Gi'}, resources['requests'])
+        self.assertDictEqual({'cpu': 1, 'memory': '1Gi'}, resources['limits'])
+
+        # limits of the profile are kept
+        resources = self.get_task_resources({'requests': {'memory': '1Gi'}, 'limits': {'memory': '2Gi'}})
+        self.assertDictEqual({'cpu': '240m', 'memory': '2Gi'}, resources['limits'])
+
+    @mock.patch.object(resource_usage, 'load_kube_config')
+    @mock.patch.object(resource_usage, 'record_resource_usage')
+    @mock.patch.object(resource_usage.client, 'CustomObjectsApi')
+    def test_sample_resource_usage(self, custom_objects_api, record_resource_usage, load_kube_config):
+        api = custom_objects_api.return_value
+        api.list_namespaced_custom_object.return_value = {'items': [workflow('wf-1', 'run-1')]}
+        api.get_namespaced_custom_object.side_effect = ApiException(status=404)
+        # an error about a run doesn't stop the others from being sampled
+        record_resource_usage.side_effect = [ValueError('foo')]
+
+        running = resource_usage.sample_resource_usage({'wf-0'})
+        self.assertSetEqual({'wf-1'}, running)
+        api.get_namespaced_custom_object.assert_called_once_with(
+            'argoproj.io', 'v1alpha1', resource_usage.KF_PIPELINES_NAMESPACE, 'workflows', 'wf-0')
+
+        # finished workflows are read once more
+        api.list_namespaced_custom_object.return_value = {'items': []}
+        api.get_namespaced_custom_object.side_effect = None
+        api.get_namespaced_custom_object.return_value = workflow('wf-1', 'run-1')
+        record_resource_usage.side_effect = None
+
+        running = resource_usage.sample_resource_usage(running)
+        self.assertSetEqual(set(), running)
+        record_resource_usage.assert_called_with('run-1', workflow('wf-1', 'run-1'))
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, mock
+
+import matplotlib.pyplot as plt
+
+import platiagro
+from pipelines.api.main import app
+from pipelines.controllers import results
+from pipelines.object_storage import BUCKET_NAME, MINIO_CLIENT
+from pipelines.utils import uuid_alpha
+
+EXPERIMENT_ID = str(uuid_alpha())
+OPERATOR_ID = str(uuid_alpha())
+RUN_ID = str(uuid_alpha())
+RUN_ID_2 = str(uuid_alpha())
+
+
+class TestResults(TestCase):
+    def setUp(self):
+        self.maxDiff = None
+        platiagro.save_metrics(experiment_id=EXPERIMENT_ID,
+                               operator_id=OPERATOR_ID,
+                               run_id=RUN_ID,
+                               accuracy=1.0)
+
+        fig, ax = plt.subplots()
+        ax.plot([0, 1], [1, 0])
+        platiagro.save_figure(experiment_id=EXPERIMENT_ID,
+                              operator_id=OPERATOR_ID,
+                              run_id=RUN_ID,
+                              figure=fig)
+
+    def tearDown(self):
+        prefix = f"experiments/{EXPERIMENT_ID}"
+        for obj in MINIO_CLIENT.list_objects(BUCKET_NAME, prefix=prefix, recursive=True):
+            MINIO_CLIENT.remove_object(BUCKET_NAME, obj.object_name)
+
+    def test_list_results(self):
+        with app.test_client() as c:
+            rv = c.post(f"/projects/1/experiments/{EXPERIMENT_ID}/results", json={})
+            result = rv.get_json()
+            expected = {"message": "operators is required"}
+            self.assertDictEqual(expected, result)
+            self.assertEqual(rv.status_code, 400)
+
+            rv = c.post(f"/projects/1/experiments/{EXPERIMENT_ID}/results", json={
+                "operators": [
+                    {"operatorId": OPERATOR_ID, "runId": RUN_ID},
+                    {"operatorId": "notExist", "runId": RUN_ID},
+                ],
+                "kinds": ["metrics"],
+            })
+            result = rv.get_json()
+            self.assertEqual(rv.status_code, 200)
+            self.assertEqual(result["results"], [
+                {"operatorId": OPERATOR_ID, "runId": RUN_ID, "metrics": [{"accuracy": 1.0}]},
+                {"operatorId": "notExist", "runId": RUN_ID},
+            ])
+            self.assertEqual(len(result["errors"]), 1)
+            self.assertEqual(result["errors"][0]["operatorId"], "notExist")
+            self.assertEqual(result["errors"][0]["kind"], "metrics")
+
+    def test_list_results_figures(self):
+        with app.test_client() as c:
+            rv = c.post(f"/projects/1/experiments/{EXPERIMENT_ID}/results", json={
+                "operators": [
+                    {"operatorId": OPERATOR_ID, "runId": RUN_ID},
+                ],
+                "kinds": ["metrics", "figures"],
+            })
+            result = rv.get_json()
+            self.assertEqual(rv.status_code, 200)
+            self.assertEqual(result["errors"], [])
+            self.assertEqual(len(result["results"]), 1)
+            self.assertEqual(result["results"][0]["metrics"], [{"accuracy": 1.0}])
+            self.assertEqual(len(result["results"][0]["figures"]), 1)
+            self.assertTrue(result["results"][0]["figures"][0].startswith("data:image/png;base64,"))
+
+    @mock.patch.object(results, "is_run_immutable", return_value=False)
+    def test_list_results_run_status(self, mock_immutable):
+        with mock.patch.dict(results.RESULT_KINDS, {"metrics": mock.MagicMock(return_value=[]),
+                                                    "figures": mock.MagicMock(return_value=[])}):
+            results.list_results(EXPERIMENT_ID, [
+                {"operatorId": OPERATOR_ID, "runId": RUN_ID},
+                {"operatorId": "other", "runId": RUN_ID},
+                {"operatorId": OPERATOR_ID, "runId": RUN_ID_2},
+            ])
+
+            # once per run, not per operator and kind
+            self.assertEqual(sorted(call[0][0] for call in mock_immutable.call_args_list), sorted([RUN_ID, RUN_ID_2]))
+            results.RESULT_KINDS["figures"].assert_any_call(experiment_id=EXPERIMENT_ID,
+                                                            operator_id="other",
+                                                            run_id=RUN_ID,
+                                                            immutable=False)
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+from collections import Counter
+from datetime import datetime
+from unittest import TestCase, mock
+
+from werkzeug.exceptions import TooManyRequests
+
+from pipelines.controllers import scheduler, submissions
+from pipelines.models import Submission
+
+PROJECT_ID_1 = "project-1"
+PROJECT_ID_2 = "project-2"
+
+
+def build_submission(uuid, project_id, priority=0, minute=0):
+    return Submission(uuid=uuid,
+                      project_id=project_id,
+                      experiment_id="experiment",
+                      priority=priority,
+                      created_at=datetime(2000, 1, 1, 0, minute))
+
+
+class TestScheduler(TestCase):
+
+    @mock.patch.object(scheduler, "MAX_RUNNING_RUNS", 3)
+    @mock.patch.object(scheduler, "MAX_RUNNING_RUNS_PER_PROJECT", 2)
+    def test_select_submissions(self):
+        pending = [
+            build_submission("a", PROJECT_ID_1, minute=0),
+            build_submission("b", PROJECT_ID_1, minute=1),
+            build_submission("c", PROJECT_ID_1, minute=2),
+            build_submission("d", PROJECT_ID_2, minute=3),
+        ]
+        active_runs = Counter({PROJECT_ID_1: 1})
+
+        selected = scheduler.select_submissions(pending, active_runs)
+
+        # the second project gets its fair share before the first one
+        self.assertEqual([s.uuid for s in selected], ["d", "a"])
+        self.assertEqual(active_runs, Counter({PROJECT_ID_1: 2, PROJECT_ID_2: 1}))
+
+    @mock.patch.object(scheduler, "MAX_RUNNING_RUNS", 1)
+    @mock.patch.object(scheduler, "MAX_RUNNING_RUNS_PER_PROJECT", 0)
+    def test_select_submissions_priority(self):
+        pending = [
+            build_submission("a", PROJECT_ID_1, minute=0),
+            build_submission("b", PROJECT_ID_2, priority=1, minute=1),
+        ]
+
+        selected = scheduler.select_submissions(pending, Counter())
+
+        self.assertEqual([s.uuid for s in selected], ["b"])
+
+
+class TestRunNow(TestCase):
+
+    @mock.patch.object(scheduler, "MAX_RUNNING_RUNS", 0)
+    @mock.patch.object(scheduler, "MAX_RUNNING_RUNS_PER_PROJECT", 0)
+    @mock.patch.object(submissions, "db_session")
+    @mock.patch.object(submissions, "create_experiment_run", return_value="run-1")
+    def test_run_now_without_caps(self, mock_create, mock_session):
+        run_id = submissions.run_now(PROJECT_ID_1, "experiment")
+
+        self.assertEqual(run_id, "run-1")
+        # nothing to count the run towards
+        mock_session.add.assert_not_called()
+
+    @mock.patch.object(scheduler, "MAX_RUNNING_RUNS", 0)
+    @mock.patch.object(scheduler, "MAX_RUNNING_RUNS_PER_PROJECT", 1)
+    @mock.patch.object(submissions, "start_scheduler")
+    @mock.patch.object(submissions, "count_active_runs")
+    @mock.patch.object(submissions, "db_session")
+    @mock.patch.object(submissions, "create_experiment_run", return_value="run-1")
+    def test_run_now_with_caps(self, mock_create, mock_session, mock_count, mock_start):
+        mock_session.query.return_value.filter_by.return_value.first.return_value = None
+
+        # the claimed slot is counted as active already
+        mock_count.return_value = Counter({PROJECT_ID_1: 1})
+        run_id = submissions.run_now(PROJECT_ID_1, "experiment")
+        self.assertEqual(run_id, "run-1")
+        submission = mock_session.add.call_args[0][0]
+        self.assertEqual(submission.status, "Succeeded")
+        self.assertEqual(submission.run_id, "run-1")
+
+        mock_create.reset_mock()
+        mock_session.reset_mock()
+        mock_session.query.return_value.filter_by.return_value.first.return_value = None
+        mock_count.return_value = Counter({PROJECT_ID_1: 2})
+        with self.assertRaises(TooManyRequests):
+            submissions.run_now(PROJECT_ID_1, "experiment")
+        mock_create.assert_not_called()
+        mock_session.delete.assert_called_once_with(mock_session.add.call_args[0][0])
+
+    @mock.patch.object(scheduler, "MAX_RUNNING_RUNS", 5)
+    @mock.patch.object(submissions, "start_scheduler")
+    @mock.patch.object(submissions, "count_active_runs", return_value=Counter())
+    @mock.patch.object(submissions, "db_session")
+    @mock.patch.object(submissions, "create_experiment_run")
+    def test_run_now_queued(self, mock_create, mock_session, mock_count, mock_start):
+        # runs submitted synchronously don't jump the queue
+        mock_session.query.return_value.filter_by.return_value.first.return_value = ("a",)
+        with self.assertRaises(TooManyRequests):
+            submissions.run_now(PROJECT_ID_1, "experiment")
+        mock_create.assert_not_called()
+
+    @mock.patch.object(scheduler, "MAX_RUNNING_RUNS", 5)
+    @mock.patch.object(submissions, "start_scheduler")
+    @mock.patch.object(submissions, "count_active_runs", return_value=Counter({PROJECT_ID_1: 1}))
+    @mock.patch.object(submissions, "db_session")
+    @mock.patch.object(submissions, "create_experiment_run", side_effect=ValueError("foo"))
+    def test_run_now_failed(self, mock_create, mock_session, mock_count, mock_start):
+        mock_session.query.return_value.filter_by.return_value.first.return_value = None
+        with self.assertRaises(ValueError):
+            submissions.run_now(PROJECT_ID_1, "experiment")
+        submission = mock_session.add.call_args[0][0]
+        self.assertEqual(submission.status, "Failed")
+        self.assertEqual(submission.message, "foo")
+
+    @mock.patch.object(scheduler, "MAX_RUNNING_RUNS", 0)
+    @mock.patch.object(scheduler, "MAX_RUNNING_RUNS_PER_PROJECT", 1)
+    @mock.patch.object(submissions, "start_scheduler")
+    @mock.patch.object(submissions, "count_active_runs")
+    @mock.patch.object(submissions, "db_session")
+    @mock.patch.object(submissions, "get_retried_run", return_value={"operators": {}})
+    @mock.patch.object(submissions, "retry_latest_run", return_value="run-1")
+    def test_retry_now_with_caps(self, mock_retry, mock_get, mock_session, mock_count, mock_start):
+        mock_session.query.return_value.filter_by.return_value.first.return_value = None
+
+        # retries claim a slot, as new runs do
+        mock_count.return_value = Counter({PROJECT_ID_1: 1})
+        self.assertEqual(submissions.retry_now(PROJECT_ID_1, "experiment"), {"operators": {}})
+        mock_retry.assert_called_once_with("experiment")
+        mock_get.assert_called_once_with("run-1")
+        submission = mock_session.add.call_args[0][0]
+        self.assertEqual(submission.status, "Succeeded")
+        self.assertEqual(submission.run_id, "run-1")
+
+        mock_retry.reset_mock()
+        mock_count.return_value = Counter({PROJECT_ID_1: 2})
+        with self.assertRaises(TooManyRequests):
+            submissions.retry_now(PROJECT_ID_1, "experiment")
+        mock_retry.assert_not_called()
+
+    @mock.patch.object(submissions, "raise_if_project_does_not_exist")
+    @mock.patch.object(submissions, "raise_if_experiment_does_not_exist")
+    @mock.patch.object(submissions, "start_scheduler")
+    @mock.patch.object(submissions, "get_submission", return_value={"uuid": "a"})
+    @mock.patch.object(submissions, "db_session")
+    @mock.patch.object(submissions, "dispatch")
+    def test_create_submission(self, mock_dispatch, mock_session, mock_get, mock_start, *args):
+        submissions.SCHEDULER_WAKEUP.clear()
+        self.assertEqual(submissions.create_submission(PROJECT_ID_1, "experiment"), {"uuid": "a"})
+        mock_session.add.assert_called_once()
+        # the scheduler thread dispatches the submission, not the request
+        mock_dispatch.assert_not_called()
+        self.assertTrue(submissions.SCHEDULER_WAKEUP.is_set())
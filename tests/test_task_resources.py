@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+from json import dumps
+from unittest import TestCase
+
+from pipelines.api.main import app
+from pipelines.database import engine
+from pipelines.object_storage import BUCKET_NAME
+from pipelines.utils import uuid_alpha
+
+TASK_ID = str(uuid_alpha())
+NAME = "foo"
+IMAGE = "platiagro/platiagro-notebook-image-test:0.2.0"
+EXPERIMENT_NOTEBOOK_PATH = f"minio://{BUCKET_NAME}/tasks/{TASK_ID}/Experiment.ipynb"
+DEPLOYMENT_NOTEBOOK_PATH = f"minio://{BUCKET_NAME}/tasks/{TASK_ID}/Deployment.ipynb"
+CREATED_AT = "2000-01-01 00:00:00"
+UPDATED_AT = "2000-01-01 00:00:00"
+RESOURCES = {
+    "requests": {"cpu": "100m", "memory": "256M"},
+    "limits": {"cpu": "250m", "memory": "512M"},
+    "nodeSelector": {"node-pool": "highmem"},
+    "tolerations": [{"key": "dedicated", "operator": "Equal", "value": "training", "effect": "NoSchedule"}],
+}
+
+
+class TestTaskResources(TestCase):
+    def setUp(self):
+        self.maxDiff = None
+        conn = engine.connect()
+        text = (
+            f"INSERT INTO tasks (uuid, name, description, image, commands, arguments, tags, "
+            f"experiment_notebook_path, deployment_notebook_path, is_default, created_at, updated_at) "
+            f"VALUES ('{TASK_ID}', '{NAME}', 'long foo', '{IMAGE}', '{dumps(['CMD'])}', '{dumps(['ARG'])}', "
+            f"'{dumps(['PREDICTOR'])}', '{EXPERIMENT_NOTEBOOK_PATH}', '{DEPLOYMENT_NOTEBOOK_PATH}', 0, "
+            f"'{CREATED_AT}', '{UPDATED_AT}')"
+        )
+        conn.execute(text)
+        conn.close()
+
+    def tearDown(self):
+        conn = engine.connect()
+        text = f"DELETE FROM task_resources WHERE task_id = '{TASK_ID}'"
+        conn.execute(text)
+
+        text = f"DELETE FROM tasks WHERE uuid = '{TASK_ID}'"
+        conn.execute(text)
+        conn.close()
+
+    def test_task_resources(self):
+        with app.test_client() as c:
+            rv = c.get("/tasks/unk/resources")
+            result = rv.get_json()
+            expected = {"message": "The specified task does not exist"}
+            self.assertDictEqual(expected, result)
+            self.assertEqual(rv.status_code, 404)
+
+            rv = c.get(f"/tasks/{TASK_ID}/resources")
+            self.assertDictEqual({}, rv.get_json())
+            self.assertEqual(rv.status_code, 200)
+
+            rv = c.put(f"/tasks/{TASK_ID}/resources", json={"requests": {"cpu": ["100m"]}})
+            result = rv.get_json()
+            expected = {"message": "Invalid resources."}
+            self.assertDictEqual(expected, result)
+            self.assertEqual(rv.status_code, 400)
+
+            # a request above its limit makes an invalid pod spec
+            invalid = {"requests": {"memory": "2G"}, "limits": {"memory": "512M"}}
+            rv = c.put(f"/tasks/{TASK_ID}/resources", json=invalid)
+            self.assertDictEqual(expected, rv.get_json())
+            self.assertEqual(rv.status_code, 400)
+
+            rv = c.put(f"/tasks/{TASK_ID}/resources", json=RESOURCES)
+            self.assertDictEqual(RESOURCES, rv.get_json())
+            self.assertEqual(rv.status_code, 200)
+
+            rv = c.get(f"/tasks/{TASK_ID}/resources")
+            self.assertDictEqual(RESOURCES, rv.get_json())
+
+            rv = c.delete(f"/tasks/{TASK_ID}/resources")
+            self.assertEqual(rv.status_code, 200)
+
+            rv = c.get(f"/tasks/{TASK_ID}/resources")
+            self.assertDictEqual({}, rv.get_json())
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from json import dumps, loads
+from unittest import TestCase
+
+from pipelines.resources.templates import COPY_CACHED_OUTPUTS, EXECUTED_NOTEBOOK_PATH, \
+    STAGE_DATASET, UPLOAD_EXECUTED_NOTEBOOK, UPLOAD_VOLUME_OUTPUTS, VOLUME_OUTPUTS_PATH, \
+    build_component_spec, build_graph, build_logger, build_seldon_deployment
+
+EXPERIMENT_ID = "ex1"
+OPERATOR_ID_1 = "op1"
+OPERATOR_ID_2 = "op2"
+
+
+class TestTemplates(TestCase):
+
+    def test_build_graph(self):
+        child = build_graph(OPERATOR_ID_2, logger=build_logger(EXPERIMENT_ID))
+        graph = build_graph(OPERATOR_ID_1, child=child)
+
+        self.assertEqual(graph["name"], OPERATOR_ID_1)
+        self.assertNotIn("logger", graph)
+        self.assertEqual(graph["children"], [child])
+        self.assertEqual(child["children"], [])
+        self.assertEqual(child["logger"]["url"], f"http://pipelines.kubeflow/seldon/logger/{EXPERIMENT_ID}")
+
+    def test_build_component_spec(self):
+        parameters = dumps([{"name": "text", "value": "a \"quoted\" value"}])
+        spec = build_component_spec(EXPERIMENT_ID, OPERATOR_ID_1, parameters)
+
+        container = spec["spec"]["containers"][0]
+        self.assertEqual(container["name"], OPERATOR_ID_1)
+        self.assertIn({"name": "PARAMETERS", "value": parameters}, container["env"])
+        self.assertEqual(spec["spec"]["volumes"][0]["persistentVolumeClaim"]["claimName"],
+                         f"{{{{workflow.name}}}}-{OPERATOR_ID_1}")
+
+    def test_build_seldon_deployment(self):
+        specs = [build_component_spec(EXPERIMENT_ID, OPERATOR_ID_1, "[]")]
+        graph = build_graph(OPERATOR_ID_1, logger=build_logger(EXPERIMENT_ID))
+        deployment = build_seldon_deployment(EXPERIMENT_ID, "foo", "deployments", specs, graph)
+
+        self.assertEqual(deployment["metadata"]["name"], EXPERIMENT_ID)
+        self.assertEqual(deployment["metadata"]["deploymentName"], "foo")
+        predictor = deployment["spec"]["predictors"][0]
+        self.assertEqual(predictor["componentSpecs"], specs)
+        self.assertEqual(predictor["graph"], graph)
+        self.assertEqual(loads(dumps(deployment)), deployment)
+
+    def test_training_scripts(self):
+        notebook_name = EXECUTED_NOTEBOOK_PATH.safe_substitute(experimentId=EXPERIMENT_ID, operatorId=OPERATOR_ID_1)
+        volume_outputs_name = VOLUME_OUTPUTS_PATH.safe_substitute(experimentId=EXPERIMENT_ID,
+                                                                  operatorId=OPERATOR_ID_1)
+        scripts = [
+            COPY_CACHED_OUTPUTS.substitute(bucket="anonymous", cachedRunId="run1", prefixes=dumps(["foo/"]),
+                                           notebookName=notebook_name, volumeOutputsName=volume_outputs_name),
+            STAGE_DATASET.substitute(bucket="anonymous", datasetDir="/tmp/data",
+                                     workers=8, chunkSize=2**20),
+            UPLOAD_EXECUTED_NOTEBOOK.substitute(bucket="anonymous", objectName=notebook_name),
+            UPLOAD_VOLUME_OUTPUTS.substitute(bucket="anonymous", objectName=volume_outputs_name),
+        ]
+        for script in scripts:
+            compile(script, "script", "exec")
+            # the server sets the MinIO config, no defaults are hardcoded
+            self.assertIn('os.environ["MINIO_SECRET_KEY"]', script)
+            self.assertNotIn("minio123", script)
+        # the dataset name is read from the environment of the staging container
+        self.assertIn('os.environ["DATASET_NAME"]', scripts[1])
@@ -121,6 +121,9 @@ class TestTrainings(TestCase):
 
     def tearDown(self):
         conn = engine.connect()
+        text = f"DELETE FROM submissions WHERE project_id = '{PROJECT_ID}'"
+        conn.execute(text)
+
         text = f"DELETE FROM operators WHERE 1 = 1"
         conn.execute(text)
 
@@ -177,6 +180,46 @@ class TestTrainings(TestCase):
             self.assertDictEqual(expected, result)
             self.assertEqual(rv.status_code, 200)
 
+    def test_post_training_from_operator(self):
+        with app.test_client() as c:
+            rv = c.post(f"/projects/notExist/experiments/{EX_ID_1}/runs/latest/operators/{OP_ID_1_2}/runs")
+            result = rv.get_json()
+            expected = {"message": "The specified project does not exist"}
+            self.assertDictEqual(expected, result)
+            self.assertEqual(rv.status_code, 404)
+
+            rv = c.post(f"/projects/{PROJECT_ID}/experiments/{EX_ID_2}/runs/latest/operators/{OP_ID_1_2}/runs")
+            result = rv.get_json()
+            expected = {"message": "Necessary at least one operator"}
+            self.assertDictEqual(expected, result)
+            self.assertEqual(rv.status_code, 400)
+
+    def test_post_training_async(self):
+        with app.test_client() as c:
+            rv = c.post(f"/projects/{PROJECT_ID}/experiments/notExist/runs?async=true")
+            result = rv.get_json()
+            expected = {"message": "The specified experiment does not exist"}
+            self.assertDictEqual(expected, result)
+            self.assertEqual(rv.status_code, 404)
+
+            rv = c.post(f"/projects/{PROJECT_ID}/experiments/{EX_ID_1}/runs?async=true")
+            result = rv.get_json()
+            self.assertEqual(result["message"], "Pipeline submitted.")
+            self.assertIn("submissionId", result)
+            self.assertEqual(rv.status_code, 202)
+
+            submission_id = result["submissionId"]
+            rv = c.get(f"/projects/{PROJECT_ID}/experiments/{EX_ID_1}/runs/submissions/{submission_id}")
+            result = rv.get_json()
+            self.assertIn(result["status"], ["Pending", "Running", "Succeeded", "Failed"])
+            self.assertEqual(rv.status_code, 200)
+
+            rv = c.get(f"/projects/{PROJECT_ID}/experiments/{EX_ID_1}/runs/submissions/notExist")
+            result = rv.get_json()
+            expected = {"message": "The specified submission does not exist"}
+            self.assertDictEqual(expected, result)
+            self.assertEqual(rv.status_code, 404)
+
     def test_get_training(self):
         with app.test_client() as c:
             rv = c.get(f"/projects/1/experiments/{MOCKED_TRAINING_ID}/runs/latest")
@@ -198,3 +241,37 @@ class TestTrainings(TestCase):
             result = rv.get_json()
             self.assertIsInstance(result, object)
             self.assertEqual(rv.status_code, 200)
+
+    def test_list_training_runs_compact(self):
+        with app.test_client() as c:
+            url = f"/projects/1/experiments/{MOCKED_TRAINING_ID}/runs"
+            rv = c.get(f"{url}?encoding=dictionary")
+            result = rv.get_json()
+            self.assertIn("operatorIds", result)
+            self.assertIn("runs", result)
+            self.assertEqual(rv.status_code, 200)
+
+            rv = c.get(url, headers={"Accept": "application/msgpack"})
+            self.assertEqual(rv.mimetype, "application/msgpack")
+            self.assertEqual(rv.status_code, 200)
+
+    def test_list_training_runs_paginated(self):
+        with app.test_client() as c:
+            url = f"/projects/1/experiments/{MOCKED_TRAINING_ID}/runs"
+            rv = c.get(f"{url}?pageSize=1")
+            result = rv.get_json()
+            self.assertIn("runs", result)
+            self.assertIn("nextPageToken", result)
+            self.assertLessEqual(len(result["runs"]), 1)
+            self.assertEqual(rv.status_code, 200)
+
+            rv = c.get(f"{url}?pageSize=1&createdAfter=yesterday")
+            self.assertEqual(rv.status_code, 400)
+
+    def test_get_training_status(self):
+        with app.test_client() as c:
+            rv = c.get(f"/projects/1/experiments/{MOCKED_TRAINING_ID}/runs/latest/status")
+            result = rv.get_json()
+            self.assertIn("operators", result)
+            self.assertIn("status", result)
+            self.assertEqual(rv.status_code, 200)
@@ -4,7 +4,7 @@ from unittest import TestCase
 from pytest import raises
 
 from pipelines.utils import to_camel_case, to_snake_case
-from pipelines.controllers.utils import validate_notebook_path
+from pipelines.controllers.utils import parse_quantity, validate_notebook_path, validate_volume
 from werkzeug.exceptions import BadRequest
 
 class TestControllersUtils(TestCase):
@@ -29,4 +29,19 @@ class TestControllersUtils(TestCase):
             validate_notebook_path("foo")
 
             assert "Invalid notebook path. foo" in str(e.value)
-        
\ No newline at end of file
+
+    def test_parse_quantity(self):
+        self.assertAlmostEqual(parse_quantity("500m"), 0.5)
+        self.assertAlmostEqual(parse_quantity("250000000n"), 0.25)
+        self.assertEqual(parse_quantity("2"), 2)
+        self.assertEqual(parse_quantity("2G"), 2e9)
+        self.assertEqual(parse_quantity("128Mi"), 128 * 2**20)
+
+        with raises(ValueError):
+            parse_quantity("foo")
+
+    def test_validate_volume(self):
+        self.assertTrue(validate_volume({}))
+        self.assertTrue(validate_volume({"size": "5Gi", "accessMode": "ReadWriteMany", "storageClass": "nfs"}))
+        self.assertFalse(validate_volume({"size": "foo"}))
+        self.assertFalse(validate_volume({"accessMode": "ReadOnlyMany"}))
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import queue
+from unittest import TestCase, mock
+
+from pipelines.controllers import workflows
+
+RUN_ID = "run"
+OPERATOR_ID = "operator"
+
+
+def build_workflow(phase=None, operator_phase=None, run_id=RUN_ID, generate_name="common-pipeline-"):
+    workflow = {
+        "metadata": {
+            "generateName": generate_name,
+            "labels": {workflows.RUN_ID_LABEL: run_id},
+            "resourceVersion": "1",
+        },
+        "spec": {
+            "templates": [
+                {"name": "common-pipeline", "dag": {"tasks": [{"name": OPERATOR_ID}]}},
+            ],
+        },
+        "status": {},
+    }
+    if phase:
+        workflow["status"]["phase"] = phase
+    if operator_phase:
+        workflow["status"]["nodes"] = {
+            "root": {"displayName": "common-pipeline", "phase": phase},
+            "node": {"displayName": OPERATOR_ID, "phase": operator_phase},
+        }
+    return workflow
+
+
+class TestWorkflows(TestCase):
+
+    def setUp(self):
+        self.patches = [
+            mock.patch.object(workflows, "SUBSCRIBERS", workflows.defaultdict(set)),
+            mock.patch.object(workflows, "WORKFLOWS", {}),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=1)
+        workflows.SUBSCRIBERS[RUN_ID].add(subscriber)
+        return subscriber
+
+    def test_update_workflow_added(self):
+        subscriber = self.subscribe()
+
+        # the nodes are not created yet
+        workflows.update_workflow("ADDED", build_workflow())
+
+        expected = {"runId": RUN_ID, "status": "Pending", "operators": {OPERATOR_ID: "Pending"}}
+        self.assertEqual(workflows.WORKFLOWS[RUN_ID], expected)
+        self.assertEqual(subscriber.get_nowait(), expected)
+
+    def test_update_workflow_modified(self):
+        subscriber = self.subscribe()
+
+        workflows.update_workflow("MODIFIED", build_workflow("Running", "Running"))
+        expected = {"runId": RUN_ID, "status": "Running", "operators": {OPERATOR_ID: "Running"}}
+        self.assertEqual(subscriber.get_nowait(), expected)
+
+        # events that don't change the status are not sent
+        workflows.update_workflow("MODIFIED", build_workflow("Running", "Running"))
+        self.assertTrue(subscriber.empty())
+
+        # slow clients only get the latest status
+        workflows.update_workflow("MODIFIED", build_workflow("Running", "Succeeded"))
+        workflows.update_workflow("MODIFIED", build_workflow("Running", "Failed"))
+        self.assertEqual(subscriber.get_nowait()["operators"], {OPERATOR_ID: "Failed"})
+
+        # runs that are done are forgotten, once their clients got the last status
+        workflows.update_workflow("MODIFIED", build_workflow("Failed", "Failed"))
+        self.assertEqual(subscriber.get_nowait()["status"], "Failed")
+        self.assertNotIn(RUN_ID, workflows.WORKFLOWS)
+
+    def test_update_workflow_deleted(self):
+        workflows.update_workflow("ADDED", build_workflow("Running", "Running"))
+        self.assertIn(RUN_ID, workflows.WORKFLOWS)
+
+        workflows.update_workflow("DELETED", build_workflow("Running", "Running"))
+        self.assertNotIn(RUN_ID, workflows.WORKFLOWS)
+
+    def test_update_workflow_status(self):
+        workflow = build_workflow("Running", "Running")
+        workflow["status"]["nodes"]["terminated"] = {"displayName": "other", "phase": "Failed",
+                                                     "message": "terminated"}
+        workflows.update_workflow("MODIFIED", workflow)
+
+        self.assertEqual(workflows.WORKFLOWS[RUN_ID]["operators"],
+                         {OPERATOR_ID: "Running", "other": "Terminated"})
+
+    def test_update_workflow_ignored(self):
+        # deployments, and workflows that are not KFP runs
+        workflows.update_workflow("ADDED", build_workflow("Running", generate_name="deployment-"))
+        workflows.update_workflow("ADDED", build_workflow("Running", run_id=None))
+
+        self.assertEqual(workflows.WORKFLOWS, {})